@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Read DICOM headers directly from ZIP, TAR and 7Z archive members
+Members are streamed to the extraction workers instead of being unpacked to disk
+"""
+
+import inspect
+import io
+import os
+import queue
+import struct
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from multiprocessing.util import Finalize
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional
+
+try:
+    import py7zr  # type: ignore[import]
+except ImportError:  # 7Z archives then fall back to the external 7z binary
+    py7zr = None
+
+from discover_files import DICOM_SUFFIXES, SNIFF_BYTES, is_dicom_header, is_ignored_name
+
+ARCHIVE_MEMBER_SEPARATOR = "!"
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+SEVEN_ZIP_SUFFIXES = (".7z",)
+
+# True when 7Z members can be read in-process (otherwise the 7z binary unpacks them)
+SEVEN_ZIP_STREAMING = py7zr is not None
+
+# Decoded 7Z members waiting for the extraction workers
+SEVEN_ZIP_QUEUE_SIZE = 256
+
+# Float, Double Float and (7FE0,0010) Pixel Data; headers are cut at the first top-level one
+PIXEL_DATA_TAGS = (0x7FE00008, 0x7FE00009, 0x7FE00010)
+HEADER_READ_CHUNK = 64 * 1024
+
+# Element walking: item and delimiter tags, the undefined length marker and the
+# explicit VRs whose header has a reserved field and a 4-byte length
+TRANSFER_SYNTAX_TAG = 0x00020010
+ITEM_TAG = 0xFFFEE000
+UNDEFINED_LENGTH = 0xFFFFFFFF
+LONG_LENGTH_VRS = frozenset(
+    (b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"SV", b"UC", b"UN", b"UR", b"UT", b"UV")
+)
+IMPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2"
+EXPLICIT_VR_BIG_ENDIAN = "1.2.840.10008.1.2.2"
+# The dataset itself is compressed, so its elements cannot be walked
+DEFLATED_TRANSFER_SYNTAXES = ("1.2.840.10008.1.2.1.99", "1.2.840.10008.1.2.8.1")
+
+# Open ZipFile handles per process, so each archive's central directory is read once;
+# beyond this many the least recently used handle is closed
+ZIP_HANDLE_CACHE_SIZE = 8
+_ZIP_HANDLES: "OrderedDict[str, zipfile.ZipFile]" = OrderedDict()
+_ZIP_HANDLES_LOCK = threading.Lock()
+# Process whose handles _ZIP_HANDLES holds (a forked worker must not share its parent's)
+_zip_handles_pid: Optional[int] = None
+
+
+class ArchiveError(Exception):
+    """Raised when an archive is corrupt or truncated and its members cannot be read."""
+
+
+class ArchiveMember(NamedTuple):
+    """A file inside an archive, addressed as ``archive!member``
+
+    ``data`` holds the header bytes for members of stream-only archives
+    (TAR, 7Z) that workers cannot reopen on their own.
+    """
+    archive_path: Path
+    member_name: str
+    size: int
+    data: Optional[bytes] = None
+
+    @property
+    def name(self) -> str:
+        return PurePosixPath(self.member_name).name
+
+    @property
+    def display_path(self) -> str:
+        return f"{self.archive_path.name}{ARCHIVE_MEMBER_SEPARATOR}{self.member_name}"
+
+    def __str__(self) -> str:
+        return f"{self.archive_path}{ARCHIVE_MEMBER_SEPARATOR}{self.member_name}"
+
+
+def archive_kind(path: Path) -> Optional[str]:
+    """Return ``"zip"``, ``"tar"`` or ``"7z"`` for supported archives, else None."""
+    name = path.name.lower()
+    if name.endswith(ZIP_SUFFIXES):
+        return "zip"
+    if name.endswith(TAR_SUFFIXES):
+        return "tar"
+    if name.endswith(SEVEN_ZIP_SUFFIXES):
+        return "7z"
+    return None
+
+
+def _is_candidate(member_name: str, sniff: bool) -> bool:
+    parts = PurePosixPath(member_name).parts
+    if any(is_ignored_name(part) for part in parts):
+        return False
+    return sniff or member_name.endswith(DICOM_SUFFIXES)
+
+
+def list_zip_members(archive_path: Path, sniff: bool = False) -> List[ArchiveMember]:
+    """List candidate DICOM members of a ZIP archive.
+
+    Only the central directory is read, except with ``sniff``, where the
+    first bytes of every member not named ``*.dcm`` are checked.
+    """
+    members: List[ArchiveMember] = []
+    with zipfile.ZipFile(archive_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not _is_candidate(info.filename, sniff):
+                continue
+            if not info.filename.endswith(DICOM_SUFFIXES):
+                with zf.open(info) as fp:
+                    if not is_dicom_header(fp.read(SNIFF_BYTES)):
+                        continue
+            members.append(ArchiveMember(archive_path, info.filename, info.file_size))
+    return members
+
+
+def _looks_like_vr(data: bytes) -> bool:
+    return len(data) == 2 and data.isalpha() and data.isupper()
+
+
+class PixelDataFinder:
+    """Finds the top-level Pixel Data element in a growing DICOM byte stream
+
+    The element headers are walked from the start (after the preamble and
+    the file meta group, which gives the transfer syntax). Values of defined
+    length are skipped unparsed, and sequences and items of undefined length
+    are entered and left at their delimiters. Pixel Data nested in a
+    sequence (e.g. IconImageSequence) or tag-like bytes inside a value
+    therefore never end the header. ``find`` can be called again as more
+    bytes arrive; it resumes where the previous call stopped.
+    """
+
+    def __init__(self):
+        self._offset: Optional[int] = None
+        self._in_meta = True
+        self._transfer_syntax: Optional[str] = None
+        self._byte_order = "<"
+        # Implicit VR per nesting level; UN values of undefined length hold implicit VR items
+        self._implicit = [False]
+        self._undecodable = False
+
+    def find(self, buffer: bytearray) -> int:
+        """Return the offset of the top-level Pixel Data element, or -1 if not (yet) found."""
+        if self._undecodable:
+            return -1
+        if self._offset is None:
+            if len(buffer) < SNIFF_BYTES:
+                return -1
+            self._offset = SNIFF_BYTES if buffer[128:132] == b"DICM" else 0
+        while True:
+            offset = self._offset
+            if len(buffer) < offset + 8:
+                return -1
+            group, element = struct.unpack_from(self._byte_order + "HH", buffer, offset)
+            if self._in_meta and group != 0x0002:
+                # First dataset element: switch to the transfer syntax of the file meta group
+                self._in_meta = False
+                transfer_syntax = self._transfer_syntax
+                if transfer_syntax in DEFLATED_TRANSFER_SYNTAXES:
+                    self._undecodable = True
+                    return -1
+                if transfer_syntax is None:
+                    implicit = not _looks_like_vr(bytes(buffer[offset + 4:offset + 6]))
+                else:
+                    implicit = transfer_syntax == IMPLICIT_VR_LITTLE_ENDIAN
+                self._implicit = [implicit]
+                self._byte_order = ">" if transfer_syntax == EXPLICIT_VR_BIG_ENDIAN else "<"
+                continue
+
+            tag = group << 16 | element
+            implicit = self._implicit[-1]
+            if group == 0xFFFE:
+                # Items and delimiters have a 4-byte length and no VR in every encoding
+                length = struct.unpack_from(self._byte_order + "L", buffer, offset + 4)[0]
+                if tag == ITEM_TAG:
+                    if length == UNDEFINED_LENGTH:
+                        self._implicit.append(implicit)
+                        length = 0
+                elif len(self._implicit) > 1:
+                    self._implicit.pop()
+                self._offset = offset + 8 + (0 if length == UNDEFINED_LENGTH else length)
+                continue
+            if tag in PIXEL_DATA_TAGS and len(self._implicit) == 1:
+                return offset
+
+            vr = None
+            if implicit:
+                length = struct.unpack_from(self._byte_order + "L", buffer, offset + 4)[0]
+                header = 8
+            else:
+                vr = bytes(buffer[offset + 4:offset + 6])
+                if vr in LONG_LENGTH_VRS:
+                    if len(buffer) < offset + 12:
+                        return -1
+                    length = struct.unpack_from(self._byte_order + "L", buffer, offset + 8)[0]
+                    header = 12
+                else:
+                    length = struct.unpack_from(self._byte_order + "H", buffer, offset + 6)[0]
+                    header = 8
+            if length == UNDEFINED_LENGTH:
+                self._implicit.append(implicit or vr == b"UN")
+                self._offset = offset + header
+                continue
+            if tag == TRANSFER_SYNTAX_TAG:
+                if len(buffer) < offset + header + length:
+                    return -1
+                value = bytes(buffer[offset + header:offset + header + length])
+                self._transfer_syntax = value.rstrip(b"\x00 ").decode("ascii", "replace")
+            self._offset = offset + header + length
+
+
+def read_header_bytes(fileobj: BinaryIO, head: bytes = b"") -> bytes:
+    """Read a DICOM stream (after the already read ``head``) up to the top-level Pixel Data.
+
+    Everything from the Pixel Data element on is left unread; that is all
+    ``dcmread(stop_before_pixels=True)`` needs. Streams whose elements
+    cannot be walked (deflated datasets) are read completely.
+    """
+    buffer = bytearray(head)
+    finder = PixelDataFinder()
+    while True:
+        index = finder.find(buffer)
+        if index >= 0:
+            return bytes(buffer[:index])
+        chunk = fileobj.read(HEADER_READ_CHUNK)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+
+
+def iter_tar_members(archive_path: Path, sniff: bool = False) -> Iterator[ArchiveMember]:
+    """Stream a (possibly compressed) TAR archive and yield members with their header bytes.
+
+    The archive is read once, front to back, in tarfile streaming mode;
+    only the bytes up to each member's pixel data are kept in memory.
+    A corrupt or truncated archive raises ``ArchiveError`` when the bad
+    part is reached, after the members before it were yielded.
+    """
+    try:
+        with tarfile.open(archive_path, mode="r|*") as tf:
+            for info in tf:
+                if not info.isfile() or not _is_candidate(info.name, sniff):
+                    continue
+                fileobj = tf.extractfile(info)
+                if fileobj is None:
+                    continue
+                if not info.name.endswith(DICOM_SUFFIXES):
+                    head = fileobj.read(SNIFF_BYTES)
+                    if not is_dicom_header(head):
+                        continue
+                    data = read_header_bytes(fileobj, head)
+                else:
+                    data = read_header_bytes(fileobj)
+                member_name = info.name[2:] if info.name.startswith("./") else info.name
+                yield ArchiveMember(archive_path, member_name, info.size, data)
+    except (tarfile.TarError, EOFError) as e:
+        raise ArchiveError(f"Cannot read {archive_path.name}: {e}") from e
+
+
+def list_7z_members(archive_path: Path, sniff: bool = False, min_size: int = 1) -> List[ArchiveMember]:
+    """List candidate DICOM members of a 7Z archive from its header.
+
+    Members are filtered by name (as for ZIP/TAR) and by uncompressed size;
+    nothing is decompressed. Requires py7zr.
+    """
+    with py7zr.SevenZipFile(archive_path, mode="r") as archive:
+        return [
+            ArchiveMember(archive_path, info.filename, info.uncompressed)
+            for info in archive.list()
+            if not info.is_directory
+            and info.uncompressed >= min_size
+            and _is_candidate(info.filename, sniff)
+        ]
+
+
+class _ExtractionCancelled(Exception):
+    """Raised inside py7zr writers once the consumer has stopped reading."""
+
+
+class _HeaderWriter:
+    """py7zr writer that keeps a member's bytes up to its top-level Pixel Data element.
+
+    Data after it (see ``PixelDataFinder``) is dropped as it is decompressed,
+    so memory per member stays at the header size. Members not named ``*.dcm`` are
+    rejected after the first 132 bytes unless they look like DICOM.
+    """
+
+    def __init__(self, sink: "_HeaderWriterFactory", filename: str):
+        self.sink = sink
+        self.filename = filename
+        self.buffer = bytearray()
+        self.complete = False
+        self.rejected = False
+        self.published = False
+        self.sniff = not filename.endswith(DICOM_SUFFIXES)
+        self._finder = PixelDataFinder()
+
+    def write(self, data: bytes) -> int:
+        if self.sink.cancelled.is_set():
+            raise _ExtractionCancelled()
+        if self.complete or self.rejected:
+            return len(data)
+        self.buffer += data
+        if self.sniff and len(self.buffer) >= SNIFF_BYTES:
+            self.sniff = False
+            if not is_dicom_header(bytes(self.buffer[:SNIFF_BYTES])):
+                self.rejected = True
+                self.buffer = bytearray()
+                return len(data)
+        index = self._finder.find(self.buffer)
+        if index >= 0:
+            del self.buffer[index:]
+            self.complete = True
+        return len(data)
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return len(self.buffer)
+
+    def close(self) -> None:
+        self.sink.publish(self)
+
+
+class _HeaderWriterFactory:
+    """py7zr writer factory handing finished members to a bounded queue."""
+
+    def __init__(self, archive_path: Path, members: Dict[str, ArchiveMember], out: "queue.Queue"):
+        self.archive_path = archive_path
+        self.members = members
+        self.out = out
+        self.cancelled = threading.Event()
+        self.writers: List[_HeaderWriter] = []
+        self._lock = threading.Lock()
+
+    def create(self, filename: str) -> _HeaderWriter:
+        writer = _HeaderWriter(self, filename)
+        self.writers.append(writer)
+        return writer
+
+    def publish(self, writer: _HeaderWriter) -> None:
+        with self._lock:
+            if writer.published:
+                return
+            writer.published = True
+        if writer.rejected or (writer.sniff and not is_dicom_header(bytes(writer.buffer))):
+            return
+        member = self.members.get(writer.filename)
+        if member is None:
+            member = ArchiveMember(self.archive_path, writer.filename, len(writer.buffer))
+        self._put(member._replace(data=bytes(writer.buffer)))
+
+    def finish(self) -> None:
+        # py7zr releases before the close() hook never publish on their own
+        for writer in self.writers:
+            self.publish(writer)
+
+    def _put(self, item: object) -> None:
+        while not self.cancelled.is_set():
+            try:
+                self.out.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _ExtractionCancelled()
+
+
+def _supports_writer_factory() -> bool:
+    """py7zr gained in-memory writer factories in 0.22."""
+    return "factory" in inspect.signature(py7zr.SevenZipFile.extract).parameters
+
+
+def _extract_7z_to_disk(factory: _HeaderWriterFactory, targets: List[str]) -> None:
+    """Fallback for py7zr releases without writer factories: extract, then read headers."""
+    with tempfile.TemporaryDirectory(prefix="dicom_7z_") as temp_dir:
+        with py7zr.SevenZipFile(factory.archive_path, mode="r") as archive:
+            archive.extract(path=temp_dir, targets=targets)
+        for name in targets:
+            path = Path(temp_dir) / name
+            if not path.is_file():
+                continue
+            writer = factory.create(name)
+            with open(path, "rb") as fp:
+                writer.write(read_header_bytes(fp))
+            writer.close()
+
+
+def iter_7z_members(
+    archive_path: Path,
+    members: List[ArchiveMember],
+    queue_size: int = SEVEN_ZIP_QUEUE_SIZE,
+) -> Iterator[ArchiveMember]:
+    """Decompress the listed 7Z members and yield them with their header bytes.
+
+    Only ``members`` are written out; everything after each member's pixel
+    data is discarded while decompressing. A background thread runs py7zr
+    and hands members over through a queue of ``queue_size`` entries, so
+    decompression pauses while the workers are behind. Solid archives
+    still have to be decompressed in order up to the last listed member.
+    """
+    if not members:
+        return
+    out: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    factory = _HeaderWriterFactory(archive_path, {m.member_name: m for m in members}, out)
+    targets = [member.member_name for member in members]
+    done = object()
+
+    def _run() -> None:
+        error: Optional[BaseException] = None
+        try:
+            if _supports_writer_factory():
+                with py7zr.SevenZipFile(archive_path, mode="r") as archive:
+                    archive.extract(targets=targets, factory=factory)
+            else:
+                _extract_7z_to_disk(factory, targets)
+            factory.finish()
+        except _ExtractionCancelled:
+            return
+        except BaseException as exc:  # handed to the consumer below
+            error = exc
+        try:
+            factory._put((done, error))
+        except _ExtractionCancelled:
+            pass
+
+    thread = threading.Thread(target=_run, name="7z-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = out.get()
+            if isinstance(item, tuple) and item and item[0] is done:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        factory.cancelled.set()
+        thread.join()
+
+
+def close_zip_handles(archive_path: Optional[Path] = None) -> None:
+    """Close this process's cached ZIP handles (only the one of ``archive_path`` if given).
+
+    Pool workers run this when the pool shuts them down; the scan of a ZIP
+    archive runs it for the archive when it ends.
+    """
+    with _ZIP_HANDLES_LOCK:
+        if _zip_handles_pid != os.getpid():
+            return
+        keys = list(_ZIP_HANDLES) if archive_path is None else [str(archive_path)]
+        handles = [_ZIP_HANDLES.pop(key) for key in keys if key in _ZIP_HANDLES]
+    for zf in handles:
+        zf.close()
+
+
+def _cached_zip_handle(archive_path: Path) -> zipfile.ZipFile:
+    """Return an open ZipFile for ``archive_path``; call with ``_ZIP_HANDLES_LOCK`` held."""
+    global _zip_handles_pid
+    if _zip_handles_pid != os.getpid():
+        # Handles inherited through fork belong to the parent, which closes them
+        _ZIP_HANDLES.clear()
+        _zip_handles_pid = os.getpid()
+        Finalize(None, close_zip_handles, exitpriority=10)
+    key = str(archive_path)
+    zf = _ZIP_HANDLES.get(key)
+    if zf is not None:
+        _ZIP_HANDLES.move_to_end(key)
+        return zf
+    zf = zipfile.ZipFile(archive_path)
+    _ZIP_HANDLES[key] = zf
+    while len(_ZIP_HANDLES) > ZIP_HANDLE_CACHE_SIZE:
+        # Members opened from it stay readable; the file closes once they are closed
+        _ZIP_HANDLES.popitem(last=False)[1].close()
+    return zf
+
+
+def open_member(member: ArchiveMember) -> BinaryIO:
+    """Open an archive member for reading (from memory for TAR and 7Z members)."""
+    if member.data is not None:
+        return io.BytesIO(member.data)
+    with _ZIP_HANDLES_LOCK:
+        return _cached_zip_handle(member.archive_path).open(member.member_name)
+
+
+def read_member_head(member: ArchiveMember, size: int = SNIFF_BYTES) -> bytes:
+    """Read the first ``size`` bytes of an archive member (empty on error)."""
+    try:
+        with open_member(member) as fp:
+            return fp.read(size)
+    except Exception:
+        return b""
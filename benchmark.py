@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the DICOM ingest pipeline
+Runs against a directory of DICOM files or a generated synthetic corpus.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import struct
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pydicom  # type: ignore[import]
+from pydicom.dataset import Dataset, FileMetaDataset  # type: ignore[import]
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid  # type: ignore[import]
+
+from discover_files import discover_dicom_files
+from extract_metadata import (
+    CsaHeader,
+    DICOMMetadata,
+    _classify_private_tag,
+    _parse_numeric,
+    _truncate_hex,
+    extract_private_tags,
+    iter_metadata_from_paths,
+    parse_csa_header,
+    private_digest_function,
+    read_source,
+)
+
+# Element names seen in Siemens CSA image/series headers
+CSA_ELEMENT_NAMES = [
+    "EchoLinePosition", "EchoColumnPosition", "EchoPartitionPosition", "UsedChannelMask",
+    "Actual3DImaPartNumber", "ICE_Dims", "B_value", "Filter1", "Filter2", "ProtocolSliceNumber",
+    "RealDwellTime", "PixelFile", "PixelFileName", "SliceMeasurementDuration", "SequenceMask",
+    "AcquisitionMatrixText", "MeasuredFourierLines", "FlowEncodingDirection", "FlowVenc",
+    "PhaseEncodingDirectionPositive", "NumberOfImagesInMosaic", "DiffusionGradientDirection",
+    "ImageGroup", "SliceNormalVector", "DiffusionDirectionality", "TimeAfterStart",
+    "FlipAngle", "SequenceName", "RepetitionTime", "EchoTime", "NumberOfAverages",
+    "VoxelThickness", "VoxelPhaseFOV", "VoxelReadoutFOV", "VoxelPositionSag",
+    "VoxelPositionCor", "VoxelPositionTra", "VoxelNormalSag", "VoxelNormalCor",
+    "VoxelNormalTra", "VoxelInPlaneRot", "ImagePositionPatient", "ImageOrientationPatient",
+    "PixelSpacing", "SliceLocation", "SliceThickness", "SpectrumTextRegionLabel",
+    "Comp_Algorithm", "Comp_Blended", "Comp_ManualAdjusted", "Comp_AutoParam",
+    "Comp_AdjustedParam", "Comp_JobID", "FMRIStimulInfo", "FlowEncodingDirectionString",
+    "RepetitionTimeEffective", "CsiImagePositionPatient", "CsiImageOrientationPatient",
+    "CsiPixelSpacing", "CsiSliceLocation", "CsiSliceThickness", "OriginalSeriesNumber",
+    "OriginalImageNumber", "ImaAbsTablePosition", "NonPlanarImage", "MoCoQMeasure",
+    "LQAlgorithm", "SlicePosition_PCS", "RBMoCoTrans", "RBMoCoRot", "MultistepIndex",
+    "ImaRelTablePosition", "ImaCoilString", "RFSWDDataType", "GSWDDataType", "NormalizeManipulated",
+    "ImaPATModeText", "B_matrix", "BandwidthPerPixelPhaseEncode", "FMRIStimulLevel",
+    "MosaicRefAcqTimes", "AutoInlineImageFilterEnabled", "QCData", "ExamLandmarks",
+    "ExamDataRole", "MRDiffusion", "RealWorldValueMapping", "DataSetInfo", "UsedChannelString",
+    "PhaseContrastN4", "MRVelocityEncoding", "VelocityEncodingDirectionN4", "ImageType4MF",
+    "ImageHistory", "SequenceInfo", "ImageTypeVisible", "DistortionCorrectionType", "ImageFilter",
+]
+CSA_VRS = [b"DS", b"IS", b"US", b"UL", b"SL", b"FD", b"CS", b"LO", b"SH", b"ST", b"UT"]
+
+
+def _write_dataset(path: Path, ds: Dataset) -> None:
+    try:
+        pydicom.dcmwrite(path, ds, enforce_file_format=True)
+    except TypeError:
+        # pydicom < 3.0 takes the encoding from the dataset itself
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+        pydicom.dcmwrite(path, ds, write_like_original=False)
+
+
+def write_synthetic_series(
+    root: Path,
+    file_count: int,
+    files_per_series: int = 100,
+) -> List[Path]:
+    """Write small CT-like DICOM files (no pixel payload to speak of) under ``root``."""
+    root.mkdir(parents=True, exist_ok=True)
+    study_uid = generate_uid()
+    series_uid = generate_uid()
+    paths: List[Path] = []
+    for index in range(file_count):
+        if index % files_per_series == 0:
+            series_uid = generate_uid()
+        sop_uid = generate_uid()
+        ds = Dataset()
+        ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        ds.SOPInstanceUID = sop_uid
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.PatientID = "BENCH"
+        ds.PatientName = "Bench^Mark"
+        ds.Modality = "CT"
+        ds.Manufacturer = "SIEMENS"
+        ds.StudyDate = "20240101"
+        ds.SeriesNumber = index // files_per_series + 1
+        ds.InstanceNumber = index % files_per_series + 1
+        ds.SliceThickness = "1.0"
+        ds.KVP = "120"
+        ds.Rows = 2
+        ds.Columns = 2
+        ds.BitsAllocated = 16
+        ds.PixelData = b"\x00" * 8
+
+        file_meta = FileMetaDataset()
+        file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+        file_meta.MediaStorageSOPInstanceUID = sop_uid
+        file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta = file_meta
+        ds.preamble = b"\x00" * 128
+
+        path = root / f"IM{index:06d}.dcm"
+        _write_dataset(path, ds)
+        paths.append(path)
+    return paths
+
+
+def write_siemens_series(root: Path, file_count: int, seed: int = 0) -> List[Path]:
+    """Write MR-like Siemens files carrying CSA headers and other private blocks."""
+    root.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    study_uid = generate_uid()
+    series_uid = generate_uid()
+    image_csa = build_csa_header(rng, fmt="CSA2", element_count=100, siemens_items=True)
+    series_csa = build_csa_header(rng, fmt="CSA2", element_count=110, siemens_items=True)
+    paths: List[Path] = []
+    for index in range(file_count):
+        sop_uid = generate_uid()
+        ds = Dataset()
+        ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+        ds.SOPInstanceUID = sop_uid
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.PatientID = "BENCH"
+        ds.Modality = "MR"
+        ds.Manufacturer = "SIEMENS"
+        ds.InstanceNumber = index + 1
+
+        info = ds.private_block(0x0019, "SIEMENS MR HEADER", create=True)
+        for offset in range(0x08, 0x30):
+            if offset % 3:
+                info.add_new(offset, "DS", f"{rng.uniform(-100, 100):.6f}")
+            else:
+                info.add_new(offset, "OB", rng.randbytes(rng.choice((16, 64, 256))))
+        csa = ds.private_block(0x0029, "SIEMENS CSA HEADER", create=True)
+        csa.add_new(0x08, "CS", "IMAGE NUM 4")
+        csa.add_new(0x10, "OB", image_csa[:-rng.randint(1, 64) * 4])
+        csa.add_new(0x18, "CS", "MR")
+        csa.add_new(0x20, "OB", series_csa)
+        medcom = ds.private_block(0x0029, "SIEMENS MEDCOM HEADER2", create=True)
+        medcom.add_new(0x60, "LO", "com")
+
+        file_meta = FileMetaDataset()
+        file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+        file_meta.MediaStorageSOPInstanceUID = sop_uid
+        file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta = file_meta
+        ds.preamble = b"\x00" * 128
+
+        path = root / f"MR{index:06d}.dcm"
+        _write_dataset(path, ds)
+        paths.append(path)
+    return paths
+
+
+def _legacy_read_uint32(data: memoryview, offset: int) -> Optional[int]:
+    if offset + 4 > len(data):
+        return None
+    return struct.unpack_from("<I", data, offset)[0]
+
+
+def _legacy_read_csa_string(data: memoryview, offset: int, length: int) -> str:
+    if offset + length > len(data):
+        return ""
+    raw = bytes(data[offset:offset + length])
+    raw = raw.split(b"\x00", 1)[0]
+    return raw.decode("latin-1", errors="ignore").strip()
+
+
+def _legacy_align_4(offset: int) -> int:
+    return (offset + 3) & ~3
+
+
+def legacy_parse_csa_header(raw: bytes) -> Optional[Dict[str, Any]]:
+    """The original CSA parser, kept as the reference for ``parse_csa_header``."""
+    if not raw:
+        return None
+    data = memoryview(raw)
+    fmt = "CSA1"
+    offset = 0
+    if raw.startswith(b"SV10"):
+        fmt = "CSA2"
+        offset = 8
+        num_elements = _legacy_read_uint32(data, offset)
+        offset = 16
+    else:
+        num_elements = _legacy_read_uint32(data, 0)
+        offset = 8
+        if num_elements is None or num_elements > 10000:
+            num_elements = _legacy_read_uint32(data, 4)
+            offset = 8
+
+    if num_elements is None or num_elements <= 0:
+        return None
+
+    max_elements = min(num_elements, 2048)
+    elements: Dict[str, Any] = {}
+
+    for _ in range(max_elements):
+        if offset + 84 > len(data):
+            break
+        name = _legacy_read_csa_string(data, offset, 64)
+        offset += 64
+        vm = _legacy_read_uint32(data, offset)
+        offset += 4
+        vr = _legacy_read_csa_string(data, offset, 4)
+        offset += 4
+        _syngo_dt = _legacy_read_uint32(data, offset)
+        offset += 4
+        nitems = _legacy_read_uint32(data, offset)
+        offset += 4
+        _unknown = _legacy_read_uint32(data, offset)
+        offset += 4
+
+        if nitems is None or nitems < 0:
+            break
+
+        values: List[str] = []
+        for _ in range(min(nitems, 512)):
+            if offset + 8 > len(data):
+                break
+            item_length = _legacy_read_uint32(data, offset)
+            offset += 4
+            _item_delim = _legacy_read_uint32(data, offset)
+            offset += 4
+            if item_length is None or item_length < 0:
+                break
+            if offset + item_length > len(data):
+                break
+            if item_length > 0:
+                raw_value = bytes(data[offset:offset + item_length])
+                decoded = raw_value.split(b"\x00", 1)[0].decode("latin-1", errors="ignore").strip()
+                if decoded:
+                    values.append(decoded)
+            offset += item_length
+            offset = _legacy_align_4(offset)
+
+        if name:
+            elements[name] = {
+                "vr": vr or None,
+                "vm": vm,
+                "values": values
+            }
+
+    if not elements:
+        return None
+
+    return {
+        "format": fmt,
+        "element_count": len(elements),
+        "elements": elements
+    }
+
+
+def _legacy_is_printable_ascii(raw: bytes, min_ratio: float = 0.90) -> bool:
+    if not raw:
+        return False
+    head = raw.split(b"\x00", 1)[0]
+    if not head:
+        return False
+    printable = 0
+    for b in head:
+        if b in (9, 10, 13) or (32 <= b <= 126):
+            printable += 1
+    return printable / len(head) >= min_ratio
+
+
+def _legacy_decode_private_value(elem: pydicom.DataElement) -> Dict[str, Any]:
+    value_text = None
+    value_num = None
+    value_hex = None
+    byte_len = None
+    value = elem.value
+    if isinstance(value, (bytes, bytearray)):
+        raw = bytes(value)
+        byte_len = len(raw)
+        value_hash = hashlib.sha256(raw).hexdigest()
+        if raw and _legacy_is_printable_ascii(raw):
+            decoded = raw.split(b"\x00", 1)[0].decode("latin-1", errors="ignore").strip()
+            if decoded:
+                value_text = decoded
+                value_num = _parse_numeric(decoded)
+        else:
+            value_hex = _truncate_hex(raw)
+    elif isinstance(value, (list, tuple)):
+        text_items = [str(v) for v in value if v is not None]
+        if text_items:
+            value_text = ", ".join(text_items)
+        if len(value) == 1:
+            value_num = _parse_numeric(str(value[0]))
+        value_hash = hashlib.sha256((value_text or "").encode("utf-8")).hexdigest()
+    else:
+        if value is not None:
+            value_text = str(value).strip()
+            if value_text:
+                value_num = _parse_numeric(value_text)
+        value_hash = hashlib.sha256((value_text or "").encode("utf-8")).hexdigest()
+    return {
+        "value_text": value_text,
+        "value_num": value_num,
+        "value_json": None,
+        "value_hex": value_hex,
+        "byte_len": byte_len,
+        "value_hash": value_hash,
+    }
+
+
+def legacy_extract_private_tags(ds: Dataset, metadata: DICOMMetadata) -> List[Dict[str, Any]]:
+    """The original two-pass private tag walk, kept as the reference for ``extract_private_tags``."""
+    creators: Dict[int, Dict[int, str]] = {}
+    for elem in ds.iterall():
+        if not elem.tag.is_private_creator:
+            continue
+        creator = str(elem.value).strip() if elem.value is not None else ""
+        if creator:
+            creators.setdefault(elem.tag.group, {})[elem.tag.element] = creator
+    results: List[Dict[str, Any]] = []
+    for elem in ds.iterall():
+        if not elem.tag.is_private or elem.tag.is_private_creator or elem.tag.element < 0x1000:
+            continue
+        group = elem.tag.group
+        creator = creators.get(group, {}).get((elem.tag.element >> 8) & 0xFF, "Unknown")
+        decoded = _legacy_decode_private_value(elem)
+        results.append({
+            "group_hex": f"{group:04X}",
+            "element_hex": f"{elem.tag.element:04X}",
+            "creator": creator,
+            "vr": elem.VR,
+            "value_text": decoded["value_text"],
+            "value_num": decoded["value_num"],
+            "value_json": decoded["value_json"],
+            "value_hex": decoded["value_hex"],
+            "byte_len": decoded["byte_len"],
+            "value_hash": decoded["value_hash"],
+            "classification": _classify_private_tag(creator, metadata.manufacturer, metadata.modality, decoded),
+            "sop_instance_uid": metadata.sop_instance_uid,
+        })
+    return results
+
+
+def _csa_item(rng: random.Random) -> bytes:
+    kind = rng.random()
+    if kind < 0.5:
+        return f"{rng.uniform(-500, 500):.8f}".encode("ascii")
+    if kind < 0.8:
+        return str(rng.randint(0, 100000)).encode("ascii")
+    return bytes(rng.choice(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ_ 0123456789") for _ in range(rng.randint(1, 48)))
+
+
+def build_csa_header(rng: random.Random, fmt: str, element_count: int, siemens_items: bool) -> bytes:
+    """Build a synthetic CSA1/CSA2 header.
+
+    ``siemens_items`` writes the four-word item headers Siemens uses;
+    otherwise items carry the two-word headers ``parse_csa_header`` reads,
+    so both layouts (and the decoding paths they take) are covered.
+    """
+    out = bytearray()
+    if fmt == "CSA2":
+        out += b"SV10" + b"\x04\x03\x02\x01" + struct.pack("<II", element_count, 77)
+    else:
+        out += struct.pack("<II", element_count, 77)
+    for _ in range(element_count):
+        name = rng.choice(CSA_ELEMENT_NAMES).encode("ascii")
+        nitems = rng.choice((0, 1, 1, 1, 3, 6, 16))
+        vm = rng.randint(0, nitems or 1)
+        vr = rng.choice(CSA_VRS)
+        out += struct.pack("<64sI4sIII", name, vm, vr, rng.randint(0, 20), nitems, 77)
+        for _ in range(nitems):
+            value = _csa_item(rng) + b"\x00" if rng.random() < 0.7 else b""
+            if siemens_items:
+                out += struct.pack("<IIII", len(value), len(value), 77, len(value))
+            else:
+                out += struct.pack("<II", len(value), 77)
+            out += value + b"\x00" * (-len(value) % 4)
+    return bytes(out)
+
+
+def write_csa_corpus(count: int, seed: int = 0) -> List[bytes]:
+    """Synthetic CSA1/CSA2 image and series headers, plus some truncated ones."""
+    rng = random.Random(seed)
+    corpus: List[bytes] = []
+    for index in range(count):
+        raw = build_csa_header(
+            rng,
+            fmt="CSA2" if index % 2 else "CSA1",
+            element_count=rng.choice((60, 100, 110)),
+            siemens_items=index % 4 < 2,
+        )
+        if index % 10 == 9:
+            raw = raw[:rng.randint(0, len(raw))]
+        corpus.append(raw)
+    return corpus
+
+
+def bench_csa(count: int, repeat: int) -> None:
+    """Compare the CSA parser with the legacy one, checking identical output."""
+    corpus = write_csa_corpus(count)
+    total_mb = sum(len(raw) for raw in corpus) / (1024 * 1024)
+    mismatches = sum(
+        1 for raw in corpus
+        if not (legacy_parse_csa_header(raw) == parse_csa_header(raw) == CsaHeader(raw).to_dict())
+    )
+    print(f"Parsing {len(corpus)} synthetic CSA header(s) ({total_mb:.1f} MB), best of {repeat}")
+    if mismatches:
+        print(f"   ✗ {mismatches} header(s) decoded differently from the legacy parser")
+    else:
+        print(f"   ✓ Output identical to the legacy parser")
+
+    def _best(parse) -> float:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for raw in corpus:
+                parse(raw)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    legacy = _best(legacy_parse_csa_header)
+    fast = _best(parse_csa_header)
+    lazy = _best(lambda raw: CsaHeader(raw).get("ImaAbsTablePosition"))
+    print(f"   legacy parser:      {legacy:.3f}s ({len(corpus) / legacy:.0f} headers/s)")
+    print(f"   parse_csa_header:   {fast:.3f}s ({len(corpus) / fast:.0f} headers/s, {legacy / fast:.2f}x)")
+    print(f"   lazy single lookup: {lazy:.3f}s ({len(corpus) / lazy:.0f} headers/s, {legacy / lazy:.2f}x)")
+
+
+def bench_private_tags(paths: List[Path], repeat: int) -> None:
+    """Compare the private tag walk with the legacy two-pass one, checking identical output."""
+    metadata = DICOMMetadata(manufacturer="SIEMENS", modality="MR")
+
+    def _read(path: Path) -> Dataset:
+        # Same retry as a --sniff ingest: datasets without preamble are read with force=True
+        return read_source(
+            path, lambda fp, force: pydicom.dcmread(fp, stop_before_pixels=True, force=force), raw_datasets=True
+        )
+
+    readable = []
+    for path in paths:
+        try:
+            _read(path)
+        except Exception:
+            continue
+        readable.append(path)
+    if len(readable) < len(paths):
+        print(f"   ⚠ Skipping {len(paths) - len(readable)} file(s) that could not be read as DICOM")
+    paths = readable
+
+    def _datasets() -> List[Dataset]:
+        return [_read(path) for path in paths]
+
+    mismatches = sum(
+        1 for legacy_ds, ds in zip(_datasets(), _datasets())
+        if legacy_extract_private_tags(legacy_ds, metadata) != extract_private_tags(ds, metadata)
+    )
+    tag_count = sum(len(extract_private_tags(ds, metadata)) for ds in _datasets())
+    print(f"Walking private tags of {len(paths)} file(s) ({tag_count} tag(s)), best of {repeat}")
+    if mismatches:
+        print(f"   ✗ {mismatches} file(s) decoded differently from the legacy walk")
+    else:
+        print(f"   ✓ Output identical to the legacy walk")
+
+    def _best(walk) -> float:
+        timings = []
+        for _ in range(repeat):
+            # Parse outside the timed region; the walk converts raw elements
+            datasets = _datasets()
+            start = time.perf_counter()
+            for ds in datasets:
+                walk(ds)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    blake2b = private_digest_function("blake2b")
+    legacy = _best(lambda ds: legacy_extract_private_tags(ds, metadata))
+    sha256 = _best(lambda ds: extract_private_tags(ds, metadata))
+    fast = _best(lambda ds: extract_private_tags(ds, metadata, digest=blake2b))
+    print(f"   legacy walk:          {legacy:.3f}s ({len(paths) / legacy:.0f} files/s)")
+    print(f"   single pass, sha256:  {sha256:.3f}s ({len(paths) / sha256:.0f} files/s, {legacy / sha256:.2f}x)")
+    print(f"   single pass, blake2b: {fast:.3f}s ({len(paths) / fast:.0f} files/s, {legacy / fast:.2f}x)")
+
+
+def _time_extraction(paths: List[Path], max_workers: int, batch_size: Optional[int]) -> float:
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_metadata_from_paths(paths, max_workers=max_workers, batch_size=batch_size))
+    elapsed = time.perf_counter() - start
+    if count != len(paths):
+        print(f"   ⚠ Only {count}/{len(paths)} files extracted")
+    return elapsed
+
+
+def bench_batching(paths: List[Path], max_workers: int, repeat: int) -> None:
+    """Compare one task per file against adaptive batching."""
+    print(f"Extracting {len(paths)} file(s) with {max_workers} worker(s), best of {repeat}")
+    per_file = min(_time_extraction(paths, max_workers, batch_size=1) for _ in range(repeat))
+    batched = min(_time_extraction(paths, max_workers, batch_size=None) for _ in range(repeat))
+    print(f"   one task per file: {per_file:.2f}s ({len(paths) / per_file:.0f} files/s)")
+    print(f"   adaptive batches:  {batched:.2f}s ({len(paths) / batched:.0f} files/s)")
+    print(f"   speedup: {per_file / batched:.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark parts of the DICOM ingest pipeline.")
+    parser.add_argument(
+        "benchmark",
+        choices=["batching", "csa", "private-tags"],
+        help="Benchmark to run.",
+    )
+    parser.add_argument(
+        "--directory",
+        type=Path,
+        default=None,
+        help="Directory of DICOM files to use instead of a synthetic corpus.",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=2000,
+        help="Number of synthetic files or headers to generate (default: 2000).",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=min(8, os.cpu_count() or 4),
+        help="Worker processes for extraction benchmarks.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timed runs per variant (best is reported).",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "csa":
+        bench_csa(args.files, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="dicom_bench_") as temp_dir:
+        if args.directory:
+            paths = [record.path for record in discover_dicom_files(args.directory)]
+        elif args.benchmark == "private-tags":
+            paths = write_siemens_series(Path(temp_dir), args.files)
+        else:
+            paths = write_synthetic_series(Path(temp_dir), args.files)
+
+        if args.benchmark == "batching":
+            bench_batching(paths, args.max_workers, args.repeat)
+        elif args.benchmark == "private-tags":
+            bench_private_tags(paths, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Single-pass file discovery for DICOM directory trees
+Walks the tree once with os.scandir, fanning subtrees out to a thread pool
+"""
+
+import hashlib
+import os
+import struct
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+DICOM_SUFFIXES = (".dcm",)
+
+# Part 10 files: 128-byte preamble followed by the "DICM" magic
+DICOM_PREAMBLE_LENGTH = 128
+DICOM_MAGIC = b"DICM"
+SNIFF_BYTES = DICOM_PREAMBLE_LENGTH + len(DICOM_MAGIC)
+SNIFF_BATCH_SIZE = 256
+
+# Bytes hashed from each end of a file to fingerprint same-size candidates
+PARTIAL_HASH_BYTES = 4096
+# Read size while hashing whole files to confirm equal fingerprints
+FULL_HASH_CHUNK = 1024 * 1024
+
+# Groups a dataset without preamble plausibly starts with (file meta, identifying)
+_RAW_START_GROUPS = (0x0002, 0x0008)
+_EXPLICIT_VRS = frozenset(
+    vr.encode("ascii") for vr in (
+        "AE", "AS", "AT", "CS", "DA", "DS", "DT", "FL", "FD", "IS", "LO", "LT",
+        "OB", "OD", "OF", "OL", "OV", "OW", "PN", "SH", "SL", "SQ", "SS", "ST",
+        "SV", "TM", "UC", "UI", "UL", "UN", "UR", "US", "UT", "UV",
+    )
+)
+_TAG_HEADER = struct.Struct("<HHI")
+
+
+class FileRecord(NamedTuple):
+    """A discovered file together with the stat data gathered during the walk"""
+    path: Path
+    size: int
+    mtime: float
+    mtime_ns: int = 0
+    inode: int = 0
+
+
+def is_ignored_name(name: str) -> bool:
+    """Return True for macOS metadata entries that never hold DICOM data."""
+    return name.startswith("._") or name == "__MACOSX"
+
+
+def is_dicom_header(head: bytes) -> bool:
+    """Return True if the leading bytes of a file look like DICOM.
+
+    Checks for the Part 10 preamble + ``DICM`` magic first. Files written
+    without a preamble (raw implicit or explicit VR little endian datasets)
+    are accepted when the first element is a group 0002/0008 tag with a
+    valid VR or a plausible even value length.
+    """
+    if head[DICOM_PREAMBLE_LENGTH:SNIFF_BYTES] == DICOM_MAGIC:
+        return True
+    return is_raw_dataset_header(head)
+
+
+def is_raw_dataset_header(head: bytes) -> bool:
+    """Heuristic for little endian datasets stored without preamble."""
+    if len(head) < _TAG_HEADER.size:
+        return False
+    group, element, length = _TAG_HEADER.unpack_from(head, 0)
+    if group not in _RAW_START_GROUPS or element > 0x00FF:
+        return False
+    if head[4:6] in _EXPLICIT_VRS:
+        return True
+    return length % 2 == 0 and length < 0x10000
+
+
+def read_file_head(path: Path, size: int = SNIFF_BYTES) -> bytes:
+    """Read the first ``size`` bytes of a file (empty on error)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return b""
+    try:
+        return os.read(fd, size)
+    except OSError:
+        return b""
+    finally:
+        os.close(fd)
+
+
+def _sniff_batch(records: List[FileRecord]) -> List[bool]:
+    return [
+        record.size >= _TAG_HEADER.size and is_dicom_header(read_file_head(record.path))
+        for record in records
+    ]
+
+
+def sniff_dicom_files(
+    records: List[FileRecord],
+    max_workers: Optional[int] = None,
+    batch_size: int = SNIFF_BATCH_SIZE,
+) -> List[FileRecord]:
+    """Keep only records whose content looks like DICOM.
+
+    Files are sniffed in batches on a thread pool; each check is a single
+    132-byte read, which is far cheaper than letting ``pydicom.dcmread``
+    fail on non-DICOM files. Input order is preserved.
+    """
+    if not records:
+        return []
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    workers = max_workers or min(32, (os.cpu_count() or 4) * 4, len(batches))
+    kept: List[FileRecord] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch, flags in zip(batches, executor.map(_sniff_batch, batches)):
+            kept.extend(record for record, is_dicom in zip(batch, flags) if is_dicom)
+    return kept
+
+
+def partial_content_hash(path: Path, size: int, span: int = PARTIAL_HASH_BYTES) -> Optional[bytes]:
+    """Hash the first and last ``span`` bytes of a file (None on error).
+
+    Files up to ``2 * span`` bytes are hashed whole. Equal fingerprints of
+    larger files only make them duplicate candidates: the identifying
+    elements can sit past the head (e.g. behind a large private block)
+    while the pixel data at the tail matches.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        if size <= 2 * span:
+            data = os.read(fd, size)
+        else:
+            data = os.read(fd, span) + os.pread(fd, span, size - span)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def full_content_hash(path: Path) -> Optional[bytes]:
+    """Hash a whole file in ``FULL_HASH_CHUNK`` reads (None on error)."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(FULL_HASH_CHUNK), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def _hash_batch(records: List[FileRecord], full: bool) -> List[Optional[bytes]]:
+    if full:
+        return [full_content_hash(record.path) for record in records]
+    return [partial_content_hash(record.path, record.size) for record in records]
+
+
+def _hash_records(
+    records: List[FileRecord],
+    full: bool,
+    max_workers: Optional[int],
+    batch_size: int,
+) -> Iterator[Tuple[FileRecord, Optional[bytes]]]:
+    """Hash records in batches on a thread pool (like sniffing), in input order."""
+    if not records:
+        return
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    workers = max_workers or min(32, (os.cpu_count() or 4) * 4, len(batches))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch, digests in zip(batches, executor.map(lambda b: _hash_batch(b, full), batches)):
+            yield from zip(batch, digests)
+
+
+def drop_duplicate_files(
+    records: List[FileRecord],
+    max_workers: Optional[int] = None,
+    batch_size: int = SNIFF_BATCH_SIZE,
+) -> Tuple[List[FileRecord], int]:
+    """Keep one file per group of identical copies.
+
+    Files are grouped by size first; only sizes shared by several files are
+    fingerprinted with ``partial_content_hash``, and only files sharing a
+    fingerprint are read whole to confirm it with ``full_content_hash``
+    (small files were already hashed whole). Of each group of identical
+    files the one with the smallest path is kept, so repeated runs keep the
+    same copy. Unreadable files are always kept. Input order is preserved.
+
+    Returns:
+        tuple: (kept_records, duplicate_count)
+    """
+    by_size: Dict[int, List[FileRecord]] = {}
+    for record in records:
+        by_size.setdefault(record.size, []).append(record)
+    candidates = [record for group in by_size.values() if len(group) > 1 for record in group]
+    if not candidates:
+        return records, 0
+
+    by_fingerprint: Dict[Tuple[int, bytes], List[FileRecord]] = {}
+    for record, digest in _hash_records(candidates, False, max_workers, batch_size):
+        if digest is not None:
+            by_fingerprint.setdefault((record.size, digest), []).append(record)
+    unconfirmed = [
+        record
+        for (size, _), group in by_fingerprint.items()
+        if len(group) > 1 and size > 2 * PARTIAL_HASH_BYTES
+        for record in group
+    ]
+    full_digests = {
+        record.path: digest
+        for record, digest in _hash_records(unconfirmed, True, max_workers, batch_size)
+    }
+
+    duplicates = set()
+    for (size, digest), group in by_fingerprint.items():
+        if len(group) < 2:
+            continue
+        copies: Dict[bytes, List[FileRecord]] = {}
+        for record in group:
+            content = digest if size <= 2 * PARTIAL_HASH_BYTES else full_digests.get(record.path)
+            if content is not None:
+                copies.setdefault(content, []).append(record)
+        for same in copies.values():
+            kept_path = min((record.path for record in same), key=str)
+            duplicates.update(record.path for record in same if record.path != kept_path)
+
+    kept = [record for record in records if record.path not in duplicates]
+    return kept, len(records) - len(kept)
+
+
+def _scan_directory(
+    directory: str,
+    suffixes: Optional[Tuple[str, ...]],
+) -> Tuple[List[FileRecord], List[str]]:
+    """List one directory level, returning matching files and subdirectories."""
+    files: List[FileRecord] = []
+    subdirs: List[str] = []
+    try:
+        iterator = os.scandir(directory)
+    except OSError:
+        return files, subdirs
+
+    with iterator:
+        for entry in iterator:
+            name = entry.name
+            if is_ignored_name(name):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if suffixes and not name.endswith(suffixes):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append(FileRecord(Path(entry.path), stat.st_size, stat.st_mtime, stat.st_mtime_ns, stat.st_ino))
+    return files, subdirs
+
+
+def discover_files(
+    root: Path,
+    suffixes: Optional[Tuple[str, ...]] = DICOM_SUFFIXES,
+    max_workers: Optional[int] = None,
+) -> Iterator[FileRecord]:
+    """Walk ``root`` once and yield a record for every matching file.
+
+    Each directory is listed by a single ``os.scandir`` call; subdirectories
+    are submitted to a thread pool as soon as they are found, so listing
+    latency on network storage overlaps across subtrees. Symlinked
+    directories are not followed and macOS metadata entries are skipped.
+
+    Args:
+        root: Directory to walk
+        suffixes: File name suffixes to keep (``None`` keeps every file)
+        max_workers: Number of listing threads (defaults to 4x CPU count, max 32)
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return
+
+    workers = max_workers or min(32, (os.cpu_count() or 4) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scan_directory, str(root), suffixes)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for subdir in subdirs:
+                    pending.add(executor.submit(_scan_directory, subdir, suffixes))
+                yield from files
+
+
+def discover_dicom_files(
+    root: Path,
+    sniff: bool = False,
+    max_workers: Optional[int] = None,
+) -> List[FileRecord]:
+    """Discover DICOM files under ``root``.
+
+    By default only ``*.dcm`` files are returned. With ``sniff`` every file is
+    considered: ``*.dcm`` files are kept as before and all others are kept
+    only if their first bytes look like DICOM.
+    """
+    if not sniff:
+        return list(discover_files(root, max_workers=max_workers))
+
+    named: List[FileRecord] = []
+    candidates: List[FileRecord] = []
+    for record in discover_files(root, suffixes=None, max_workers=max_workers):
+        if record.path.name.endswith(DICOM_SUFFIXES):
+            named.append(record)
+        else:
+            candidates.append(record)
+    return named + sniff_dicom_files(candidates, max_workers=max_workers)
+
+
+def group_by_top_level(
+    root: Path,
+    records: List[FileRecord],
+) -> Tuple[List[FileRecord], Dict[str, List[FileRecord]]]:
+    """Split records into files directly under ``root`` and per-subdirectory lists."""
+    root_files: List[FileRecord] = []
+    groups: Dict[str, List[FileRecord]] = {}
+    for record in records:
+        parts = record.path.relative_to(root).parts
+        if len(parts) == 1:
+            root_files.append(record)
+        else:
+            groups.setdefault(parts[0], []).append(record)
+    return root_files, groups
@@ -5,17 +5,108 @@ Extracts all important medical and manufacturer metadata from DICOM files.
 """
 
 import argparse
+import base64
 import hashlib
+import itertools
 import json
+import os
 import sys
 import time
 import struct
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from dataclasses import asdict, dataclass, field
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field, fields
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import pydicom  # type: ignore[import]
+from pydicom.datadict import dictionary_VR  # type: ignore[import]
+from pydicom.dataelem import RawDataElement  # type: ignore[import]
+from pydicom.errors import InvalidDicomError  # type: ignore[import]
+from pydicom.filereader import read_deferred_data_element, read_partial  # type: ignore[import]
+from pydicom.tag import Tag  # type: ignore[import]
+
+from archive_members import ArchiveMember, open_member, read_member_head
+from discover_files import discover_dicom_files, is_raw_dataset_header, read_file_head
+from profiling import DEFAULT_PROFILE_PREFIX, ProfileSession
+
+# Anything the extraction workers can read: a file on disk or an archive member
+DicomSource = Union[Path, ArchiveMember]
+
+# Tags read by the cheap UID probe; (0020,000E) is the last of them in file order.
+# read_partial compares tag numbers, so keywords would match nothing.
+UID_PROBE_TAGS = [
+    0x00080018,  # SOPInstanceUID
+    0x0020000D,  # StudyInstanceUID
+    0x0020000E,  # SeriesInstanceUID
+]
+_SERIES_UID_TAG = 0x0020000E
+
+# Conservative size of one in-flight result (dataclass plus private tag dicts),
+# used to turn a memory ceiling into a bound on queued extraction tasks
+ESTIMATED_RESULT_BYTES = 256 * 1024
+
+# Adaptive batching: aim for worker round trips of about this long
+TARGET_BATCH_SECONDS = 0.25
+INITIAL_BATCH_SIZE = 4
+MAX_BATCH_SIZE = 256
+
+# Online concurrency control: throughput is compared across windows of this length
+CONTROLLER_WINDOW_SECONDS = 2.0
+CONTROLLER_TOLERANCE = 0.05
+
+# Bounded header reads: deferred private values read per file, CSA headers first
+DEFAULT_PRIVATE_VALUE_BUDGET = 1024 * 1024
+CSA_HEADER_TAGS = (0x00291010, 0x00291020)
+# Raw CSA headers are stored zlib-compressed; favour speed on the ingest path
+CSA_COMPRESSION_LEVEL = 1
+
+# Digests for private tag value_hash / private_payload_fingerprint. Hashes are
+# compared across series, so keep one digest per database.
+PRIVATE_DIGESTS = ("sha256", "blake2b")
+DEFAULT_PRIVATE_DIGEST = "sha256"
+BLAKE2B_DIGEST_SIZE = 16
+
+# Extraction profiles, cheapest first; a row extracted with a profile can be
+# upgraded by re-ingesting with any profile ranked after it
+EXTRACTION_PROFILES = ("core", "nuclear-medicine", "full-private")
+DEFAULT_EXTRACTION_PROFILE = "full-private"
+# The core profile only needs groups up to (0020,xxxx); parsing stops after them
+_LAST_CORE_TAG = 0x0020FFFF
+
+
+def profile_rank(profile: Optional[str]) -> int:
+    """Position of ``profile`` in EXTRACTION_PROFILES.
+
+    Rows stored before profiles existed (``None``) were fully extracted.
+    """
+    return EXTRACTION_PROFILES.index(profile or DEFAULT_EXTRACTION_PROFILE)
+
+
+class ReadOptions(NamedTuple):
+    """How much of each header the extraction workers read and decode
+
+    ``profile`` selects the extracted columns: ``core`` (patient, study,
+    series and device columns), ``nuclear-medicine`` (adds acquisition,
+    radiopharmaceutical, image and CTP columns) or ``full-private`` (adds
+    CSA headers and the private tag walk). With ``defer_size`` set, values
+    larger than that many bytes are skipped while parsing. Public ones are
+    read afterwards; private ones only while ``private_value_budget`` bytes
+    per file remain. With ``raw_csa``, CSA headers are stored as compressed
+    bytes and decoded when viewed instead of at ingest. ``private_digest``
+    names the hash used for private tag values (see ``PRIVATE_DIGESTS``).
+    ``raw_datasets`` (set by ``--sniff``) also reads datasets written
+    without preamble and DICM magic (see ``read_source``).
+    """
+    defer_size: Optional[int] = None
+    private_value_budget: int = DEFAULT_PRIVATE_VALUE_BUDGET
+    profile: str = DEFAULT_EXTRACTION_PROFILE
+    raw_csa: bool = False
+    private_digest: str = DEFAULT_PRIVATE_DIGEST
+    raw_datasets: bool = False
+
 
 @dataclass
 class DICOMMetadata:
@@ -112,8 +203,16 @@ class DICOMMetadata:
     csa_series_header_json: Optional[str] = None
     csa_image_header_hash: Optional[str] = None
     csa_series_header_hash: Optional[str] = None
+    # zlib-compressed raw CSA headers (only with ReadOptions.raw_csa)
+    csa_image_header_raw: Optional[bytes] = None
+    csa_series_header_raw: Optional[bytes] = None
     private_payload_fingerprint: Optional[str] = None
 
+    # Bytes read from the file or archive member to extract this row
+    header_bytes_read: Optional[int] = None
+    # Extraction profile the row was produced with (see EXTRACTION_PROFILES)
+    extraction_profile: Optional[str] = None
+
     # SOP Instance UID (for private tag linkage)
     sop_instance_uid: Optional[str] = None
 
@@ -126,6 +225,19 @@ class DICOMMetadata:
         return asdict(self)
 
 
+_METADATA_FIELDS = tuple(f.name for f in fields(DICOMMetadata))
+
+
+def pack_metadata(meta: DICOMMetadata) -> Tuple[Any, ...]:
+    """Flatten metadata into a field-ordered tuple (cheaper to pickle than the dataclass)."""
+    return tuple(getattr(meta, name) for name in _METADATA_FIELDS)
+
+
+def unpack_metadata(values: Tuple[Any, ...]) -> DICOMMetadata:
+    """Rebuild metadata packed by ``pack_metadata``."""
+    return DICOMMetadata(*values)
+
+
 def safe_getattr(obj, attr: str, cast_type=None):
     """Safely get attribute from DICOM dataset"""
     try:
@@ -155,16 +267,17 @@ def safe_getattr(obj, attr: str, cast_type=None):
         return None
 
 
+# Bytes that do not count as printable text (anything but tab, LF, CR and 0x20-0x7E)
+_NON_PRINTABLE = bytes(b for b in range(256) if not (b in (9, 10, 13) or 32 <= b <= 126))
+
+
 def _is_printable_ascii(raw: bytes, min_ratio: float = 0.90) -> bool:
     if not raw:
         return False
     head = raw.split(b"\x00", 1)[0]
     if not head:
         return False
-    printable = 0
-    for b in head:
-        if b in (9, 10, 13) or (32 <= b <= 126):
-            printable += 1
+    printable = len(head.translate(None, _NON_PRINTABLE))
     return printable / len(head) >= min_ratio
 
 
@@ -181,21 +294,32 @@ def _truncate_hex(raw: bytes, max_bytes: int = 256) -> str:
     return raw[:max_bytes].hex() + f"...(len={len(raw)})"
 
 
-def _build_private_creator_map(ds: pydicom.Dataset) -> Dict[int, Dict[int, str]]:
-    creators: Dict[int, Dict[int, str]] = {}
-    for elem in ds.iterall():
-        if not elem.tag.is_private_creator:
-            continue
-        group = elem.tag.group
-        block = elem.tag.element
-        creator = str(elem.value).strip() if elem.value is not None else ""
-        if not creator:
-            continue
-        creators.setdefault(group, {})[block] = creator
-    return creators
+def _sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _blake2b_hex(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=BLAKE2B_DIGEST_SIZE).hexdigest()
+
 
+_DIGEST_FUNCTIONS: Dict[str, Callable[[bytes], str]] = {
+    "sha256": _sha256_hex,
+    "blake2b": _blake2b_hex,
+}
 
-def _decode_private_value(elem: pydicom.DataElement) -> Dict[str, Any]:
+
+def private_digest_function(name: str = DEFAULT_PRIVATE_DIGEST) -> Callable[[bytes], str]:
+    """Return the hex digest function for one of ``PRIVATE_DIGESTS``."""
+    try:
+        return _DIGEST_FUNCTIONS[name]
+    except KeyError:
+        raise ValueError(f"Unknown private digest: {name!r} (expected one of {', '.join(PRIVATE_DIGESTS)})")
+
+
+def _decode_private_value(
+    elem: pydicom.DataElement,
+    digest: Callable[[bytes], str] = _sha256_hex,
+) -> Dict[str, Any]:
     value_text = None
     value_num = None
     value_json = None
@@ -207,7 +331,7 @@ def _decode_private_value(elem: pydicom.DataElement) -> Dict[str, Any]:
     if isinstance(value, (bytes, bytearray)):
         raw = bytes(value)
         byte_len = len(raw)
-        value_hash = hashlib.sha256(raw).hexdigest()
+        value_hash = digest(raw)
         if raw and _is_printable_ascii(raw):
             head = raw.split(b"\x00", 1)[0]
             decoded = head.decode("latin-1", errors="ignore").strip()
@@ -222,13 +346,13 @@ def _decode_private_value(elem: pydicom.DataElement) -> Dict[str, Any]:
             value_text = ", ".join(text_items)
         if len(value) == 1:
             value_num = _parse_numeric(str(value[0]))
-        value_hash = hashlib.sha256((value_text or "").encode("utf-8")).hexdigest()
+        value_hash = digest((value_text or "").encode("utf-8"))
     else:
         if value is not None:
             value_text = str(value).strip()
             if value_text:
                 value_num = _parse_numeric(value_text)
-        value_hash = hashlib.sha256((value_text or "").encode("utf-8")).hexdigest()
+        value_hash = digest((value_text or "").encode("utf-8"))
 
     return {
         "value_text": value_text,
@@ -264,128 +388,223 @@ def _classify_private_tag(creator: str, manufacturer: Optional[str], modality: O
     return "unknown_binary"
 
 
-def extract_private_tags(ds: pydicom.Dataset, metadata: DICOMMetadata) -> List[Dict[str, Any]]:
-    creators = _build_private_creator_map(ds)
-    results: List[Dict[str, Any]] = []
-    for elem in ds.iterall():
-        if not elem.tag.is_private:
-            continue
-        if elem.tag.is_private_creator:
-            continue
-        if elem.tag.element < 0x1000:
+def _is_sequence_entry(entry: Union[pydicom.DataElement, RawDataElement]) -> bool:
+    """True if a (possibly still raw) element holds a sequence, without converting it."""
+    vr = entry.VR
+    if vr is None:
+        # Implicit VR: undefined lengths only occur on sequences before the pixel data
+        if entry.length == 0xFFFFFFFF:
+            return True
+        try:
+            vr = dictionary_VR(entry.tag)
+        except KeyError:
+            return False
+    return vr == "SQ"
+
+
+def _iter_private_elements(ds: pydicom.Dataset) -> Iterator[pydicom.DataElement]:
+    """Yield private elements in ``ds.iterall()`` order.
+
+    Public elements are only converted when they are sequences that have to
+    be descended into; ``iterall`` converts every element of the dataset.
+    """
+    entries = ds._dict
+    for tag in sorted(entries):
+        if tag >> 16 & 1:
+            elem = ds[tag]
+            yield elem
+        elif _is_sequence_entry(entries[tag]):
+            elem = ds[tag]
+        else:
             continue
-        group = elem.tag.group
-        block = (elem.tag.element >> 8) & 0xFF
-        creator = creators.get(group, {}).get(block, "Unknown")
-        decoded = _decode_private_value(elem)
-        classification = _classify_private_tag(
-            creator,
-            metadata.manufacturer,
-            metadata.modality,
-            decoded
-        )
-        results.append({
-            "group_hex": f"{group:04X}",
-            "element_hex": f"{elem.tag.element:04X}",
-            "creator": creator,
-            "vr": elem.VR,
-            "value_text": decoded.get("value_text"),
-            "value_num": decoded.get("value_num"),
-            "value_json": decoded.get("value_json"),
-            "value_hex": decoded.get("value_hex"),
-            "byte_len": decoded.get("byte_len"),
-            "value_hash": decoded.get("value_hash"),
-            "classification": classification,
-            "sop_instance_uid": metadata.sop_instance_uid,
-        })
-    return results
-
-
-def _read_uint32(data: memoryview, offset: int) -> Optional[int]:
-    if offset + 4 > len(data):
-        return None
-    return struct.unpack_from("<I", data, offset)[0]
-
-
-def _read_csa_string(data: memoryview, offset: int, length: int) -> str:
-    if offset + length > len(data):
-        return ""
-    raw = bytes(data[offset:offset + length])
-    raw = raw.split(b"\x00", 1)[0]
-    return raw.decode("latin-1", errors="ignore").strip()
+        if elem.VR == "SQ" and elem.value:
+            for item in elem.value:
+                yield from _iter_private_elements(item)
+
+
+def _private_tag_row(
+    group: int,
+    element: int,
+    creator: str,
+    vr: str,
+    decoded: Dict[str, Any],
+    metadata: DICOMMetadata,
+) -> Dict[str, Any]:
+    return {
+        "group_hex": f"{group:04X}",
+        "element_hex": f"{element:04X}",
+        "creator": creator,
+        "vr": vr,
+        "value_text": decoded.get("value_text"),
+        "value_num": decoded.get("value_num"),
+        "value_json": decoded.get("value_json"),
+        "value_hex": decoded.get("value_hex"),
+        "byte_len": decoded.get("byte_len"),
+        "value_hash": decoded.get("value_hash"),
+        "classification": _classify_private_tag(creator, metadata.manufacturer, metadata.modality, decoded),
+        "sop_instance_uid": metadata.sop_instance_uid,
+    }
 
 
-def _align_4(offset: int) -> int:
-    return (offset + 3) & ~3
+def extract_private_tags(
+    ds: pydicom.Dataset,
+    metadata: DICOMMetadata,
+    unread: Sequence[RawDataElement] = (),
+    digest: Callable[[bytes], str] = _sha256_hex,
+) -> List[Dict[str, Any]]:
+    """Decode private elements; ``unread`` ones (over the read budget) keep only their length.
+
+    The dataset is walked once: private creators are recorded as they are
+    met and data elements resolve their block against them straight away.
+    Elements whose creator only shows up later in the walk are fixed up at
+    the end, so the result matches a creator map built up front.
+    """
+    creators: Dict[Tuple[int, int], str] = {}
+    results: List[Dict[str, Any]] = []
+    unresolved: List[Tuple[int, int, int, str, Dict[str, Any]]] = []
+    for elem in _iter_private_elements(ds):
+        tag = elem.tag
+        group = tag.group
+        element = tag.element
+        if element < 0x1000:
+            if 0x0010 <= element <= 0x00FF:
+                creator = str(elem.value).strip() if elem.value is not None else ""
+                if creator:
+                    creators[(group, element)] = creator
+            continue
+        block = (group, element >> 8)
+        creator = creators.get(block)
+        decoded = _decode_private_value(elem, digest)
+        if creator is None:
+            unresolved.append((len(results), group, element, elem.VR, decoded))
+            creator = "Unknown"
+        results.append(_private_tag_row(group, element, creator, elem.VR, decoded, metadata))
+
+    for index, group, element, vr, decoded in unresolved:
+        creator = creators.get((group, element >> 8))
+        if creator is not None:
+            results[index] = _private_tag_row(group, element, creator, vr, decoded, metadata)
+
+    unread_rows = []
+    for raw in unread:
+        tag = Tag(raw.tag)
+        creator = creators.get((tag.group, tag.element >> 8), "Unknown")
+        decoded = {"byte_len": raw.length}
+        unread_rows.append(_private_tag_row(tag.group, tag.element, creator, raw.VR or "UN", decoded, metadata))
+    return unread_rows + results
+
+
+# Siemens CSA layout: 84-byte element header (64-byte name, vm, vr, syngo
+# datatype, item count, unused word) followed by the items, each read as an
+# 8-byte header (length, delimiter) and a value padded to 4 bytes
+_CSA_ELEMENT_HEADER = struct.Struct("<64sI4sIII")
+_CSA_UINT32 = struct.Struct("<I")
+_CSA_MAX_ELEMENTS = 2048
+_CSA_MAX_ITEMS = 512
+
+
+def _csa_start(raw: bytes) -> Tuple[str, Optional[int], int]:
+    """Return the format, declared element count and offset of the first element."""
+    size = len(raw)
+    if raw.startswith(b"SV10"):
+        count = _CSA_UINT32.unpack_from(raw, 8)[0] if size >= 12 else None
+        return "CSA2", count, 16
+    count = _CSA_UINT32.unpack_from(raw, 0)[0] if size >= 4 else None
+    if count is None or count > 10000:
+        count = _CSA_UINT32.unpack_from(raw, 4)[0] if size >= 8 else None
+    return "CSA1", count, 8
+
+
+def _walk_csa_items(raw: bytes, offset: int, nitems: int, values: Optional[List[str]]) -> int:
+    """Step over an element's items, decoding them into ``values`` if given.
+
+    Returns the offset of the next element header.
+    """
+    size = len(raw)
+    unpack_uint32 = _CSA_UINT32.unpack_from
+    for _ in range(nitems if nitems < _CSA_MAX_ITEMS else _CSA_MAX_ITEMS):
+        if offset + 8 > size:
+            break
+        item_length = unpack_uint32(raw, offset)[0]
+        offset += 8
+        end = offset + item_length
+        if end > size:
+            break
+        if item_length and values is not None:
+            # Only the bytes before the first NUL are copied out of ``raw``
+            nul = raw.find(b"\x00", offset, end)
+            text = raw[offset:end if nul < 0 else nul].decode("latin-1").strip()
+            if text:
+                values.append(text)
+        offset = (end + 3) & ~3
+    return offset
+
+
+def _iter_csa_elements(raw: bytes) -> Iterator[Tuple[str, str, int, int, int]]:
+    """Yield ``(name, vr, vm, items_offset, nitems)`` for each element, skipping item values."""
+    _, count, offset = _csa_start(raw)
+    if not count:
+        return
+    size = len(raw)
+    header_size = _CSA_ELEMENT_HEADER.size
+    unpack_header = _CSA_ELEMENT_HEADER.unpack_from
+    for _ in range(count if count < _CSA_MAX_ELEMENTS else _CSA_MAX_ELEMENTS):
+        if offset + header_size > size:
+            break
+        name, vm, vr, _syngo_dt, nitems, _unknown = unpack_header(raw, offset)
+        items_offset = offset + header_size
+        offset = _walk_csa_items(raw, items_offset, nitems, None)
+        yield (
+            name.split(b"\x00", 1)[0].decode("latin-1").strip(),
+            vr.split(b"\x00", 1)[0].decode("latin-1").strip(),
+            vm,
+            items_offset,
+            nitems,
+        )
 
 
 def parse_csa_header(raw: bytes) -> Optional[Dict[str, Any]]:
     """Parse Siemens CSA header bytes into a JSON-serializable dict."""
     if not raw:
         return None
-    data = memoryview(raw)
-    fmt = "CSA1"
-    offset = 0
-    if raw.startswith(b"SV10"):
-        fmt = "CSA2"
-        offset = 8
-        num_elements = _read_uint32(data, offset)
-        offset = 16
-    else:
-        num_elements = _read_uint32(data, 0)
-        offset = 8
-        if num_elements is None or num_elements > 10000:
-            num_elements = _read_uint32(data, 4)
-            offset = 8
-
-    if num_elements is None or num_elements <= 0:
+    raw = bytes(raw)
+    fmt, count, offset = _csa_start(raw)
+    if not count:
         return None
 
-    max_elements = min(num_elements, 2048)
+    size = len(raw)
+    header_size = _CSA_ELEMENT_HEADER.size
+    unpack_header = _CSA_ELEMENT_HEADER.unpack_from
+    unpack_uint32 = _CSA_UINT32.unpack_from
+    find = raw.find
     elements: Dict[str, Any] = {}
-
-    for _ in range(max_elements):
-        if offset + 84 > len(data):
-            break
-        name = _read_csa_string(data, offset, 64)
-        offset += 64
-        vm = _read_uint32(data, offset)
-        offset += 4
-        vr = _read_csa_string(data, offset, 4)
-        offset += 4
-        _syngo_dt = _read_uint32(data, offset)
-        offset += 4
-        nitems = _read_uint32(data, offset)
-        offset += 4
-        _unknown = _read_uint32(data, offset)
-        offset += 4
-
-        if nitems is None or nitems < 0:
+    for _ in range(count if count < _CSA_MAX_ELEMENTS else _CSA_MAX_ELEMENTS):
+        if offset + header_size > size:
             break
+        name, vm, vr, _syngo_dt, nitems, _unknown = unpack_header(raw, offset)
+        offset += header_size
 
+        # Same walk as _walk_csa_items, inlined for the eager path
         values: List[str] = []
-        for _ in range(min(nitems, 512)):
-            if offset + 8 > len(data):
-                break
-            item_length = _read_uint32(data, offset)
-            offset += 4
-            _item_delim = _read_uint32(data, offset)
-            offset += 4
-            if item_length is None or item_length < 0:
+        for _ in range(nitems if nitems < _CSA_MAX_ITEMS else _CSA_MAX_ITEMS):
+            if offset + 8 > size:
                 break
-            if offset + item_length > len(data):
+            item_length = unpack_uint32(raw, offset)[0]
+            offset += 8
+            end = offset + item_length
+            if end > size:
                 break
-            if item_length > 0:
-                raw_value = bytes(data[offset:offset + item_length])
-                decoded = raw_value.split(b"\x00", 1)[0].decode("latin-1", errors="ignore").strip()
-                if decoded:
-                    values.append(decoded)
-            offset += item_length
-            offset = _align_4(offset)
-
+            if item_length:
+                nul = find(b"\x00", offset, end)
+                text = raw[offset:end if nul < 0 else nul].decode("latin-1").strip()
+                if text:
+                    values.append(text)
+            offset = (end + 3) & ~3
+
+        name = name.split(b"\x00", 1)[0].decode("latin-1").strip()
         if name:
             elements[name] = {
-                "vr": vr or None,
+                "vr": vr.split(b"\x00", 1)[0].decode("latin-1").strip() or None,
                 "vm": vm,
                 "values": values
             }
@@ -400,16 +619,74 @@ def parse_csa_header(raw: bytes) -> Optional[Dict[str, Any]]:
     }
 
 
-def extract_csa_payload(ds: pydicom.Dataset, tag: Tuple[int, int]) -> Tuple[Optional[str], Optional[str]]:
+class CsaHeader:
+    """Lazily decoded Siemens CSA header
+
+    Construction only walks the element and item headers to index element
+    names; item values are decoded when an element is looked up.
+    ``to_dict()`` returns the same structure as ``parse_csa_header``.
+    """
+
+    __slots__ = ("raw", "format", "_index")
+
+    def __init__(self, raw: bytes):
+        self.raw = bytes(raw)
+        self.format = _csa_start(self.raw)[0] if self.raw else None
+        self._index: Dict[str, Tuple[str, int, int, int]] = {}
+        if self.raw:
+            for name, vr, vm, items_offset, nitems in _iter_csa_elements(self.raw):
+                if name:
+                    self._index[name] = (vr, vm, items_offset, nitems)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._index
+
+    def names(self) -> List[str]:
+        return list(self._index)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Decode one element as ``{"vr", "vm", "values"}``, or None if absent."""
+        entry = self._index.get(name)
+        if entry is None:
+            return None
+        vr, vm, items_offset, nitems = entry
+        values: List[str] = []
+        _walk_csa_items(self.raw, items_offset, nitems, values)
+        return {"vr": vr or None, "vm": vm, "values": values}
+
+    def values(self, name: str) -> List[str]:
+        """Decoded item values of one element (empty if absent)."""
+        element = self.get(name)
+        return element["values"] if element else []
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        if not self._index:
+            return None
+        return {
+            "format": self.format,
+            "element_count": len(self._index),
+            "elements": {name: self.get(name) for name in self._index},
+        }
+
+
+def _csa_bytes(ds: pydicom.Dataset, tag: Tuple[int, int]) -> Optional[bytes]:
     elem = ds.get(tag)
     if elem is None:
-        return None, None
+        return None
     value = elem.value
     if isinstance(value, str):
-        raw = value.encode("latin-1", errors="ignore")
-    elif isinstance(value, (bytes, bytearray)):
-        raw = bytes(value)
-    else:
+        return value.encode("latin-1", errors="ignore")
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return None
+
+
+def extract_csa_payload(ds: pydicom.Dataset, tag: Tuple[int, int]) -> Tuple[Optional[str], Optional[str]]:
+    raw = _csa_bytes(ds, tag)
+    if raw is None:
         return None, None
     digest = hashlib.sha256(raw).hexdigest()
     parsed = parse_csa_header(raw)
@@ -418,19 +695,118 @@ def extract_csa_payload(ds: pydicom.Dataset, tag: Tuple[int, int]) -> Tuple[Opti
     return json.dumps(parsed, ensure_ascii=True), digest
 
 
-def extract_metadata(dcm_path: Path) -> Optional[DICOMMetadata]:
-    """Extract all important metadata from a DICOM file"""
+def extract_csa_raw(ds: pydicom.Dataset, tag: Tuple[int, int]) -> Tuple[Optional[bytes], Optional[str]]:
+    """Return the zlib-compressed CSA header and its hash, leaving decoding to ``decode_csa_blob``."""
+    raw = _csa_bytes(ds, tag)
+    if raw is None:
+        return None, None
+    return zlib.compress(raw, CSA_COMPRESSION_LEVEL), hashlib.sha256(raw).hexdigest()
+
+
+def decode_csa_blob(blob: Optional[bytes]) -> Optional[str]:
+    """Decode a stored ``csa_*_header_raw`` value into the ``csa_*_header_json`` text."""
+    if not blob:
+        return None
+    parsed = parse_csa_header(zlib.decompress(blob))
+    if not parsed:
+        return None
+    return json.dumps(parsed, ensure_ascii=True)
+
+
+class CountingReader:
+    """File wrapper that counts the bytes actually read through it."""
+
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fp.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._fp.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._fp.tell()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._fp, name)
+
+
+def load_deferred_values(ds: pydicom.Dataset, fp: BinaryIO, private_value_budget: int) -> List[RawDataElement]:
+    """Read values skipped by ``defer_size`` while ``fp`` is still open.
+
+    Public values are always read. Private values are read (CSA headers
+    first) until ``private_value_budget`` bytes are used; the rest are
+    removed from ``ds`` and returned, so later lookups cannot trigger a read.
+    """
+    deferred = [
+        raw for raw in ds._dict.values()
+        if isinstance(raw, RawDataElement) and raw.value is None and raw.length
+    ]
+    deferred.sort(key=lambda raw: (raw.tag not in CSA_HEADER_TAGS, raw.tag))
+    unread: List[RawDataElement] = []
+    remaining = private_value_budget
+    for raw in deferred:
+        tag = Tag(raw.tag)
+        if tag.is_private:
+            if raw.length > remaining:
+                unread.append(raw)
+                del ds._dict[tag]
+                continue
+            remaining -= raw.length
+        ds._dict[tag] = read_deferred_data_element(type(fp), fp, None, raw)
+    return unread
+
+
+def _stop_after_core_groups(tag, vr, length) -> bool:
+    return tag > _LAST_CORE_TAG
+
+
+def _read_header(
+    fp: BinaryIO,
+    force: bool,
+    options: ReadOptions,
+) -> Tuple[pydicom.Dataset, List[RawDataElement], int]:
+    reader = CountingReader(fp)
+    if options.profile == "core":
+        ds = read_partial(reader, stop_when=_stop_after_core_groups, defer_size=options.defer_size, force=force)
+    else:
+        ds = pydicom.dcmread(reader, stop_before_pixels=True, force=force, defer_size=options.defer_size)
+    unread: List[RawDataElement] = []
+    if options.defer_size is not None:
+        # Only the full-private profile looks at private values at all
+        budget = options.private_value_budget if options.profile == "full-private" else 0
+        unread = load_deferred_values(ds, reader, budget)
+    return ds, unread, reader.bytes_read
+
+
+def extract_metadata(dcm_path: DicomSource, options: ReadOptions = ReadOptions()) -> Optional[DICOMMetadata]:
+    """Extract all important metadata from a DICOM file or archive member
+
+    Args:
+        dcm_path: File or archive member to read
+        options: Extraction profile and deferred-read settings (by default
+            every non-pixel value is read and decoded)
+    """
     # Skip macOS metadata files
     if dcm_path.name.startswith('._') or '__MACOSX' in str(dcm_path):
         return None
     
     try:
-        ds = pydicom.dcmread(dcm_path, stop_before_pixels=True, force=False)
+        ds, unread, bytes_read = read_source(
+            dcm_path, lambda fp, force: _read_header(fp, force, options), options.raw_datasets
+        )
     except Exception as e:
         # Silently skip files that can't be read (macOS metadata, invalid DICOM, etc.)
         return None
     
     meta = DICOMMetadata()
+    meta.header_bytes_read = bytes_read
+    meta.extraction_profile = options.profile
+    rank = profile_rank(options.profile)
     
     # Patient Information
     meta.patient_id = safe_getattr(ds, 'PatientID')
@@ -468,6 +844,10 @@ def extract_metadata(dcm_path: Path) -> Optional[DICOMMetadata]:
     meta.device_serial_number = safe_getattr(ds, 'DeviceSerialNumber')
     meta.institution_name = safe_getattr(ds, 'InstitutionName')
     meta.institution_address = safe_getattr(ds, 'InstitutionAddress')
+    meta.sop_instance_uid = safe_getattr(ds, 'SOPInstanceUID')
+
+    if rank < profile_rank("nuclear-medicine"):
+        return meta
     
     # Acquisition Information
     meta.acquisition_date = safe_getattr(ds, 'AcquisitionDate')
@@ -529,7 +909,6 @@ def extract_metadata(dcm_path: Path) -> Optional[DICOMMetadata]:
     meta.number_of_frames = safe_getattr(ds, 'NumberOfFrames', int)
     meta.frame_time = safe_getattr(ds, 'FrameTime', float)
     meta.number_of_slices = safe_getattr(ds, 'ImagesInAcquisition', int) or meta.number_of_frames
-    meta.sop_instance_uid = safe_getattr(ds, 'SOPInstanceUID')
 
     def _get_ctp_value(element_offset: int):
         try:
@@ -571,11 +950,19 @@ def extract_metadata(dcm_path: Path) -> Optional[DICOMMetadata]:
             if flag_str:
                 meta.ctp_private_flag_raw = flag_str
 
+    if rank < profile_rank("full-private"):
+        return meta
+
     # Siemens CSA headers (0029,1010) and (0029,1020)
-    meta.csa_image_header_json, meta.csa_image_header_hash = extract_csa_payload(ds, (0x0029, 0x1010))
-    meta.csa_series_header_json, meta.csa_series_header_hash = extract_csa_payload(ds, (0x0029, 0x1020))
+    if options.raw_csa:
+        meta.csa_image_header_raw, meta.csa_image_header_hash = extract_csa_raw(ds, (0x0029, 0x1010))
+        meta.csa_series_header_raw, meta.csa_series_header_hash = extract_csa_raw(ds, (0x0029, 0x1020))
+    else:
+        meta.csa_image_header_json, meta.csa_image_header_hash = extract_csa_payload(ds, (0x0029, 0x1010))
+        meta.csa_series_header_json, meta.csa_series_header_hash = extract_csa_payload(ds, (0x0029, 0x1020))
 
-    meta.private_tags = extract_private_tags(ds, meta)
+    digest = private_digest_function(options.private_digest)
+    meta.private_tags = extract_private_tags(ds, meta, unread, digest)
     if meta.private_tags:
         fingerprint_items = [
             f"{tag.get('creator','')}|{tag.get('group_hex','')}|{tag.get('element_hex','')}|{tag.get('value_hash','')}"
@@ -583,52 +970,450 @@ def extract_metadata(dcm_path: Path) -> Optional[DICOMMetadata]:
         ]
         fingerprint_items.sort()
         joined = "\n".join(fingerprint_items).encode("utf-8")
-        meta.private_payload_fingerprint = hashlib.sha256(joined).hexdigest()
+        meta.private_payload_fingerprint = digest(joined)
 
     return meta
 
 
-def extract_metadata_from_paths(
-    dcm_paths: List[Path],
+def _stop_after_series_uid(tag, vr, length) -> bool:
+    return tag > _SERIES_UID_TAG
+
+
+def _open_source(source: DicomSource) -> BinaryIO:
+    if isinstance(source, ArchiveMember):
+        return open_member(source)
+    return open(source, "rb")
+
+
+def read_source(
+    source: DicomSource,
+    read: Callable[[BinaryIO, bool], Any],
+    raw_datasets: bool = False,
+) -> Any:
+    """Open a file or archive member and parse it with ``read(fp, force)``.
+
+    ``force`` is False first. With ``raw_datasets``, datasets written
+    without preamble are retried with ``force=True`` if their first bytes
+    look like a dataset. Parsing errors are propagated to the caller.
+    """
+    try:
+        with _open_source(source) as fp:
+            return read(fp, False)
+    except InvalidDicomError:
+        if not raw_datasets:
+            raise
+        if isinstance(source, ArchiveMember):
+            head = read_member_head(source)
+        else:
+            head = read_file_head(source)
+        if not is_raw_dataset_header(head):
+            raise
+        with _open_source(source) as fp:
+            return read(fp, True)
+
+
+def probe_uids(
+    dcm_path: DicomSource,
+    raw_datasets: bool = False,
+) -> Optional[Tuple[Optional[str], Optional[str], Optional[str]]]:
+    """Read only the Study, Series and SOP Instance UIDs of a DICOM file.
+
+    Parsing stops right after SeriesInstanceUID, so this costs a fraction of
+    a full ``extract_metadata`` call. Returns ``None`` for unreadable files.
+    ``raw_datasets`` is passed to ``read_source``.
+    """
+    if dcm_path.name.startswith('._') or '__MACOSX' in str(dcm_path):
+        return None
+
+    try:
+        ds = read_source(
+            dcm_path,
+            lambda fp, force: read_partial(
+                fp,
+                stop_when=_stop_after_series_uid,
+                force=force,
+                specific_tags=UID_PROBE_TAGS,
+            ),
+            raw_datasets,
+        )
+    except Exception:
+        return None
+
+    return (
+        safe_getattr(ds, 'StudyInstanceUID'),
+        safe_getattr(ds, 'SeriesInstanceUID'),
+        safe_getattr(ds, 'SOPInstanceUID'),
+    )
+
+
+def probe_uids_from_paths(
+    dcm_paths: List[DicomSource],
     max_workers: Optional[int] = None,
-) -> List[Tuple[Path, DICOMMetadata]]:
-    """Extract metadata for a list of DICOM files using a process pool."""
-    filtered_paths = [
+    executor: Optional[Executor] = None,
+    raw_datasets: bool = False,
+) -> List[Tuple[DicomSource, Optional[Tuple[Optional[str], Optional[str], Optional[str]]]]]:
+    """Probe UIDs for a list of files using a process pool.
+
+    Probes are cheap, so paths are handed to the workers in chunks to keep
+    the per-task IPC overhead from dominating. A shared ``executor`` is
+    used instead of starting a new pool. ``raw_datasets`` is passed to
+    ``probe_uids``.
+    """
+    if not dcm_paths:
+        return []
+
+    workers = max_workers or min(32, max(len(dcm_paths), 1))
+    chunksize = max(1, min(256, len(dcm_paths) // (workers * 4)))
+
+    pool = nullcontext(executor) if executor is not None else ProcessPoolExecutor(max_workers=workers)
+    with pool as executor:
+        probe = partial(probe_uids, raw_datasets=raw_datasets)
+        return list(zip(dcm_paths, executor.map(probe, dcm_paths, chunksize=chunksize)))
+
+
+def max_in_flight_for_memory(memory_limit_mb: Optional[float], workers: int) -> int:
+    """Translate a memory ceiling into a bound on queued extraction tasks.
+
+    Without a ceiling a few tasks per worker are kept queued, which is enough
+    to keep the pool busy.
+    """
+    if not memory_limit_mb:
+        return workers * 4
+    budget = int(memory_limit_mb * 1024 * 1024) // ESTIMATED_RESULT_BYTES
+    return max(workers, budget)
+
+
+def extract_metadata_batch(
+    dcm_paths: List[DicomSource],
+    options: ReadOptions = ReadOptions(),
+) -> Tuple[List[Optional[Tuple[Any, ...]]], float, List[float]]:
+    """Worker entry point: extract a batch of files in one task.
+
+    Returns the packed results (``None`` for unreadable files) in input
+    order, the seconds spent in the worker, so the caller can size the
+    next batch, and the seconds each file took.
+    """
+    t0 = time.perf_counter()
+    packed: List[Optional[Tuple[Any, ...]]] = []
+    file_seconds: List[float] = []
+    t_file = t0
+    for dcm_path in dcm_paths:
+        meta = extract_metadata(dcm_path, options)
+        packed.append(pack_metadata(meta) if meta else None)
+        now = time.perf_counter()
+        file_seconds.append(now - t_file)
+        t_file = now
+    return packed, t_file - t0, file_seconds
+
+
+class BatchSizer:
+    """Pick batch sizes so that one worker round trip takes ~TARGET_BATCH_SECONDS.
+
+    Per-file latency is tracked as an exponential moving average of the
+    timings reported by ``extract_metadata_batch``.
+    """
+
+    def __init__(
+        self,
+        initial: int = INITIAL_BATCH_SIZE,
+        target_seconds: float = TARGET_BATCH_SECONDS,
+        max_size: int = MAX_BATCH_SIZE,
+    ):
+        self.size = initial
+        self.target_seconds = target_seconds
+        self.max_size = max_size
+        self.file_latency: Optional[float] = None
+
+    def observe(self, file_count: int, seconds: float) -> None:
+        if file_count <= 0:
+            return
+        latency = seconds / file_count
+        if self.file_latency is None:
+            self.file_latency = latency
+        else:
+            self.file_latency = 0.7 * self.file_latency + 0.3 * latency
+        if self.file_latency > 0:
+            self.size = int(self.target_seconds / self.file_latency)
+        else:
+            self.size = self.max_size
+        self.size = max(1, min(self.max_size, self.size))
+
+    def next_size(self, remaining: Optional[int], workers: int) -> int:
+        # Leave enough batches to keep every worker busy near the end of the run
+        if remaining is None:
+            return self.size
+        spread = max(1, remaining // workers)
+        return max(1, min(self.size, spread))
+
+
+class ConcurrencyController:
+    """Adjust the number of in-flight batches while the real ingest runs.
+
+    Completed files are counted over consecutive time windows. After each
+    window the files/sec rate is compared with the previous window: if it
+    improved (or held within ``tolerance``) the limit keeps moving in the
+    same direction, otherwise the direction is reversed. This hill-climbs
+    towards the best concurrency and keeps adapting when storage latency
+    changes mid-run.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial: Optional[int] = None,
+        min_limit: int = 1,
+        window_seconds: float = CONTROLLER_WINDOW_SECONDS,
+        tolerance: float = CONTROLLER_TOLERANCE,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = max(self.min_limit, min(self.max_limit, initial or (self.max_limit + 1) // 2))
+        self.window_seconds = window_seconds
+        self.tolerance = tolerance
+        self.history: List[Tuple[int, float]] = []
+        self._direction = 1
+        self._last_rate: Optional[float] = None
+        self._window_start = time.perf_counter()
+        self._window_files = 0
+
+    def record(self, file_count: int) -> None:
+        """Count completed files and re-evaluate the limit at window boundaries."""
+        self._window_files += file_count
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return
+
+        rate = self._window_files / elapsed
+        self.history.append((self.limit, rate))
+        if self._last_rate is not None and rate < self._last_rate * (1 - self.tolerance):
+            self._direction = -self._direction
+        self._last_rate = rate
+
+        step = max(1, self.limit // 4)
+        new_limit = self.limit + self._direction * step
+        if new_limit > self.max_limit or new_limit < self.min_limit:
+            self._direction = -self._direction
+            new_limit = self.limit + self._direction * step
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+        self._window_start = now
+        self._window_files = 0
+
+
+def iter_metadata_from_paths(
+    dcm_paths: Iterable[DicomSource],
+    max_workers: Optional[int] = None,
+    memory_limit_mb: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    controller: Optional[ConcurrencyController] = None,
+    stats: Optional[Dict[str, float]] = None,
+    read_options: Optional[ReadOptions] = None,
+    on_invalid: Optional[Callable[[DicomSource], None]] = None,
+    executor: Optional[Executor] = None,
+    on_timing: Optional[Callable[[DicomSource, float], None]] = None,
+) -> Iterator[Tuple[DicomSource, DICOMMetadata]]:
+    """Extract metadata with a process pool, yielding results as they complete.
+
+    Files are sent to the workers in batches (see ``extract_metadata_batch``)
+    whose size adapts to the observed per-file latency, unless a fixed
+    ``batch_size`` is given. At most ``max_in_flight_for_memory(memory_limit_mb,
+    workers)`` files are submitted at once; new batches are only handed to
+    the pool once earlier results have been consumed, so memory use stays
+    bounded regardless of the number of input files. ``dcm_paths`` may be a
+    lazy iterator (e.g. members streamed from a TAR archive); it is only
+    advanced as capacity frees up.
+
+    With a ``controller`` the pool is sized to ``controller.max_limit`` and
+    the number of batches running at once follows ``controller.limit``.
+    If a ``stats`` dict is given, the pool size (``workers``), the summed
+    time workers spent extracting (``worker_busy_s``) and the header bytes
+    read for the yielded files (``header_bytes_read``) are added to it.
+    ``read_options`` is passed on to ``extract_metadata``. ``on_invalid`` is
+    called with every source that could not be read as DICOM, and
+    ``on_timing(source, seconds)`` with the worker time of every source
+    (valid or not) before it is yielded. A long-lived
+    ``executor`` (kept warm across calls) replaces the per-call pool and is
+    left running; ``max_workers`` should then be its size.
+    """
+    total: Optional[int] = None
+    if isinstance(dcm_paths, (list, tuple)):
+        dcm_paths = [
+            dcm_path
+            for dcm_path in dcm_paths
+            if not (dcm_path.name.startswith("._") or "__MACOSX" in str(dcm_path))
+        ]
+        total = len(dcm_paths)
+    source_iter = (
         dcm_path
         for dcm_path in dcm_paths
         if not (dcm_path.name.startswith("._") or "__MACOSX" in str(dcm_path))
-    ]
-
-    if not filtered_paths:
-        return []
+    )
+    first = next(source_iter, None)
+    if first is None:
+        return
+    source_iter = itertools.chain([first], source_iter)
 
-    default_workers = min(32, max(len(filtered_paths), 1))
+    default_workers = min(32, max(total, 1)) if total is not None else min(32, os.cpu_count() or 4)
     workers = max_workers or default_workers
+    if controller:
+        workers = min(controller.max_limit, total) if total is not None else controller.max_limit
+    max_in_flight = max_in_flight_for_memory(memory_limit_mb, workers)
+    if stats is not None:
+        stats["workers"] = max(stats.get("workers", 0), workers)
+        stats.setdefault("worker_busy_s", 0.0)
+        stats.setdefault("header_bytes_read", 0)
+    read_options = read_options or ReadOptions()
+    sizer = BatchSizer(initial=batch_size, max_size=batch_size) if batch_size else BatchSizer()
+    submitted = 0
+    exhausted = False
+
+    pool = nullcontext(executor) if executor is not None else ProcessPoolExecutor(max_workers=workers)
+    with pool as executor:
+        pending = {}
+        in_flight = 0
+
+        def _submit_more() -> None:
+            nonlocal submitted, in_flight, exhausted
+            while in_flight < max_in_flight and not exhausted:
+                if controller and len(pending) >= controller.limit:
+                    return
+                remaining = total - submitted if total is not None else None
+                size = sizer.next_size(remaining, workers)
+                batch = list(itertools.islice(source_iter, size))
+                if len(batch) < size:
+                    exhausted = True
+                if not batch:
+                    return
+                submitted += len(batch)
+                in_flight += len(batch)
+                pending[executor.submit(extract_metadata_batch, batch, read_options)] = batch
+
+        _submit_more()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                packed_results, worker_seconds, file_seconds = future.result()
+                in_flight -= len(batch)
+                sizer.observe(len(batch), worker_seconds)
+                if stats is not None:
+                    stats["worker_busy_s"] += worker_seconds
+                if controller:
+                    controller.record(len(batch))
+                for dcm_path, packed, seconds in zip(batch, packed_results, file_seconds):
+                    if on_timing is not None:
+                        on_timing(dcm_path, seconds)
+                    if packed:
+                        meta = unpack_metadata(packed)
+                        if stats is not None:
+                            stats["header_bytes_read"] += meta.header_bytes_read or 0
+                        yield dcm_path, meta
+                    elif on_invalid is not None:
+                        on_invalid(dcm_path)
+            _submit_more()
 
-    metadata_list: List[Tuple[Path, DICOMMetadata]] = []
 
-    with ProcessPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(extract_metadata, path): path for path in filtered_paths}
-
-        for future in as_completed(futures):
-            dcm_path = futures[future]
-            meta = future.result()
-            if meta:
-                metadata_list.append((dcm_path, meta))
+def extract_metadata_from_paths(
+    dcm_paths: List[Path],
+    max_workers: Optional[int] = None,
+    read_options: Optional[ReadOptions] = None,
+    profile: Optional[str] = None,
+    executor: Optional[Executor] = None,
+) -> List[Tuple[Path, DICOMMetadata]]:
+    """Extract metadata for a list of DICOM files using a process pool.
 
-    return metadata_list
+    ``profile`` (one of EXTRACTION_PROFILES) overrides ``read_options.profile``.
+    An ``executor`` replaces the per-call pool (see ``iter_metadata_from_paths``).
+    """
+    if profile is not None:
+        read_options = (read_options or ReadOptions())._replace(profile=profile)
+    return list(iter_metadata_from_paths(
+        dcm_paths, max_workers=max_workers, read_options=read_options, executor=executor
+    ))
 
 
 def extract_all_metadata(
     directory: Path,
     max_workers: Optional[int] = None,
+    sniff: bool = False,
+    read_options: Optional[ReadOptions] = None,
+    executor: Optional[Executor] = None,
 ) -> List[Tuple[Path, DICOMMetadata]]:
-    """Extract metadata from all DICOM files in a directory using a process pool."""
-    dcm_files = list(directory.rglob("*.dcm"))
+    """Extract metadata from all DICOM files in a directory using a process pool.
+
+    With ``sniff``, files without a ``.dcm`` extension are included when their
+    content looks like DICOM, and datasets without preamble are read. An
+    ``executor`` replaces the per-call pool.
+    """
+    if sniff:
+        read_options = (read_options or ReadOptions())._replace(raw_datasets=True)
+    dcm_files = [record.path for record in discover_dicom_files(directory, sniff=sniff)]
     return extract_metadata_from_paths(
         dcm_files,
         max_workers=max_workers,
+        read_options=read_options,
+        executor=executor,
+    )
+
+
+def read_options_from_args(args: argparse.Namespace) -> ReadOptions:
+    """Build ``ReadOptions`` from the flags added by ``add_read_option_arguments``."""
+    options = ReadOptions(
+        profile=args.extraction_profile,
+        raw_csa=args.raw_csa,
+        private_digest=args.private_digest,
     )
+    if args.defer_size_kb is None:
+        return options
+    budget = DEFAULT_PRIVATE_VALUE_BUDGET if args.private_budget_kb is None else int(args.private_budget_kb * 1024)
+    return options._replace(defer_size=int(args.defer_size_kb * 1024), private_value_budget=budget)
+
+
+def add_read_option_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the extraction profile and bounded header read flags shared by the CLIs."""
+    parser.add_argument(
+        "--extraction-profile",
+        choices=EXTRACTION_PROFILES,
+        default=DEFAULT_EXTRACTION_PROFILE,
+        help="Columns to extract: core (UIDs, patient, study, series, device; lacks the "
+             "injection and acquisition data that representative series are scored by), "
+             "nuclear-medicine (adds acquisition, radiopharmaceutical and image columns) "
+             f"or full-private (adds CSA headers and private tags; default: {DEFAULT_EXTRACTION_PROFILE}).",
+    )
+    parser.add_argument(
+        "--defer-size-kb",
+        type=float,
+        default=None,
+        help="Skip values larger than this while parsing headers; private ones are then "
+             "only read within --private-budget-kb (default: read everything).",
+    )
+    parser.add_argument(
+        "--private-budget-kb",
+        type=float,
+        default=None,
+        help=f"Deferred private bytes read per file, CSA headers first "
+             f"(default: {DEFAULT_PRIVATE_VALUE_BUDGET // 1024}).",
+    )
+    parser.add_argument(
+        "--raw-csa",
+        action="store_true",
+        help="Store Siemens CSA headers as compressed bytes and decode them when viewed, not at ingest.",
+    )
+    parser.add_argument(
+        "--private-digest",
+        choices=PRIVATE_DIGESTS,
+        default=DEFAULT_PRIVATE_DIGEST,
+        help="Hash for private tag values and the private payload fingerprint; keep one per database "
+             f"(default: {DEFAULT_PRIVATE_DIGEST}).",
+    )
+
+
+def _json_default(value: Any) -> Any:
+    # Raw CSA headers are written base64-encoded
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
 def _dump_metadata(metadata: List[Tuple[Path, DICOMMetadata]], output_path: Optional[Path]) -> None:
@@ -642,10 +1427,10 @@ def _dump_metadata(metadata: List[Tuple[Path, DICOMMetadata]], output_path: Opti
     if output_path:
         output_path.parent.mkdir(parents=True, exist_ok=True)
         with output_path.open("w", encoding="utf-8") as fh:
-            json.dump(serializable, fh, indent=2)
+            json.dump(serializable, fh, indent=2, default=_json_default)
         print(f"Wrote metadata for {len(serializable)} DICOM file(s) to {output_path}")
     else:
-        json.dump(serializable, sys.stdout, indent=2)
+        json.dump(serializable, sys.stdout, indent=2, default=_json_default)
         sys.stdout.write("\n")
 
 
@@ -677,17 +1462,53 @@ def main() -> None:
         action="store_true",
         help="Print timing information for the extraction run.",
     )
+    parser.add_argument(
+        "-s",
+        "--sniff",
+        action="store_true",
+        help="Also detect DICOM files without a .dcm extension by their content.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_PROFILE_PREFIX,
+        default=None,
+        metavar="PREFIX",
+        help="Profile the run and its worker processes with cProfile; writes PREFIX.pstats "
+             f"and PREFIX.collapsed.txt (default prefix: {DEFAULT_PROFILE_PREFIX}).",
+    )
+    add_read_option_arguments(parser)
 
     args = parser.parse_args()
 
     if args.max_workers is not None and args.max_workers < 1:
         parser.error("--max-workers must be greater than zero")
+    if args.defer_size_kb is not None and args.defer_size_kb <= 0:
+        parser.error("--defer-size-kb must be greater than zero")
+    if args.private_budget_kb is not None and args.private_budget_kb < 0:
+        parser.error("--private-budget-kb must not be negative")
 
     start = time.perf_counter() if args.timing else None
-    metadata = extract_all_metadata(
-        args.directory,
-        max_workers=args.max_workers,
-    )
+    if args.profile:
+        with ProfileSession(args.profile) as session:
+            executor = session.pool(args.max_workers or min(32, os.cpu_count() or 4))
+            try:
+                metadata = extract_all_metadata(
+                    args.directory,
+                    max_workers=args.max_workers,
+                    sniff=args.sniff,
+                    read_options=read_options_from_args(args),
+                    executor=executor,
+                )
+            finally:
+                executor.shutdown()
+    else:
+        metadata = extract_all_metadata(
+            args.directory,
+            max_workers=args.max_workers,
+            sniff=args.sniff,
+            read_options=read_options_from_args(args),
+        )
     if args.timing and start is not None:
         elapsed = time.perf_counter() - start
         print(f"Processed {len(metadata)} DICOM file(s) in {elapsed:.2f}s")
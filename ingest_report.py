@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Machine-readable metrics report for an ingest run
+Collects stage durations, throughput, utilization, per-file latency and counts for process_dicom.py --report
+"""
+
+import heapq
+import json
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+# Upper bounds (ms) of the per-file parse latency histogram; slower files land in the last bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+DEFAULT_SLOWEST_FILES = 20
+
+# process_single_scan / process_directory timing keys -> report stage names
+STAGE_KEYS = {
+    "archive_list_s": "archive_list",
+    "archive_extract_s": "archive_extract",
+    "discover_files_s": "discovery",
+    "scan_dicom_files_s": "discovery",
+    "dedupe_s": "dedupe",
+    "load_known_series_s": "probe",
+    "manifest_lookup_s": "manifest_lookup",
+    "probe_series_s": "probe",
+    "extract_metadata_s": "extract",
+    "writer_busy_s": "insert",
+    "writer_flush_s": "insert_flush",
+    "prune_s": "prune",
+    "maintenance_s": "maintenance",
+}
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class IngestReport:
+    """Metrics of one ingest run, written as JSON by ``write``
+
+    ``record_file`` keeps every latency in a compact float array (8 bytes
+    per file) for exact percentiles and only the ``slowest`` files with
+    their paths. Stage durations are summed over scans; ``insert`` runs on
+    the writer thread while ``extract`` runs, so stages can overlap.
+    """
+
+    def __init__(self, slowest: int = DEFAULT_SLOWEST_FILES):
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self.slowest = slowest
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.latencies = array("d")
+        self.parsed_bytes = 0
+        self.header_bytes = 0
+        self.workers = 0
+        self.worker_busy_s = 0.0
+        self.worker_capacity_s = 0.0
+        self._slowest: List[Tuple[float, str, int]] = []
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_count(self, name: str, count: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def add_timings(self, timings: Dict[str, float]) -> None:
+        """Add the stage durations of a ``process_single_scan``/``process_directory`` timings dict."""
+        for key, seconds in timings.items():
+            stage = STAGE_KEYS.get(key)
+            if stage is not None:
+                self.add_stage(stage, seconds)
+        self.header_bytes += int(timings.get("header_read_mb", 0.0) * 1024 * 1024)
+
+    def add_workers(self, workers: int, busy_seconds: float, elapsed: float) -> None:
+        """Account one extraction pass: ``workers`` processes busy for ``busy_seconds`` of ``elapsed``."""
+        self.workers = max(self.workers, workers)
+        self.worker_busy_s += busy_seconds
+        self.worker_capacity_s += workers * elapsed
+
+    def record_file(self, path: str, seconds: float, size: int = 0) -> None:
+        self.latencies.append(seconds)
+        self.parsed_bytes += size
+        entry = (seconds, path, size)
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, entry)
+        elif self.slowest and seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def _latency(self) -> Dict[str, Any]:
+        values = sorted(self.latencies)
+        histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        bucket = 0
+        for seconds in values:
+            while bucket < len(LATENCY_BUCKETS_MS) and seconds * 1000 > LATENCY_BUCKETS_MS[bucket]:
+                bucket += 1
+            histogram[bucket] += 1
+        bounds: List[Any] = list(LATENCY_BUCKETS_MS) + ["+Inf"]
+        return {
+            "files": len(values),
+            "mean_ms": 1000 * sum(values) / len(values) if values else 0.0,
+            "p50_ms": 1000 * _percentile(values, 0.50),
+            "p90_ms": 1000 * _percentile(values, 0.90),
+            "p99_ms": 1000 * _percentile(values, 0.99),
+            "max_ms": 1000 * values[-1] if values else 0.0,
+            "histogram": [{"le_ms": bound, "count": count} for bound, count in zip(bounds, histogram)],
+        }
+
+    def to_dict(self, **context: Any) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._t0
+        files = len(self.latencies)
+        extract_s = self.stages.get("extract", 0.0)
+        insert_s = self.stages.get("insert", 0.0)
+        # The writer thread lives for the extraction plus the final flush
+        writer_s = extract_s + self.stages.get("insert_flush", 0.0)
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            **context,
+            "elapsed_s": elapsed,
+            "stages_s": dict(sorted(self.stages.items())),
+            "throughput": {
+                "files_parsed": files,
+                "parsed_mb": self.parsed_bytes / (1024 * 1024),
+                "header_read_mb": self.header_bytes / (1024 * 1024),
+                "files_per_s": files / elapsed if elapsed > 0 else 0.0,
+                "mb_per_s": self.parsed_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+                "extract_files_per_s": files / extract_s if extract_s > 0 else 0.0,
+            },
+            "utilization": {
+                "workers": self.workers,
+                "worker_busy_s": self.worker_busy_s,
+                "extract_pct": 100.0 * self.worker_busy_s / self.worker_capacity_s if self.worker_capacity_s > 0 else 0.0,
+                "writer_pct": 100.0 * insert_s / writer_s if writer_s > 0 else 0.0,
+            },
+            "latency": self._latency(),
+            "counts": dict(sorted(self.counts.items())),
+            "slowest_files": [
+                {"path": path, "ms": 1000 * seconds, "size_bytes": size}
+                for seconds, path, size in sorted(self._slowest, reverse=True)
+            ],
+        }
+
+    def write(self, path: str, **context: Any) -> Dict[str, Any]:
+        """Write the report as JSON to ``path`` ("-" for stdout) and return it."""
+        report = self.to_dict(**context)
+        text = json.dumps(report, indent=2)
+        if path == "-":
+            print(text)
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(text + "\n")
+        return report
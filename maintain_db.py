@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Threshold-based maintenance for metadata databanks
+Frees pages incrementally, refreshes planner statistics and truncates the WAL only when needed
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from store_metadata import init_database
+
+BASE_DIR = Path(__file__).resolve().parent
+DATABANK_DIR = BASE_DIR / "Databanks"
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Free pages released per incremental_vacuum step (each step is its own short transaction)
+INCREMENTAL_VACUUM_STEP = 2048
+
+# Seconds between passes of the web server's background scheduler
+DEFAULT_MAINTENANCE_INTERVAL = 600.0
+
+
+class MaintenanceThresholds(NamedTuple):
+    """When each maintenance task is due"""
+    freelist_ratio: float = 0.10      # free pages / total pages before space is reclaimed
+    min_free_pages: int = 1024        # ...and at least this many free pages (4 MB)
+    wal_mb: float = 64.0              # WAL size before a TRUNCATE checkpoint
+    analyze_changes: int = 1000       # rows changed since the last ANALYZE...
+    analyze_ratio: float = 0.10       # ...and this share of dicom_metadata rows
+
+
+def _database_file(conn: sqlite3.Connection) -> Optional[str]:
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path or None
+    return None
+
+
+def database_health(conn: sqlite3.Connection) -> Dict[str, float]:
+    """Numbers the maintenance thresholds are checked against."""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    db_file = _database_file(conn)
+    wal_path = Path(f"{db_file}-wal") if db_file else None
+    wal_bytes = wal_path.stat().st_size if wal_path is not None and wal_path.exists() else 0
+    pending = conn.execute(
+        "SELECT pending_changes FROM db_maintenance WHERE task = 'analyze'"
+    ).fetchone()
+    return {
+        "page_count": page_count,
+        "freelist_count": freelist_count,
+        "freelist_ratio": freelist_count / page_count if page_count else 0.0,
+        "size_mb": page_count * page_size / (1024 * 1024),
+        "wal_mb": wal_bytes / (1024 * 1024),
+        "auto_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+        "pending_changes": pending[0] if pending else 0,
+        "series_rows": conn.execute("SELECT COUNT(*) FROM dicom_metadata").fetchone()[0],
+    }
+
+
+def _mark_run(conn: sqlite3.Connection, task: str, reset_changes: bool = False) -> None:
+    conn.execute(
+        "INSERT INTO db_maintenance (task, last_run) VALUES (?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(task) DO UPDATE SET last_run = CURRENT_TIMESTAMP"
+        + (", pending_changes = 0" if reset_changes else ""),
+        (task,),
+    )
+    conn.commit()
+
+
+def reclaim_space(conn: sqlite3.Connection, log: Callable[[str], None] = print) -> None:
+    """Release free pages, switching the databank to incremental auto-vacuum first if needed.
+
+    The switch needs one full VACUUM; afterwards free pages are released
+    with ``incremental_vacuum`` in short steps that do not block readers.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        log("   🧹 Switching to incremental auto-vacuum (one full VACUUM)...")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        return
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free_pages > 0:
+        # executescript steps the pragma to completion; a cursor frees only one page
+        conn.executescript(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_STEP});")
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free_pages:
+            break
+        free_pages = remaining
+
+
+def run_maintenance(
+    conn: sqlite3.Connection,
+    thresholds: MaintenanceThresholds = MaintenanceThresholds(),
+    force: bool = False,
+    log: Callable[[str], None] = print,
+) -> List[str]:
+    """Run the maintenance tasks that are due (all of them with ``force``).
+
+    - reclaim: free pages exceed ``freelist_ratio`` and ``min_free_pages``
+    - analyze: changed rows exceed ``analyze_changes`` and ``analyze_ratio``
+      of the series rows; ``PRAGMA optimize`` runs on every pass
+    - checkpoint: the WAL file exceeds ``wal_mb``
+
+    Returns:
+        list: names of the tasks that ran
+    """
+    health = database_health(conn)
+    done: List[str] = []
+
+    if force or (
+        health["freelist_ratio"] >= thresholds.freelist_ratio
+        and health["freelist_count"] >= thresholds.min_free_pages
+    ):
+        t0 = time.perf_counter()
+        reclaim_space(conn, log)
+        _mark_run(conn, "reclaim")
+        log(f"   ✓ Reclaimed {health['freelist_count']} free page(s) in {time.perf_counter() - t0:.2f}s")
+        done.append("reclaim")
+
+    if force or (
+        health["pending_changes"] >= thresholds.analyze_changes
+        and health["pending_changes"] >= thresholds.analyze_ratio * health["series_rows"]
+    ):
+        t0 = time.perf_counter()
+        conn.execute("ANALYZE")
+        _mark_run(conn, "analyze", reset_changes=True)
+        log(f"   ✓ Analyzed after {health['pending_changes']} changed row(s) in {time.perf_counter() - t0:.2f}s")
+        done.append("analyze")
+    else:
+        conn.execute("PRAGMA optimize")
+
+    if force or health["wal_mb"] >= thresholds.wal_mb:
+        busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        _mark_run(conn, "checkpoint")
+        if busy:
+            log(f"   ⚠ WAL checkpoint blocked by readers ({checkpointed}/{wal_pages} pages copied)")
+        else:
+            log(f"   ✓ Checkpointed and truncated a {health['wal_mb']:.1f} MB WAL")
+        done.append("checkpoint")
+
+    return done
+
+
+def maintain_databank(
+    db_path: str,
+    thresholds: MaintenanceThresholds = MaintenanceThresholds(),
+    force: bool = False,
+    log: Callable[[str], None] = print,
+) -> List[str]:
+    """Open ``db_path`` and run the maintenance tasks that are due."""
+    conn = init_database(db_path)
+    try:
+        return run_maintenance(conn, thresholds, force=force, log=log)
+    finally:
+        conn.close()
+
+
+class MaintenanceScheduler(threading.Thread):
+    """Background thread that maintains every databank in a folder
+
+    Used by the web server so uploads never wait for maintenance. A
+    databank that is busy (an ingest holds the write lock) is skipped
+    until the next pass.
+    """
+
+    def __init__(
+        self,
+        databank_dir: Path = DATABANK_DIR,
+        interval: float = DEFAULT_MAINTENANCE_INTERVAL,
+        thresholds: MaintenanceThresholds = MaintenanceThresholds(),
+        log: Callable[[str], None] = print,
+    ):
+        super().__init__(name="db-maintenance", daemon=True)
+        self.databank_dir = Path(databank_dir)
+        self.interval = interval
+        self.thresholds = thresholds
+        self.log = log
+        self._stop_event = threading.Event()
+
+    def run_once(self) -> None:
+        for db_path in sorted(self.databank_dir.glob("*.db")):
+            try:
+                done = maintain_databank(str(db_path), self.thresholds, log=lambda message: None)
+            except sqlite3.OperationalError as e:
+                self.log(f"   ⚠ Maintenance of {db_path.name} postponed: {e}")
+                continue
+            if done:
+                self.log(f"   🧹 Maintained {db_path.name}: {', '.join(done)}")
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def _resolve_paths(names: Iterable[str]) -> List[str]:
+    paths = []
+    for name in names:
+        path = Path(name)
+        if not path.exists() and not path.is_absolute():
+            path = DATABANK_DIR / path.name
+        paths.append(str(path))
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the maintenance tasks (space reclaim, ANALYZE, WAL checkpoint) that are due."
+    )
+    parser.add_argument(
+        "db_paths",
+        nargs="*",
+        help="Databanks to maintain (relative names go to Databanks/; defaults to all of them).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every task regardless of thresholds.",
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Only print the numbers the thresholds are checked against.",
+    )
+    args = parser.parse_args()
+
+    db_paths = _resolve_paths(args.db_paths) or [str(path) for path in sorted(DATABANK_DIR.glob("*.db"))]
+    for db_path in db_paths:
+        if not os.path.exists(db_path):
+            print(f"Error: Database not found: {db_path}")
+            continue
+        print(f"{db_path}:")
+        if args.status:
+            conn = init_database(db_path)
+            health = database_health(conn)
+            conn.close()
+            print(f"   size {health['size_mb']:.1f} MB, {health['freelist_count']} free page(s) "
+                  f"({100 * health['freelist_ratio']:.0f}%), WAL {health['wal_mb']:.1f} MB, "
+                  f"auto_vacuum {AUTO_VACUUM_MODES.get(health['auto_vacuum'], health['auto_vacuum'])}, "
+                  f"{health['pending_changes']} row(s) changed since ANALYZE")
+            continue
+        done = maintain_databank(db_path, force=args.force)
+        if not done:
+            print("   ✓ Nothing due")
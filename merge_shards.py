@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Merge shard databanks written by process_dicom.py --shard into one database
+Each shard is attached and copied with bulk INSERT ... SELECT statements.
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Set
+
+from extract_metadata import EXTRACTION_PROFILES
+from process_dicom import DATABANK_DIR, prune_and_maintain, resolve_db_path
+from store_metadata import init_database
+
+
+def _profile_rank_sql(column: str) -> str:
+    """``profile_rank()`` as SQL; unknown or missing profiles rank as full-private."""
+    whens = " ".join(f"WHEN '{name}' THEN {rank}" for rank, name in enumerate(EXTRACTION_PROFILES))
+    return f"CASE {column} {whens} ELSE {len(EXTRACTION_PROFILES) - 1} END"
+
+
+def _shared_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Columns of ``table`` present in both the target and the attached shard (without ``id``)."""
+    main_cols = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    shard_cols = {row[1] for row in conn.execute(f"PRAGMA shard.table_info({table})")}
+    return [name for name in main_cols if name in shard_cols and name != "id"]
+
+
+def _shard_has_table(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM shard.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def merge_shard(
+    conn: sqlite3.Connection,
+    shard_path: str,
+    touched_studies: Optional[Set[str]] = None,
+) -> int:
+    """Copy one shard into the open target database; returns the series rows added.
+
+    A series present in both keeps the row with the richer extraction
+    profile (the target's on a tie). Private tags are only copied for rows
+    that came from this shard, and the ingest manifest is carried over so
+    later ``--skip-unchanged`` runs can use it. The shard's study UIDs are
+    added to ``touched_studies``.
+    """
+    conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+    try:
+        columns = ", ".join(_shared_columns(conn, "dicom_metadata"))
+        before = conn.execute("SELECT COUNT(*) FROM main.dicom_metadata").fetchone()[0]
+
+        # Series the shard holds with a richer profile replace the target's rows
+        upgraded = f"""
+            SELECT s.series_instance_uid
+            FROM shard.dicom_metadata s
+            JOIN main.dicom_metadata m ON m.series_instance_uid = s.series_instance_uid
+            WHERE {_profile_rank_sql('s.extraction_profile')} > {_profile_rank_sql('m.extraction_profile')}
+        """
+        conn.execute(f"DELETE FROM main.private_tag WHERE series_instance_uid IN ({upgraded})")
+        replaced = conn.execute(
+            f"DELETE FROM main.dicom_metadata WHERE series_instance_uid IN ({upgraded})"
+        ).rowcount
+
+        conn.execute(
+            f"INSERT OR IGNORE INTO main.dicom_metadata ({columns}) "
+            f"SELECT {columns} FROM shard.dicom_metadata"
+        )
+        added = conn.execute("SELECT COUNT(*) FROM main.dicom_metadata").fetchone()[0] - before + replaced
+        if touched_studies is not None:
+            touched_studies.update(
+                row[0] for row in conn.execute("SELECT DISTINCT study_instance_uid FROM shard.dicom_metadata")
+            )
+
+        if _shard_has_table(conn, "private_tag"):
+            tag_columns = ", ".join(_shared_columns(conn, "private_tag"))
+            conn.execute(f"""
+                INSERT OR IGNORE INTO main.private_tag ({tag_columns})
+                SELECT {', '.join('p.' + name for name in tag_columns.split(', '))}
+                FROM shard.private_tag p
+                JOIN main.dicom_metadata m
+                  ON m.series_instance_uid = p.series_instance_uid
+                 AND m.sop_instance_uid IS p.sop_instance_uid
+            """)
+
+        if _shard_has_table(conn, "ingest_manifest"):
+            manifest_columns = ", ".join(_shared_columns(conn, "ingest_manifest"))
+            conn.execute(
+                f"INSERT OR REPLACE INTO main.ingest_manifest ({manifest_columns}) "
+                f"SELECT {manifest_columns} FROM shard.ingest_manifest"
+            )
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE shard")
+    return added
+
+
+def _resolve_shard_path(name: str) -> str:
+    path = Path(name)
+    if path.exists() or path.is_absolute():
+        return str(path)
+    return str(DATABANK_DIR / path.name)
+
+
+def merge_shard_databases(
+    db_path: str,
+    shard_paths: Sequence[str],
+    verbose: bool = False,
+    log: Callable[[str], None] = print,
+) -> None:
+    """Merge shard databanks into ``db_path`` and pick representative series once.
+
+    Args:
+        db_path: Target database (created if missing; relative names go to Databanks/)
+        shard_paths: Shard databanks written by ``process_dicom.py --shard``
+        verbose: Print detailed progress
+        log: Output function for progress messages
+
+    Raises:
+        FileNotFoundError: if a shard does not exist; nothing is merged then, since
+            representatives picked without it would be wrong
+    """
+    def _vprint(message: str = "") -> None:
+        if verbose:
+            log(message)
+
+    start_time = time.perf_counter()
+    db_path = resolve_db_path(db_path)
+    shard_paths = [_resolve_shard_path(shard_path) for shard_path in shard_paths]
+    missing = [shard_path for shard_path in shard_paths if not Path(shard_path).exists()]
+    if missing:
+        raise FileNotFoundError(f"Shard(s) not found: {', '.join(missing)}")
+    conn = init_database(db_path)
+    log(f"Merging {len(shard_paths)} shard(s) into {db_path}")
+    touched_studies: Set[str] = set()
+    for shard_path in shard_paths:
+        if Path(shard_path).resolve() == Path(db_path).resolve():
+            _vprint(f"   ⚠ Skipping the target database itself: {shard_path}")
+            continue
+        t_shard = time.perf_counter()
+        added = merge_shard(conn, shard_path, touched_studies)
+        _vprint(f"   ✓ {Path(shard_path).name}: {added} series in {time.perf_counter() - t_shard:.2f}s")
+
+    # Representatives are chosen once, over every shard's series of the merged studies
+    prune_and_maintain(conn, _vprint, touched_studies)
+    conn.close()
+    log("Merge ended")
+    log(f"Elapsed time: {time.perf_counter() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge shard databanks written by process_dicom.py --shard."
+    )
+    parser.add_argument(
+        "db_path",
+        help="Target SQLite database path or name (relative names go to Databanks/).",
+    )
+    parser.add_argument(
+        "shards",
+        nargs="+",
+        help="Shard databanks to merge, e.g. Databanks/dicom_metadata.shard*of4.db.",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print detailed merge output.",
+    )
+    args = parser.parse_args()
+    try:
+        merge_shard_databases(args.db_path, args.shards, verbose=args.verbose)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
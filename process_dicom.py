@@ -7,18 +7,60 @@ Also supports ZIP and 7Z archive files
 
 import argparse
 import warnings
-import itertools
 import os
+import sys
 import tempfile
 import shutil
 import time
-import zipfile
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 import sqlite3
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from extract_metadata import extract_metadata_from_paths
-from store_metadata import init_database
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from archive_members import (
+    SEVEN_ZIP_STREAMING,
+    ArchiveError,
+    ArchiveMember,
+    archive_kind,
+    close_zip_handles,
+    iter_7z_members,
+    iter_tar_members,
+    list_7z_members,
+    list_zip_members,
+)
+from discover_files import FileRecord, discover_dicom_files, drop_duplicate_files, group_by_top_level
+from extract_metadata import (
+    ConcurrencyController,
+    DicomSource,
+    ReadOptions,
+    add_read_option_arguments,
+    iter_metadata_from_paths,
+    probe_uids_from_paths,
+    profile_rank,
+    read_options_from_args,
+)
+from ingest_report import DEFAULT_SLOWEST_FILES, IngestReport
+from maintain_db import run_maintenance
+from profiling import DEFAULT_PROFILE_PREFIX, ProfileSession
+from store_metadata import (
+    MANIFEST_NON_DICOM,
+    BloomFilter,
+    ScanCheckpoint,
+    confirm_known_series,
+    fail_run,
+    find_resumable_run,
+    finish_run,
+    init_database,
+    load_known_series,
+    load_run_checkpoints,
+    lookup_manifest,
+    record_changes,
+    record_manifest,
+    save_checkpoint,
+    start_run,
+)
 warnings.filterwarnings(
     "ignore",
     message="Invalid value for VR UI"
@@ -28,6 +70,15 @@ BASE_DIR = Path(__file__).resolve().parent
 DATABANK_DIR = BASE_DIR / "Databanks"
 DEFAULT_DB_NAME = "dicom_metadata.db"
 
+# Records checked against ingest_manifest per round of indexed lookups
+MANIFEST_LOOKUP_BATCH = 10000
+
+# Files stored between two run checkpoints of a scan
+CHECKPOINT_FILES = 256
+# Scan keys of ingest_run_scan besides subdirectory names
+ALL_FILES_SCAN_KEY = "*"
+ROOT_FILES_SCAN_KEY = "."
+
 RADIOPHARM_MODALITIES = {
     "PT",
     "PET",
@@ -141,11 +192,24 @@ def _select_representative_series(rows: List[dict]) -> List[str]:
     return [entry["series_instance_uid"] for entry in representatives.values()]
 
 
-def prune_non_representative_series(conn: sqlite3.Connection) -> int:
-    cursor = conn.execute("""
+# Study UIDs scored per round of indexed queries by an incremental prune
+PRUNE_STUDY_CHUNK = 900
+
+
+def _fetch_representative_rows(conn: sqlite3.Connection, study_uids: Optional[List[str]] = None) -> List[dict]:
+    """Rows scored by ``_select_representative_series``, optionally for some studies only."""
+    weights_where = rows_where = ""
+    params: List[str] = []
+    if study_uids is not None:
+        placeholders = ",".join("?" for _ in study_uids)
+        weights_where = f"WHERE study_instance_uid IN ({placeholders})"
+        rows_where = f"WHERE m.study_instance_uid IN ({placeholders})"
+        params = study_uids * 2
+    cursor = conn.execute(f"""
         WITH study_weights AS (
             SELECT study_instance_uid, MAX(patient_weight) AS study_patient_weight
             FROM dicom_metadata
+            {weights_where}
             GROUP BY study_instance_uid
         )
         SELECT m.series_instance_uid,
@@ -161,9 +225,90 @@ def prune_non_representative_series(conn: sqlite3.Connection) -> int:
                w.study_patient_weight
         FROM dicom_metadata m
         LEFT JOIN study_weights w ON m.study_instance_uid = w.study_instance_uid
-    """)
+        {rows_where}
+    """, params)
     columns = [col[0] for col in cursor.description]
-    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _record_pruned_series(conn: sqlite3.Connection, where: str = "1", params: Iterable[str] = ()) -> None:
+    """Remember the non-representative series about to be deleted (rows matching ``where``).
+
+    ``--skip-known-series`` then skips their files like those of stored
+    series; series that became representative are forgotten again.
+    """
+    params = list(params)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO pruned_series (series_instance_uid, study_instance_uid, extraction_profile)
+        SELECT series_instance_uid, study_instance_uid, extraction_profile FROM dicom_metadata
+        WHERE {where} AND is_representative = 0
+          AND series_instance_uid IS NOT NULL AND series_instance_uid != ''
+          AND study_instance_uid IS NOT NULL AND study_instance_uid != ''
+    """, params)
+    conn.execute(f"""
+        DELETE FROM pruned_series WHERE series_instance_uid IN (
+            SELECT series_instance_uid FROM dicom_metadata WHERE {where} AND is_representative = 1
+        )
+    """, params)
+
+
+def _prune_studies(conn: sqlite3.Connection, study_uids: Iterable[str]) -> int:
+    study_uids = sorted({study_uid for study_uid in study_uids if study_uid})
+    removed = 0
+    for i in range(0, len(study_uids), PRUNE_STUDY_CHUNK):
+        chunk = study_uids[i:i + PRUNE_STUDY_CHUNK]
+        keep_series = _select_representative_series(_fetch_representative_rows(conn, chunk))
+        placeholders = ",".join("?" for _ in chunk)
+        conn.execute(
+            f"UPDATE dicom_metadata SET is_representative = 0 WHERE study_instance_uid IN ({placeholders})",
+            chunk,
+        )
+        if keep_series:
+            conn.execute(
+                f"UPDATE dicom_metadata SET is_representative = 1 "
+                f"WHERE series_instance_uid IN ({','.join('?' for _ in keep_series)})",
+                keep_series,
+            )
+        _record_pruned_series(conn, f"study_instance_uid IN ({placeholders})", chunk)
+        conn.execute(f"""
+            DELETE FROM private_tag
+            WHERE series_instance_uid IN (
+                SELECT series_instance_uid FROM dicom_metadata
+                WHERE study_instance_uid IN ({placeholders}) AND is_representative = 0
+            )
+        """, chunk)
+        removed += conn.execute(
+            f"DELETE FROM dicom_metadata WHERE study_instance_uid IN ({placeholders}) AND is_representative = 0",
+            chunk,
+        ).rowcount
+    # Rows without UIDs are never representative; a full prune removes them too
+    conn.execute("""
+        DELETE FROM private_tag
+        WHERE series_instance_uid IN (
+            SELECT series_instance_uid FROM dicom_metadata
+            WHERE study_instance_uid IS NULL OR study_instance_uid = ''
+        )
+    """)
+    removed += conn.execute("""
+        DELETE FROM dicom_metadata
+        WHERE study_instance_uid IS NULL OR study_instance_uid = ''
+           OR series_instance_uid IS NULL OR series_instance_uid = ''
+    """).rowcount
+    return removed
+
+
+def prune_non_representative_series(conn: sqlite3.Connection, study_uids: Optional[Iterable[str]] = None) -> int:
+    """Keep one representative series per study and delete the others.
+
+    Without ``study_uids`` every row of the table is scored. With the study
+    UIDs an ingest touched, only those studies are read, scored and pruned
+    through the study UID index, so the cost follows the size of the ingest
+    instead of the database. Returns the number of series removed.
+    """
+    if study_uids is not None:
+        return _prune_studies(conn, study_uids)
+
+    rows = _fetch_representative_rows(conn)
     if not rows:
         return 0
     keep_series = _select_representative_series(rows)
@@ -179,6 +324,7 @@ def prune_non_representative_series(conn: sqlite3.Connection) -> int:
             f"UPDATE dicom_metadata SET is_representative = 1 WHERE series_instance_uid IN ({placeholders})",
             chunk,
         )
+    _record_pruned_series(conn)
     conn.execute("""
         DELETE FROM private_tag
         WHERE series_instance_uid NOT IN (
@@ -188,110 +334,498 @@ def prune_non_representative_series(conn: sqlite3.Connection) -> int:
     cursor = conn.execute("DELETE FROM dicom_metadata WHERE is_representative = 0")
     return cursor.rowcount
 
+
+def prune_and_maintain(
+    conn: sqlite3.Connection,
+    log: Callable[[str], None] = print,
+    study_uids: Optional[Iterable[str]] = None,
+    maintenance: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+    changes_before: int = 0,
+) -> int:
+    """Keep one representative series per study (all, or only ``study_uids``).
+
+    The rows this connection changed since ``conn.total_changes`` was
+    ``changes_before`` are added to the ANALYZE counter, and with
+    ``maintenance`` the maintenance tasks that are due run right away
+    (see ``maintain_db.run_maintenance``) instead of a full VACUUM. A
+    locked database postpones maintenance instead of failing.
+    ``prune_s`` and ``maintenance_s`` are stored in ``timings``.
+
+    Returns:
+        int: number of series removed
+    """
+    timings = timings if timings is not None else {}
+    t_prune = time.perf_counter()
+    if study_uids is None:
+        log("\n   🧹 Pruning non-representative series...")
+    else:
+        study_uids = set(study_uids)
+        log(f"\n   🧹 Pruning non-representative series in {len(study_uids)} touched study/studies...")
+    pruned = 0
+    try:
+        pruned = prune_non_representative_series(conn, study_uids)
+        conn.commit()
+        log(f"   ✓ Removed {pruned} non-representative series")
+    except Exception as e:
+        log(f"   ⚠ Warning: Could not prune non-representative series: {e}")
+    record_changes(conn, conn.total_changes - changes_before)
+    timings["prune_s"] = time.perf_counter() - t_prune
+    if maintenance:
+        t_maintenance = time.perf_counter()
+        try:
+            run_maintenance(conn, log=log)
+        except sqlite3.OperationalError as e:
+            log(f"   ⚠ Warning: Maintenance postponed: {e}")
+        timings["maintenance_s"] = time.perf_counter() - t_maintenance
+    return pruned
+
+
+def resolve_db_path(db_path: str) -> str:
+    """Place relative database names under Databanks/ and create the parent folder."""
+    DATABANK_DIR.mkdir(parents=True, exist_ok=True)
+    db_path_obj = Path(db_path)
+    if not db_path_obj.is_absolute():
+        db_path = str(DATABANK_DIR / db_path_obj.name)
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    return db_path
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Parse ``i/N`` (0 <= i < N) as given to ``--shard``."""
+    try:
+        index_text, count_text = text.split("/")
+        index, count = int(index_text), int(count_text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..N-1, got {text!r}")
+    return index, count
+
+
+def shard_db_path(db_path: str, shard: Tuple[int, int]) -> str:
+    """Databank name of one shard, e.g. ``dicom_metadata.shard0of4.db``."""
+    path = Path(db_path)
+    return str(path.with_name(f"{path.stem}.shard{shard[0]}of{shard[1]}{path.suffix or '.db'}"))
+
+
+def in_shard(key: str, shard: Tuple[int, int]) -> bool:
+    """Deterministic partition of top-level names (CRC32, stable across machines)."""
+    return zlib.crc32(key.encode("utf-8")) % shard[1] == shard[0]
+
+
+def source_shard_key(source: DicomSource, base_dir: Path) -> str:
+    """Top-level subdirectory (or root file name) that decides a source's shard."""
+    if isinstance(source, ArchiveMember):
+        return source.member_name.split("/", 1)[0]
+    return source.relative_to(base_dir).parts[0]
+
+
+def source_relative_path(source: DicomSource, base_dir: Path) -> str:
+    """Path stored in ``file_path``: relative to the input, or ``archive!member``."""
+    if isinstance(source, ArchiveMember):
+        return source.display_path
+    return str(source.relative_to(base_dir))
+
+
+def filter_unchanged_records(
+    conn: sqlite3.Connection,
+    records: List[FileRecord],
+    base_dir: Path,
+    min_profile: Optional[str] = None,
+) -> Tuple[List[FileRecord], int]:
+    """Drop files whose ``ingest_manifest`` entry still matches their stat data.
+
+    A file is unchanged when size, mtime_ns and inode all match the entry
+    and it was either not DICOM or extracted with at least ``min_profile``
+    (cheaper rows are re-read so they can be upgraded). The manifest is
+    queried for ``MANIFEST_LOOKUP_BATCH`` records at a time and never loaded
+    as a whole.
+
+    Returns:
+        tuple: (records_to_process, unchanged_count)
+    """
+    requested_rank = profile_rank(min_profile)
+    kept: List[FileRecord] = []
+    unchanged = 0
+    for i in range(0, len(records), MANIFEST_LOOKUP_BATCH):
+        chunk = records[i:i + MANIFEST_LOOKUP_BATCH]
+        rel_paths = [source_relative_path(record.path, base_dir) for record in chunk]
+        entries = lookup_manifest(conn, rel_paths)
+        for record, rel_path in zip(chunk, rel_paths):
+            entry = entries.get(rel_path)
+            if (
+                entry is not None
+                and entry.size == record.size
+                and entry.mtime_ns == record.mtime_ns
+                and entry.inode == record.inode
+                and (
+                    entry.series_instance_uid == MANIFEST_NON_DICOM
+                    or profile_rank(entry.extraction_profile) >= requested_rank
+                )
+            ):
+                unchanged += 1
+            else:
+                kept.append(record)
+    return kept, unchanged
+
+
+def _format_timing(label: str, value: float) -> str:
+    if label.endswith("_pct"):
+        return f"{value:.0f}%"
+    if label.endswith("_mb"):
+        return f"{value:.1f} MB"
+    return f"{value:.2f}s"
+
+
+ProbedFiles = List[Tuple[DicomSource, Optional[Tuple[Optional[str], Optional[str], Optional[str]]]]]
+
+
+def drop_known_series(
+    conn: sqlite3.Connection,
+    probed: ProbedFiles,
+    known_series: BloomFilter,
+    min_profile: Optional[str] = None,
+) -> Tuple[ProbedFiles, Dict[DicomSource, Tuple[str, Optional[str]]]]:
+    """Drop probed files whose series is already stored.
+
+    Series UIDs are checked against the ``known_series`` Bloom filter and
+    only its positives are confirmed with an indexed lookup, so new data
+    costs no queries. Unreadable files are kept for extraction to report.
+
+    Returns:
+        tuple: (kept_probed, {dropped file: (series uid, stored profile)})
+    """
+    stored = confirm_known_series(
+        conn,
+        known_series,
+        {uids[1] for _, uids in probed if uids is not None and uids[1]},
+        min_profile,
+    )
+    if not stored:
+        return probed, {}
+    kept: ProbedFiles = []
+    dropped: Dict[DicomSource, Tuple[str, Optional[str]]] = {}
+    for file_path, uids in probed:
+        series_uid = uids[1] if uids is not None else None
+        if series_uid in stored:
+            dropped[file_path] = (series_uid, stored[series_uid])
+        else:
+            kept.append((file_path, uids))
+    return kept, dropped
+
+
+def select_series_representatives(
+    dcm_files: List[DicomSource],
+    max_workers: Optional[int] = None,
+    probed: Optional[ProbedFiles] = None,
+    raw_datasets: bool = False,
+) -> Tuple[List[DicomSource], int, int]:
+    """Phase one of series-first ingest: keep one file per SeriesInstanceUID.
+
+    Only the first file (by path) of each series is kept for full extraction,
+    since ``dicom_metadata`` stores a single row per series anyway. Files
+    without a SeriesInstanceUID are passed through unchanged. ``probed``
+    reuses UIDs already probed from ``dcm_files``; otherwise they are probed
+    here (``raw_datasets`` as in ``probe_uids``).
+
+    Returns:
+        tuple: (selected_files, skipped_same_series, skipped_invalid)
+    """
+    chosen: Dict[str, DicomSource] = {}
+    passthrough: List[DicomSource] = []
+    skipped_same_series = 0
+    skipped_invalid = 0
+
+    if probed is None:
+        probed = probe_uids_from_paths(dcm_files, max_workers=max_workers, raw_datasets=raw_datasets)
+    for file_path, uids in probed:
+        if uids is None:
+            skipped_invalid += 1
+            continue
+        series_uid = uids[1]
+        if not series_uid:
+            passthrough.append(file_path)
+            continue
+        current = chosen.get(series_uid)
+        if current is None:
+            chosen[series_uid] = file_path
+            continue
+        skipped_same_series += 1
+        if str(file_path) < str(current):
+            chosen[series_uid] = file_path
+
+    return sorted(chosen.values(), key=str) + passthrough, skipped_same_series, skipped_invalid
+
+
 def process_single_scan(
     scan_dir: Path,
     conn,
     base_dir: Path,
     max_workers: Optional[int] = None,
     existing_paths: Optional[set] = None,
+    series_first: bool = False,
+    records: Optional[List[FileRecord]] = None,
+    sniff: bool = False,
+    memory_limit_mb: Optional[float] = None,
+    progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+    controller: Optional[ConcurrencyController] = None,
+    sources: Optional[Iterable[DicomSource]] = None,
+    read_options: Optional[ReadOptions] = None,
+    skip_unchanged: bool = False,
+    executor: Optional[Executor] = None,
+    checkpoint: Optional[ScanCheckpoint] = None,
+    known_series: Optional[BloomFilter] = None,
+    touched_studies: Optional[Set[str]] = None,
+    report: Optional[IngestReport] = None,
 ) -> Tuple[int, int, int, List[str], Dict[str, float]]:
-    """Process a single scan directory and store its metadata in the database."""
-    from store_metadata import insert_metadata, study_exists
+    """Process a single scan directory and store its metadata in the database.
+
+    ``records`` lets the caller pass files already found by a directory-wide
+    discovery pass; otherwise ``scan_dir`` is walked here (sniffing file
+    content when ``sniff`` is set). ``sources`` replaces both with explicit
+    files or archive members, possibly as a lazy iterator (series-first
+    selection is skipped for those). Extraction results are streamed into the
+    database in batches; ``memory_limit_mb`` bounds how many are in flight.
+    ``progress_callback(processed, total)`` is called every 10 inserted files
+    (``total`` is None for lazy sources). ``read_options`` bounds how much
+    of each header is read (see ``extract_metadata.ReadOptions``). With
+    ``skip_unchanged``, files on disk that match their ``ingest_manifest``
+    entry are skipped without being opened (counted as duplicates) and the
+    manifest is updated for the rest.
+    A shared ``controller`` adapts extraction concurrency across scans;
+    a shared ``executor`` keeps the worker processes warm between calls.
+    With ``known_series`` (see ``store_metadata.load_known_series``) every
+    file's SeriesInstanceUID is probed first and files of series already
+    stored are dropped before extraction (counted as duplicates; with
+    ``skip_unchanged`` they are added to the manifest). The studies of
+    inserted rows are added to ``touched_studies`` for an incremental prune.
+    A ``report`` receives every file's parse latency, worker utilization
+    and the skip counts (stage timings are left to the caller).
+
+    With a ``checkpoint`` the files are handled in sorted relative-path
+    order, files up to ``checkpoint.last_file`` are skipped (a resumed
+    run) and the writer commits a new checkpoint every ``CHECKPOINT_FILES``
+    files once all files before it are stored or found invalid. The scan
+    is marked completed with its last rows.
+
+    Rows are written by a ``MetadataWriter`` thread, so ``conn`` must be opened
+    with ``check_same_thread=False``. The returned timings include per-stage
+    utilization (``*_pct``) to show whether extraction or SQLite is the
+    bottleneck.
+    """
+    from store_metadata import MetadataWriter
     timings: Dict[str, float] = {}
     t0 = time.perf_counter()
+    if sniff:
+        read_options = (read_options or ReadOptions())._replace(raw_datasets=True)
 
-    dcm_files = [
-        f for f in scan_dir.rglob("*.dcm")
-        if not f.name.startswith('._') and '__MACOSX' not in str(f)
-    ]
-
-    if existing_paths:
-        filtered_files = []
-        skipped_existing = 0
-        for file_path in dcm_files:
-            rel_path = str(file_path.relative_to(base_dir))
-            if rel_path in existing_paths:
-                skipped_existing += 1
-            else:
-                filtered_files.append(file_path)
-        dcm_files = filtered_files
-    else:
-        skipped_existing = 0
+    # Lazy sources (streamed archive members) are filtered and counted on the fly
+    counts = {"seen": 0, "existing": 0}
+    manifest_stats: Dict[Path, Tuple[int, int, int]] = {}
+
+    if sources is None:
+        if records is None:
+            records = discover_dicom_files(scan_dir, sniff=sniff)
+        if skip_unchanged:
+            t_manifest = time.perf_counter()
+            requested_profile = (read_options or ReadOptions()).profile
+            records, unchanged = filter_unchanged_records(conn, records, base_dir, requested_profile)
+            counts["existing"] += unchanged
+            manifest_stats = {record.path: (record.size, record.mtime_ns, record.inode) for record in records}
+            timings["manifest_lookup_s"] = time.perf_counter() - t_manifest
+        sources = [record.path for record in records]
 
-    if not dcm_files:
-        return 0, 0, 0, [], timings
+    def _counted(items: Iterable[DicomSource]) -> Iterator[DicomSource]:
+        for item in items:
+            counts["seen"] += 1
+            if existing_paths and source_relative_path(item, base_dir) in existing_paths:
+                counts["existing"] += 1
+                continue
+            yield item
+
+    if isinstance(sources, list):
+        dcm_files: Iterable[DicomSource] = list(_counted(sources))
+        if not dcm_files:
+            if checkpoint is not None:
+                save_checkpoint(conn, checkpoint._replace(completed=True))
+            if report is not None:
+                report.add_count("duplicates", counts["existing"])
+                report.add_count("skipped_existing", counts["existing"])
+            return 0, counts["existing"], 0, [], timings
+    else:
+        dcm_files = _counted(sources)
 
     timings["scan_dicom_files_s"] = time.perf_counter() - t0
 
-    t_extract = time.perf_counter()
-    metadata_entries = extract_metadata_from_paths(
-        dcm_files,
-        max_workers=max_workers,
-    )
-    timings["extract_metadata_s"] = time.perf_counter() - t_extract
-    skipped_invalid = len(dcm_files) - len(metadata_entries)
-
-    processed = 0
-    skipped_duplicates = skipped_existing
-    new_studies = set()
-    seen_studies = set()
-
-    batch_metadata = []
-    batch_paths = []
-    batch_size = 500
-    t_insert = time.perf_counter()
-
-    for file_path, meta in metadata_entries:
-        if meta.study_instance_uid and meta.study_instance_uid not in seen_studies:
-            seen_studies.add(meta.study_instance_uid)
-            if not study_exists(conn, meta.study_instance_uid):
-                new_studies.add(meta.study_instance_uid)
-
-        rel_path = str(file_path.relative_to(base_dir))
-        batch_metadata.append(meta)
-        batch_paths.append(rel_path)
-
-        if len(batch_metadata) >= batch_size:
-            for meta_item, file_path_str in zip(batch_metadata, batch_paths):
-                inserted, reason = insert_metadata(
-                    conn,
-                    meta_item,
-                    file_path_str,
-                    skip_existing=True,
-                    commit=False,
-                )
-                if inserted:
-                    processed += 1
-                elif reason in ("series_exists", "already_exists"):
-                    skipped_duplicates += 1
-                else:
-                    skipped_invalid += 1
-            conn.commit()
-            batch_metadata.clear()
-            batch_paths.clear()
-
-    if batch_metadata:
-        for meta_item, file_path_str in zip(batch_metadata, batch_paths):
-            inserted, reason = insert_metadata(
-                conn,
-                meta_item,
-                file_path_str,
-                skip_existing=True,
-                commit=False,
+    skipped_same_series = 0
+    skipped_probe_invalid = 0
+    skipped_known_series = 0
+    # An empty filter (new database) cannot drop anything, so the probe is skipped
+    filter_known = known_series is not None and len(known_series) > 0
+    if (series_first or filter_known) and isinstance(dcm_files, list):
+        t_probe = time.perf_counter()
+        probed = probe_uids_from_paths(
+            dcm_files,
+            max_workers=max_workers,
+            executor=executor,
+            raw_datasets=(read_options or ReadOptions()).raw_datasets,
+        )
+        if filter_known:
+            requested_profile = (read_options or ReadOptions()).profile
+            probed, dropped = drop_known_series(conn, probed, known_series, requested_profile)
+            skipped_known_series = len(dropped)
+            if manifest_stats and dropped:
+                # The writer is not running yet, so the manifest is written directly
+                record_manifest(conn, [
+                    (source_relative_path(file_path, base_dir), *manifest_stats[file_path], *stored)
+                    for file_path, stored in dropped.items()
+                    if file_path in manifest_stats
+                ])
+        if series_first:
+            dcm_files, skipped_same_series, skipped_probe_invalid = select_series_representatives(
+                dcm_files,
+                max_workers=max_workers,
+                probed=probed,
             )
-            if inserted:
-                processed += 1
-            elif reason in ("series_exists", "already_exists"):
-                skipped_duplicates += 1
-            else:
-                skipped_invalid += 1
-        conn.commit()
+        else:
+            dcm_files = [file_path for file_path, _ in probed]
+        timings["probe_series_s"] = time.perf_counter() - t_probe
+
+    # Checkpoints need a stable order, so files are handled by sorted relative path
+    checkpoint_paths: List[str] = []
+    checkpoint_index: Dict[DicomSource, int] = {}
+    if checkpoint is not None and isinstance(dcm_files, list):
+        keyed = sorted(
+            ((source_relative_path(item, base_dir), item) for item in dcm_files),
+            key=lambda pair: pair[0],
+        )
+        if checkpoint.last_file is not None:
+            resumed = [pair for pair in keyed if pair[0] > checkpoint.last_file]
+            counts["existing"] += len(keyed) - len(resumed)
+            keyed = resumed
+        checkpoint_paths = [rel_path for rel_path, _ in keyed]
+        dcm_files = [item for _, item in keyed]
+        checkpoint_index = {item: index for index, item in enumerate(dcm_files)}
+
+    total_files = len(dcm_files) if isinstance(dcm_files, list) else None
+    submitted_files = total_files if total_files is not None else 0
+
+    extracted = 0
+    writer = MetadataWriter(
+        conn,
+        progress_callback=(
+            (lambda inserted: progress_callback(inserted, total_files))
+            if progress_callback else None
+        ),
+    ).start()
+    extract_stats: Dict[str, float] = {}
+
+    # Extraction and insertion overlap: the writer thread commits while workers parse
+    done = bytearray(len(checkpoint_paths))
+    watermark = {"done": 0, "saved": 0}
+
+    def _mark_done(file_path: DicomSource) -> None:
+        index = checkpoint_index.get(file_path)
+        if index is None:
+            return
+        done[index] = 1
+        position = watermark["done"]
+        while position < len(done) and done[position]:
+            position += 1
+        watermark["done"] = position
+        if position - watermark["saved"] >= CHECKPOINT_FILES:
+            watermark["saved"] = position
+            writer.put_checkpoint(checkpoint._replace(
+                last_file=checkpoint_paths[position - 1],
+                files_done=checkpoint.files_done + position,
+            ))
+
+    def _on_invalid(file_path: DicomSource) -> None:
+        file_stat = manifest_stats.get(file_path)
+        if file_stat is not None:
+            writer.put_non_dicom(source_relative_path(file_path, base_dir), file_stat)
+        _mark_done(file_path)
+
+    on_timing = None
+    if report is not None:
+        file_sizes = {record.path: record.size for record in records or ()}
 
-    timings["insert_metadata_s"] = time.perf_counter() - t_insert
+        def on_timing(file_path: DicomSource, seconds: float) -> None:
+            size = file_sizes.get(file_path) or getattr(file_path, "size", 0)
+            report.record_file(source_relative_path(file_path, base_dir), seconds, size)
+
+    t_extract = time.perf_counter()
+    try:
+        for file_path, meta in iter_metadata_from_paths(
+            dcm_files,
+            max_workers=max_workers,
+            memory_limit_mb=memory_limit_mb,
+            controller=controller,
+            stats=extract_stats,
+            read_options=read_options,
+            on_invalid=_on_invalid if manifest_stats or checkpoint_index else None,
+            executor=executor,
+            on_timing=on_timing,
+        ):
+            extracted += 1
+            writer.put(meta, source_relative_path(file_path, base_dir), manifest_stats.get(file_path))
+            _mark_done(file_path)
+        if checkpoint is not None:
+            handled = len(checkpoint_paths) if checkpoint_index else counts["seen"]
+            writer.put_checkpoint(checkpoint._replace(
+                last_file=checkpoint_paths[-1] if checkpoint_paths else checkpoint.last_file,
+                files_done=checkpoint.files_done + handled,
+                completed=True,
+            ))
+    finally:
+        extract_elapsed = time.perf_counter() - t_extract
+        t_flush = time.perf_counter()
+        writer.close()
+        flush_elapsed = time.perf_counter() - t_flush
+        if touched_studies is not None:
+            touched_studies.update(writer.touched_studies)
+
+    if total_files is None:
+        submitted_files = counts["seen"] - counts["existing"]
+    skipped_existing = counts["existing"]
+
+    processed = writer.inserted
+    skipped_duplicates = skipped_existing + skipped_same_series + skipped_known_series + writer.skipped_duplicates
+    skipped_invalid = skipped_probe_invalid + writer.skipped_invalid + submitted_files - extracted
+    new_studies = writer.new_studies
+
+    timings["extract_metadata_s"] = extract_elapsed
+    timings["writer_flush_s"] = flush_elapsed
+    workers = extract_stats.get("workers", 0)
+    if workers and extract_elapsed > 0:
+        timings["extract_utilization_pct"] = (
+            100.0 * extract_stats["worker_busy_s"] / (workers * extract_elapsed)
+        )
+    timings["header_read_mb"] = extract_stats.get("header_bytes_read", 0) / (1024 * 1024)
+    timings.update(writer.stats())
+
+    if report is not None:
+        report.add_workers(workers, extract_stats.get("worker_busy_s", 0.0), extract_elapsed)
+        report.add_count("processed", processed)
+        report.add_count("duplicates", skipped_duplicates)
+        report.add_count("invalid", skipped_invalid)
+        report.add_count("skipped_existing", skipped_existing)
+        report.add_count("skipped_same_series", skipped_same_series)
+        report.add_count("skipped_known_series", skipped_known_series)
+        report.add_count("upgraded", writer.upgraded)
 
     return processed, skipped_duplicates, skipped_invalid, list(new_studies), timings
 
 
+def extraction_pool_size(max_workers: Optional[int] = None, auto_workers: bool = True) -> int:
+    """Worker processes a run needs at most: ``max_workers``, else the adaptive controller's ceiling."""
+    if max_workers:
+        return max_workers
+    cpu_count = os.cpu_count() or 4
+    return min(32, cpu_count * 2) if auto_workers else min(32, cpu_count)
+
+
 def process_directory(
     dicom_dir: str,
     db_path: str = DEFAULT_DB_NAME,
@@ -301,6 +835,19 @@ def process_directory(
     verbose: bool = False,
     skip_existing_paths: bool = False,
     auto_workers: bool = True,
+    series_first: bool = False,
+    sniff: bool = False,
+    memory_limit_mb: Optional[float] = None,
+    read_options: Optional[ReadOptions] = None,
+    skip_unchanged: bool = False,
+    resume: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    dedupe: bool = False,
+    skip_known_series: bool = False,
+    maintenance: bool = True,
+    report_path: Optional[str] = None,
+    report_slowest: int = DEFAULT_SLOWEST_FILES,
+    executor: Optional[Executor] = None,
 ):
     """Process all DICOM files in a directory, ZIP, or 7Z file and store metadata.
     
@@ -311,16 +858,45 @@ def process_directory(
         max_workers: Maximum number of workers to use for metadata extraction
         timing: Print timing information after processing
         skip_existing_paths: If True, skip files whose relative paths already exist in the database
-        auto_workers: If True, benchmark a small sample to pick worker count
+        auto_workers: If True, adapt extraction concurrency to measured throughput while running
+        series_first: If True, probe UIDs first and fully parse only one file per series
+        sniff: If True, also detect DICOM files without a .dcm extension by their content
+        memory_limit_mb: Approximate ceiling for extraction results held in memory
+        read_options: Deferred-read settings bounding how much of each header is read
+        skip_unchanged: If True, skip files whose size, mtime and inode match the ingest manifest
+            (only recorded by runs with this option; archive members are always read)
+        resume: If True, continue the latest unfinished run over the same input from its
+            last checkpoint instead of starting a new run
+        shard: (index, count) to only process the top-level subdirectories (or archive
+            folders) hashed to this shard, into its own shard databank without pruning;
+            combine the shards with merge_shards.py
+        dedupe: If True, parse only one of several identical file copies anywhere in the
+            tree (same size and head/tail fingerprint, confirmed by a full hash); archive
+            members are not deduplicated
+        skip_known_series: If True, probe each file's SeriesInstanceUID and drop files of
+            series already stored (checked with an in-memory Bloom filter) before extraction
+        maintenance: If True, run the database maintenance tasks that are due after pruning
+            (space reclaim, ANALYZE, WAL checkpoint); otherwise leave them to maintain_db.py
+        report_path: Write a JSON metrics report here ("-" for stdout): stage durations,
+            throughput, utilization, per-file latency histogram, counts and the
+            ``report_slowest`` slowest files
+        executor: Process pool shared by every scan instead of one pool per scan (left
+            running); it should have ``extraction_pool_size(max_workers, auto_workers)`` workers.
+            Runs that probe UIDs (``series_first``, ``skip_known_series``) create one otherwise
+
+    Raises:
+        ArchiveError: if ``dicom_dir`` is an archive that is corrupt, truncated or cannot
+            be unpacked (TAR archives are streamed, so they fail where the damage starts)
     """
     dicom_path = Path(dicom_dir)
+    source_key = str(dicom_path.resolve())
     start_time = time.perf_counter()
-
-    DATABANK_DIR.mkdir(parents=True, exist_ok=True)
-    db_path_obj = Path(db_path)
-    if not db_path_obj.is_absolute():
-        db_path = str(DATABANK_DIR / db_path_obj.name)
-    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    if sniff:
+        # Sniffed files may be datasets written without preamble
+        read_options = (read_options or ReadOptions())._replace(raw_datasets=True)
+    if shard is not None:
+        db_path = shard_db_path(db_path, shard)
+    db_path = resolve_db_path(db_path)
 
     def _print_timing(extra_timings: Optional[Dict[str, float]] = None):
         nonlocal start_time
@@ -330,63 +906,80 @@ def process_directory(
         print(f"Elapsed time: {elapsed:.2f}s")
         if timing and extra_timings:
             for label, seconds in extra_timings.items():
-                print(f"{label}: {seconds:.2f}s")
+                print(f"{label}: {_format_timing(label, seconds)}")
         start_time = None
 
     def _vprint(message: str = "") -> None:
         if verbose:
             print(message)
 
-    def _sample_dicom_files(sample_root: Path, limit: int = 200) -> List[Path]:
-        if not sample_root.is_dir():
-            return []
-        sample: List[Path] = []
-        for file_path in itertools.islice(sample_root.rglob("*.dcm"), limit * 10):
-            if file_path.name.startswith("._") or "__MACOSX" in str(file_path):
-                continue
-            sample.append(file_path)
-            if len(sample) >= limit:
-                break
-        return sample
+    report = IngestReport(slowest=report_slowest) if report_path else None
+
+    def _write_report() -> None:
+        if report is None:
+            return
+        report.add_timings(extract_timings)
+        report.write(
+            report_path,
+            source=str(dicom_dir),
+            database=db_path,
+            options={
+                "extraction_profile": (read_options or ReadOptions()).profile,
+                "max_workers": max_workers,
+                "series_first": series_first,
+                "sniff": sniff,
+                "skip_unchanged": skip_unchanged,
+                "skip_known_series": skip_known_series,
+                "dedupe": dedupe,
+                "resume": resume,
+                "shard": f"{shard[0]}/{shard[1]}" if shard is not None else None,
+            },
+        )
+        if report_path != "-":
+            _vprint(f"   📊 Report written to: {report_path}")
 
-    def _auto_tune_workers(sample_paths: List[Path]) -> Optional[int]:
-        if not sample_paths:
-            return None
-        cpu_count = os.cpu_count() or 4
-        max_cap = min(cpu_count, 32, len(sample_paths))
-        candidates = [w for w in (1, 2, 4, 8, 16, 32) if w <= max_cap]
-        if max_cap not in candidates:
-            candidates.append(max_cap)
-        candidates = sorted(set(candidates))
-        best_workers = candidates[0]
-        best_time = float("inf")
-        _vprint(f"   Auto-tuning workers using {len(sample_paths)} sample files...")
-        for workers in candidates:
-            t0 = time.perf_counter()
-            extract_metadata_from_paths(
-                sample_paths,
-                max_workers=workers,
-            )
-            elapsed = time.perf_counter() - t0
-            _vprint(f"   - {workers} workers: {elapsed:.2f}s")
-            if elapsed < best_time:
-                best_time = elapsed
-                best_workers = workers
-        _vprint(f"   Auto-tune selected {best_workers} workers")
-        return best_workers
-    
     if not dicom_path.exists():
         _vprint(f"Error: Path {dicom_dir} does not exist")
         return
 
     print(f"Starting processing: {dicom_path}")
     
-    # Check if input is a ZIP or 7Z file
+    # Check if input is an archive file
     temp_extract_dir = None
+    archive_sources: Optional[Iterable[DicomSource]] = None
     extract_timings: Dict[str, float] = {}
     if dicom_path.is_file():
-        filename_lower = dicom_path.name.lower()
-        if filename_lower.endswith('.zip') or filename_lower.endswith('.7z'):
+        kind = archive_kind(dicom_path)
+        if kind is not None and (kind != "7z" or SEVEN_ZIP_STREAMING):
+            # Members are read in place; nothing is written to disk
+            _vprint(f"📦 Detected archive file: {dicom_path.name}")
+            _vprint(f"   Reading members directly from the archive...")
+            if kind == "tar":
+                archive_sources = iter_tar_members(dicom_path, sniff=sniff)
+            else:
+                t_archive = time.perf_counter()
+                try:
+                    if kind == "zip":
+                        archive_sources = list_zip_members(dicom_path, sniff=sniff)
+                    else:
+                        # Filter by name/size from the 7Z header, then decode only those members
+                        members = list_7z_members(dicom_path, sniff=sniff)
+                        if shard is not None:
+                            members = [m for m in members if in_shard(source_shard_key(m, dicom_path), shard)]
+                        _vprint(f"   📄 {len(members)} candidate member(s) in 7Z archive")
+                        archive_sources = iter_7z_members(dicom_path, members)
+                except Exception as e:
+                    # A corrupt or truncated archive is an error for the caller, not an empty input
+                    raise ArchiveError(f"Cannot read {dicom_path.name}: {e}") from e
+                extract_timings["archive_list_s"] = time.perf_counter() - t_archive
+            if shard is not None and kind == "zip":
+                archive_sources = [m for m in archive_sources if in_shard(source_shard_key(m, dicom_path), shard)]
+            elif shard is not None and kind == "tar":
+                archive_sources = (
+                    m for m in archive_sources if in_shard(source_shard_key(m, dicom_path), shard)
+                )
+        elif kind == "7z":
+            # Without py7zr the external 7z binary unpacks to a temp folder
             _vprint(f"📦 Detected archive file: {dicom_path.name}")
             _vprint(f"   Extracting to temporary directory...")
             
@@ -394,406 +987,367 @@ def process_directory(
             temp_extract_dir = tempfile.mkdtemp(prefix='dicom_process_')
             extract_dir = Path(temp_extract_dir)
             
+            t_archive = time.perf_counter()
+            import subprocess
             try:
-                t_archive = time.perf_counter()
-                if filename_lower.endswith('.zip'):
-                    # Extract ZIP file
-                    with zipfile.ZipFile(dicom_path, 'r') as zip_ref:
-                        zip_ref.extractall(extract_dir)
-                    _vprint(f"   ✓ Extracted ZIP file")
-                elif filename_lower.endswith('.7z'):
-                    # Extract 7Z file
-                    try:
-                        import py7zr  # type: ignore[import]
-                        with py7zr.SevenZipFile(dicom_path, mode='r') as archive:
-                            archive.extractall(extract_dir)
-                        _vprint(f"   ✓ Extracted 7Z file")
-                    except ImportError:
-                        # Fallback to system 7z command
-                        import subprocess
-                        result = subprocess.run(
-                            ['7z', 'x', str(dicom_path), '-o' + str(extract_dir), '-y'],
-                            capture_output=True,
-                            text=True
-                        )
-                        if result.returncode != 0:
-                            _vprint(f"   ✗ Error: Failed to extract 7Z file")
-                            _vprint(f"   Install py7zr: pip install py7zr")
-                            _vprint(f"   Or ensure system 7z command is available")
-                            try:
-                                shutil.rmtree(temp_extract_dir)
-                            except:
-                                pass
-                        _print_timing()
-                        return
-                        _vprint(f"   ✓ Extracted 7Z file (using system 7z)")
-                extract_timings["archive_extract_s"] = time.perf_counter() - t_archive
-                
-                # Update path to extracted directory
-                dicom_path = extract_dir
-                _vprint()
-            except Exception as e:
-                _vprint(f"   ✗ Error extracting archive: {e}")
+                result = subprocess.run(
+                    ['7z', 'x', str(dicom_path), '-o' + str(extract_dir), '-y'],
+                    capture_output=True,
+                    text=True
+                )
+                failed = result.returncode != 0
+            except OSError:
+                failed = True
+            if failed:
                 try:
                     shutil.rmtree(temp_extract_dir)
                 except:
                     pass
-                return
+                raise ArchiveError(
+                    f"Failed to extract {dicom_path.name}; install py7zr (pip install py7zr) "
+                    "or the system 7z command"
+                )
+            _vprint(f"   ✓ Extracted 7Z file (using system 7z)")
+            extract_timings["archive_extract_s"] = time.perf_counter() - t_archive
+            
+            # Update path to extracted directory
+            dicom_path = extract_dir
+            _vprint()
     
     # Now process as a directory (original logic continues)
     
     # Initialize database
-    conn = init_database(db_path)
+    conn = init_database(db_path, check_same_thread=False)
+    run_id = None
+    owned_executor = None
+    try:
+        # Every run is checkpointed; --resume continues the latest unfinished one
+        run_id = find_resumable_run(conn, source_key) if resume else None
+        resumed = run_id is not None
+        scan_checkpoints: Dict[str, ScanCheckpoint] = {}
+        if run_id is not None:
+            scan_checkpoints = load_run_checkpoints(conn, run_id)
+            completed_scans = sum(1 for checkpoint in scan_checkpoints.values() if checkpoint.completed)
+            _vprint(f"↩️  Resuming run {run_id}: {completed_scans} scan(s) already completed")
+        else:
+            if resume:
+                _vprint("ℹ️  No unfinished run to resume, starting a new one")
+            run_id = start_run(conn, source_key, (read_options or ReadOptions()).profile)
+
+        # Only studies this run inserted into need their representative re-chosen
+        touched_studies: Set[str] = set()
+        known_series = None
+        if skip_known_series:
+            t_known = time.perf_counter()
+            known_series = load_known_series(conn, (read_options or ReadOptions()).profile)
+            extract_timings["load_known_series_s"] = time.perf_counter() - t_known
+            _vprint(f"🔎 {len(known_series)} stored series in the known-series filter "
+                    f"({len(known_series.bits) / 1024:.0f} KB)")
+
+        def _scan_checkpoint(scan_key: str) -> ScanCheckpoint:
+            return scan_checkpoints.get(scan_key) or ScanCheckpoint(run_id, scan_key)
+
+        # Walk the tree once; every later stage works from these records
+        all_records: List[FileRecord] = []
+        duplicate_copies = 0
+        root_records: List[FileRecord] = []
+        subdir_records: Dict[str, List[FileRecord]] = {}
+        if archive_sources is None:
+            t_discover = time.perf_counter()
+            all_records = discover_dicom_files(dicom_path, sniff=sniff)
+            if shard is not None:
+                all_records = [r for r in all_records if in_shard(source_shard_key(r.path, dicom_path), shard)]
+            extract_timings["discover_files_s"] = time.perf_counter() - t_discover
+            if dedupe:
+                # Copies under different top-level folders are found too, so this runs tree-wide
+                t_dedupe = time.perf_counter()
+                all_records, duplicate_copies = drop_duplicate_files(all_records)
+                extract_timings["dedupe_s"] = time.perf_counter() - t_dedupe
+                if report is not None:
+                    report.add_count("duplicate_copies", duplicate_copies)
+                if duplicate_copies:
+                    _vprint(f"🔁 Skipping {duplicate_copies} duplicate file copies (same size and content)")
+            root_records, subdir_records = group_by_top_level(dicom_path, all_records)
+
+        # Concurrency is tuned online while the files are extracted
+        controller = None
+        if auto_workers and max_workers is None:
+            controller = ConcurrencyController(
+                max_limit=extraction_pool_size(max_workers, auto_workers), initial=os.cpu_count() or 4
+            )
 
-    if auto_workers and max_workers is None:
-        sample_paths = _sample_dicom_files(dicom_path)
-        tuned_workers = _auto_tune_workers(sample_paths)
-        if tuned_workers:
-            max_workers = tuned_workers
+        # Probing runs reuse one pool for the probe and extraction phases of every scan
+        # (workers are only started on the first submit)
+        if executor is None and (series_first or skip_known_series):
+            owned_executor = executor = ProcessPoolExecutor(
+                max_workers=extraction_pool_size(max_workers, auto_workers)
+            )
     
-    existing_paths = None
-    if skip_existing_paths:
-        rows = conn.execute("SELECT file_path FROM dicom_metadata").fetchall()
-        existing_paths = {row[0] for row in rows}
+        existing_paths = None
+        if skip_existing_paths:
+            # Rows from a cheaper extraction profile are re-read so they can be upgraded
+            requested_rank = profile_rank((read_options or ReadOptions()).profile)
+            rows = conn.execute("SELECT file_path, extraction_profile FROM dicom_metadata").fetchall()
+            existing_paths = {row[0] for row in rows if profile_rank(row[1]) >= requested_rank}
+
+        def _process_all_files(sources: Optional[Iterable[DicomSource]] = None) -> bool:
+            """Process every discovered file (or ``sources``) as one scan; False if there was nothing to do."""
+            if sources is None and not all_records:
+                _vprint("   ⚠️  No DICOM files found")
+                # Nothing is left to resume, so the run is complete
+                finish_run(conn, run_id)
+                _write_report()
+                _print_timing()
+                return False
 
-    # Check if directory contains subdirectories (works with any directory names)
-    subdirs = [d for d in dicom_path.iterdir() if d.is_dir() and not d.name.startswith('.')]
+            if sources is None:
+                _vprint(f"   📄 Found {len(all_records)} DICOM files")
+            elif isinstance(sources, list):
+                _vprint(f"   📄 Found {len(sources)} DICOM members")
+            checkpoint = _scan_checkpoint(ALL_FILES_SCAN_KEY)
+            if checkpoint.completed:
+                _vprint("   ✓ Already completed before resuming")
+                return True
+            # Archive members are stored as archive!member, so base_dir is the archive's folder
+            scan_dir = dicom_path if sources is None else dicom_path.parent
+            processed, skipped_duplicates, skipped_invalid, _, scan_timings = process_single_scan(
+                scan_dir,
+                conn,
+                scan_dir,
+                max_workers=max_workers,
+                existing_paths=existing_paths,
+                series_first=series_first,
+                records=all_records,
+                sources=sources,
+                memory_limit_mb=memory_limit_mb,
+                controller=controller,
+                executor=executor,
+                read_options=read_options,
+                skip_unchanged=skip_unchanged,
+                checkpoint=checkpoint,
+                known_series=known_series,
+                touched_studies=touched_studies,
+                report=report,
+                progress_callback=lambda done, total: _vprint(f"   ✓ Processed {done}/{total or '?'} files..."),
+            )
+            extract_timings.update(scan_timings)
+
+            if skipped_duplicates > 0:
+                _vprint(f"   ⚠️  Skipped {skipped_duplicates} duplicate files")
+            if skipped_invalid > 0:
+                _vprint(f"   ⚠️  Skipped {skipped_invalid} invalid files")
+            if duplicate_copies > 0:
+                _vprint(f"   ⚠️  Skipped {duplicate_copies} duplicate file copies")
+
+            _vprint(f"   ✅ Added {processed} new files to database")
+            return True
+
+        # Check if directory contains subdirectories (works with any directory names)
+        subdirs = [] if archive_sources is not None else [
+            d for d in dicom_path.iterdir()
+            if d.is_dir() and not d.name.startswith('.') and (shard is None or in_shard(d.name, shard))
+        ]
     
-    # Decide whether to process subdirectories or files directly
-    if process_subdirs and subdirs:
-        # Check if subdirectories contain DICOM files (generic check - works with any directory names)
-        has_dicom_in_subdirs = False
-        for subdir in subdirs:
-            dcm_check = list(subdir.rglob("*.dcm"))
-            if dcm_check:
-                # Filter out macOS metadata files
-                valid_dcm = [f for f in dcm_check if not f.name.startswith('._') and '__MACOSX' not in str(f)]
-                if valid_dcm:
-                    has_dicom_in_subdirs = True
-                    break
+        # Decide whether to process subdirectories or files directly
+        if archive_sources is not None:
+            # Archives are processed as a single scan, streaming members to the workers
+            _vprint(f"📂 Processing DICOM files in archive: {dicom_path.name}")
+            if not _process_all_files(archive_sources):
+                return
+        elif process_subdirs and subdirs:
+            # Check if subdirectories contain DICOM files (generic check - works with any directory names)
+            has_dicom_in_subdirs = any(subdir_records.get(subdir.name) for subdir in subdirs)
         
-        if has_dicom_in_subdirs:
-            # Process each subdirectory as a separate scan
-            _vprint(f"📂 Processing multiple scans in: {dicom_path}")
-            _vprint(f"   Found {len(subdirs)} subdirectories\n")
+            if has_dicom_in_subdirs:
+                # Process each subdirectory as a separate scan
+                _vprint(f"📂 Processing multiple scans in: {dicom_path}")
+                _vprint(f"   Found {len(subdirs)} subdirectories\n")
             
-            total_processed = 0
-            total_skipped_duplicates = 0
-            total_skipped_invalid = 0
-            total_existing_studies = 0
+                total_processed = 0
+                total_skipped_duplicates = 0
+                total_skipped_invalid = 0
+                total_existing_studies = 0
             
-            # First, check if there are DICOM files directly in the root directory
-            root_dcm_files = [
-                f for f in dicom_path.glob("*.dcm")
-                if not f.name.startswith('._') and '__MACOSX' not in str(f)
-            ]
+                # First, check if there are DICOM files directly in the root directory
+                root_dcm_files = root_records
             
-            if root_dcm_files:
-                _vprint(f"   [0/{len(subdirs)+1}] Processing root directory files ({len(root_dcm_files)} file(s))")
-                processed, skipped_dup, skipped_inv, new_studies, scan_timings = process_single_scan(
-                    dicom_path,
-                    conn,
-                    dicom_path,
-                    max_workers=max_workers,
-                    existing_paths=existing_paths,
-                )
-                if timing and scan_timings:
-                    _vprint(f"      ⏱️ scan timings:")
-                    for label, seconds in scan_timings.items():
-                        _vprint(f"         - {label}: {seconds:.2f}s")
-                total_processed += processed
-                total_skipped_duplicates += skipped_dup
-                total_skipped_invalid += skipped_inv
+                root_checkpoint = _scan_checkpoint(ROOT_FILES_SCAN_KEY)
+                if root_dcm_files and root_checkpoint.completed:
+                    _vprint(f"   [0/{len(subdirs)+1}] Root directory files already completed before resuming\n")
+                elif root_dcm_files:
+                    _vprint(f"   [0/{len(subdirs)+1}] Processing root directory files ({len(root_dcm_files)} file(s))")
+                    processed, skipped_dup, skipped_inv, new_studies, scan_timings = process_single_scan(
+                        dicom_path,
+                        conn,
+                        dicom_path,
+                        max_workers=max_workers,
+                        existing_paths=existing_paths,
+                        series_first=series_first,
+                        records=root_records,
+                        memory_limit_mb=memory_limit_mb,
+                        controller=controller,
+                        executor=executor,
+                        read_options=read_options,
+                        skip_unchanged=skip_unchanged,
+                        checkpoint=root_checkpoint,
+                        known_series=known_series,
+                        touched_studies=touched_studies,
+                        report=report,
+                    )
+                    if report is not None:
+                        report.add_timings(scan_timings)
+                    if timing and scan_timings:
+                        _vprint(f"      ⏱️ scan timings:")
+                        for label, seconds in scan_timings.items():
+                            _vprint(f"         - {label}: {_format_timing(label, seconds)}")
+                    total_processed += processed
+                    total_skipped_duplicates += skipped_dup
+                    total_skipped_invalid += skipped_inv
                 
-                status_parts = []
-                if processed > 0:
-                    if new_studies:
-                        status_parts.append(f"Added {processed} new files ({len(new_studies)} new study/studies)")
-                    else:
-                        status_parts.append(f"Added {processed} new series to existing study/studies")
+                    status_parts = []
+                    if processed > 0:
+                        if new_studies:
+                            status_parts.append(f"Added {processed} new files ({len(new_studies)} new study/studies)")
+                        else:
+                            status_parts.append(f"Added {processed} new series to existing study/studies")
                 
-                if skipped_dup > 0:
-                    if processed == 0:
-                        status_parts.append(f"All series already exist, skipped {skipped_dup} files")
-                    else:
-                        status_parts.append(f"Skipped {skipped_dup} duplicate series")
+                    if skipped_dup > 0:
+                        if processed == 0:
+                            status_parts.append(f"All series already exist, skipped {skipped_dup} files")
+                        else:
+                            status_parts.append(f"Skipped {skipped_dup} duplicate series")
                 
-                if skipped_inv > 0:
-                    status_parts.append(f"Skipped {skipped_inv} invalid files")
+                    if skipped_inv > 0:
+                        status_parts.append(f"Skipped {skipped_inv} invalid files")
                 
-                if status_parts:
-                    _vprint(f"      ✓ {' | '.join(status_parts)}")
-                else:
-                    _vprint(f"      ✓ Processed {processed} files")
-                _vprint()  # Blank line before subdirectories
+                    if status_parts:
+                        _vprint(f"      ✓ {' | '.join(status_parts)}")
+                    else:
+                        _vprint(f"      ✓ Processed {processed} files")
+                    _vprint()  # Blank line before subdirectories
             
-            # Process each subdirectory as a separate scan
-            for idx, scan_dir in enumerate(subdirs, 1):
-                offset = 1 if root_dcm_files else 0
-                _vprint(f"   [{idx+offset}/{len(subdirs)+offset}] Processing: {scan_dir.name}")
-                processed, skipped_dup, skipped_inv, new_studies, scan_timings = process_single_scan(
-                    scan_dir,
-                    conn,
-                    dicom_path,
-                    max_workers=max_workers,
-                    existing_paths=existing_paths,
-                )
-                if timing and scan_timings:
-                    _vprint(f"      ⏱️ scan timings:")
-                    for label, seconds in scan_timings.items():
-                        _vprint(f"         - {label}: {seconds:.2f}s")
-                total_processed += processed
-                total_skipped_duplicates += skipped_dup
-                total_skipped_invalid += skipped_inv
+                # Process each subdirectory as a separate scan
+                for idx, scan_dir in enumerate(subdirs, 1):
+                    offset = 1 if root_dcm_files else 0
+                    scan_checkpoint = _scan_checkpoint(scan_dir.name)
+                    if scan_checkpoint.completed:
+                        _vprint(f"   [{idx+offset}/{len(subdirs)+offset}] Already completed before resuming: {scan_dir.name}")
+                        continue
+                    _vprint(f"   [{idx+offset}/{len(subdirs)+offset}] Processing: {scan_dir.name}")
+                    processed, skipped_dup, skipped_inv, new_studies, scan_timings = process_single_scan(
+                        scan_dir,
+                        conn,
+                        dicom_path,
+                        max_workers=max_workers,
+                        existing_paths=existing_paths,
+                        series_first=series_first,
+                        records=subdir_records.get(scan_dir.name, []),
+                        memory_limit_mb=memory_limit_mb,
+                        controller=controller,
+                        executor=executor,
+                        read_options=read_options,
+                        skip_unchanged=skip_unchanged,
+                        checkpoint=scan_checkpoint,
+                        known_series=known_series,
+                        touched_studies=touched_studies,
+                        report=report,
+                    )
+                    if report is not None:
+                        report.add_timings(scan_timings)
+                    if timing and scan_timings:
+                        _vprint(f"      ⏱️ scan timings:")
+                        for label, seconds in scan_timings.items():
+                            _vprint(f"         - {label}: {_format_timing(label, seconds)}")
+                    total_processed += processed
+                    total_skipped_duplicates += skipped_dup
+                    total_skipped_invalid += skipped_inv
                 
-                # Build status message
-                status_parts = []
-                if processed > 0:
-                    if new_studies:
-                        status_parts.append(f"Added {processed} new files ({len(new_studies)} new study/studies)")
-                    else:
-                        status_parts.append(f"Added {processed} new series to existing study/studies")
+                    # Build status message
+                    status_parts = []
+                    if processed > 0:
+                        if new_studies:
+                            status_parts.append(f"Added {processed} new files ({len(new_studies)} new study/studies)")
+                        else:
+                            status_parts.append(f"Added {processed} new series to existing study/studies")
                 
-                if skipped_dup > 0:
-                    if processed == 0:
-                        status_parts.append(f"All series already exist, skipped {skipped_dup} files")
-                    else:
-                        status_parts.append(f"Skipped {skipped_dup} duplicate series")
+                    if skipped_dup > 0:
+                        if processed == 0:
+                            status_parts.append(f"All series already exist, skipped {skipped_dup} files")
+                        else:
+                            status_parts.append(f"Skipped {skipped_dup} duplicate series")
                 
-                if skipped_inv > 0:
-                    status_parts.append(f"Skipped {skipped_inv} invalid files")
+                    if skipped_inv > 0:
+                        status_parts.append(f"Skipped {skipped_inv} invalid files")
                 
-                if status_parts:
-                    _vprint(f"      ✓ {' | '.join(status_parts)}")
-                else:
-                    _vprint(f"      ✓ Processed {processed} files")
+                    if status_parts:
+                        _vprint(f"      ✓ {' | '.join(status_parts)}")
+                    else:
+                        _vprint(f"      ✓ Processed {processed} files")
                 
-                # Track existing studies for summary
-                if processed == 0 and skipped_dup > 0:
-                    total_existing_studies += 1
+                    # Track existing studies for summary
+                    if processed == 0 and skipped_dup > 0:
+                        total_existing_studies += 1
             
-            _vprint(f"\n   ✅ Summary:")
-            _vprint(f"      • New files added: {total_processed}")
-            if total_skipped_duplicates > 0:
-                _vprint(f"      • Duplicate files skipped: {total_skipped_duplicates}")
-            if total_skipped_invalid > 0:
-                _vprint(f"      • Invalid files skipped: {total_skipped_invalid}")
-            if total_existing_studies > 0:
-                _vprint(f"      • Scans already in database: {total_existing_studies}")
-        else:
-            # Process files directly (recursive)
-            _vprint(f"📂 Processing DICOM files in: {dicom_path} (recursive)")
-            dcm_files = [
-                f for f in dicom_path.rglob("*.dcm")
-                if not f.name.startswith('._') and '__MACOSX' not in str(f)
-            ]
-
-            if existing_paths:
-                filtered_files = []
-                skipped_existing = 0
-                for file_path in dcm_files:
-                    rel_path = str(file_path.relative_to(dicom_path))
-                    if rel_path in existing_paths:
-                        skipped_existing += 1
-                    else:
-                        filtered_files.append(file_path)
-                dcm_files = filtered_files
+                _vprint(f"\n   ✅ Summary:")
+                _vprint(f"      • New files added: {total_processed}")
+                if total_skipped_duplicates > 0:
+                    _vprint(f"      • Duplicate files skipped: {total_skipped_duplicates}")
+                if total_skipped_invalid > 0:
+                    _vprint(f"      • Invalid files skipped: {total_skipped_invalid}")
+                if duplicate_copies > 0:
+                    _vprint(f"      • Duplicate file copies skipped: {duplicate_copies}")
+                if total_existing_studies > 0:
+                    _vprint(f"      • Scans already in database: {total_existing_studies}")
             else:
-                skipped_existing = 0
-            
-            if not dcm_files:
-                _vprint("   ⚠️  No DICOM files found")
-                conn.close()
-                _print_timing()
+                # Process files directly (recursive)
+                _vprint(f"📂 Processing DICOM files in: {dicom_path} (recursive)")
+                if not _process_all_files():
+                    return
+        else:
+            # Process files directly (single directory or no subdirs)
+            _vprint(f"📂 Processing DICOM files in: {dicom_path}")
+            if not _process_all_files():
                 return
-            
-            _vprint(f"   📄 Found {len(dcm_files)} DICOM files")
-            
-            t_extract = time.perf_counter()
-            metadata_entries = extract_metadata_from_paths(
-                dcm_files,
-                max_workers=max_workers,
-            )
-            extract_timings["extract_metadata_s"] = time.perf_counter() - t_extract
-            skipped_invalid = len(dcm_files) - len(metadata_entries)
-            processed = 0
-            skipped_duplicates = skipped_existing
-            from store_metadata import insert_metadata
-            t_insert = time.perf_counter()
-            batch_metadata = []
-            batch_paths = []
-            batch_size = 500
-            for file_path, meta in metadata_entries:
-                batch_metadata.append(meta)
-                batch_paths.append(str(file_path.relative_to(dicom_path)))
-                if len(batch_metadata) >= batch_size:
-                    for meta_item, file_path_str in zip(batch_metadata, batch_paths):
-                        inserted, reason = insert_metadata(
-                            conn,
-                            meta_item,
-                            file_path_str,
-                            skip_existing=True,
-                            commit=False,
-                        )
-                        if inserted:
-                            processed += 1
-                            if processed % 10 == 0:
-                                _vprint(f"   ✓ Processed {processed}/{len(dcm_files)} files...")
-                        elif reason in ("series_exists", "already_exists"):
-                            skipped_duplicates += 1
-                        else:
-                            skipped_invalid += 1
-                    conn.commit()
-                    batch_metadata.clear()
-                    batch_paths.clear()
-            if batch_metadata:
-                for meta_item, file_path_str in zip(batch_metadata, batch_paths):
-                    inserted, reason = insert_metadata(
-                        conn,
-                        meta_item,
-                        file_path_str,
-                        skip_existing=True,
-                        commit=False,
-                    )
-                    if inserted:
-                        processed += 1
-                        if processed % 10 == 0:
-                            _vprint(f"   ✓ Processed {processed}/{len(dcm_files)} files...")
-                    elif reason in ("series_exists", "already_exists"):
-                        skipped_duplicates += 1
-                    else:
-                        skipped_invalid += 1
-                conn.commit()
-            extract_timings["insert_metadata_s"] = time.perf_counter() - t_insert
-            
-            if skipped_duplicates > 0:
-                _vprint(f"   ⚠️  Skipped {skipped_duplicates} duplicate files")
-            if skipped_invalid > 0:
-                _vprint(f"   ⚠️  Skipped {skipped_invalid} invalid files")
-            
-            _vprint(f"   ✅ Added {processed} new files to database")
-    else:
-        # Process files directly (single directory or no subdirs)
-        _vprint(f"📂 Processing DICOM files in: {dicom_path}")
-        dcm_files = [
-            f for f in dicom_path.rglob("*.dcm")
-            if not f.name.startswith('._') and '__MACOSX' not in str(f)
-        ]
+    
+        if controller and controller.history:
+            _vprint(f"\n   ⚙️  Adaptive concurrency settled at {controller.limit} in-flight batches")
+        if owned_executor is not None:
+            owned_executor.shutdown()
 
-        if existing_paths:
-            filtered_files = []
-            skipped_existing = 0
-            for file_path in dcm_files:
-                rel_path = str(file_path.relative_to(dicom_path))
-                if rel_path in existing_paths:
-                    skipped_existing += 1
-                else:
-                    filtered_files.append(file_path)
-            dcm_files = filtered_files
+        if shard is not None:
+            # Representatives depend on every shard, so they are chosen once when merging
+            _vprint(f"\n   🧩 Shard {shard[0]}/{shard[1]} done; prune after merging with merge_shards.py")
         else:
-            skipped_existing = 0
-        
-        if not dcm_files:
-            _vprint("   ⚠️  No DICOM files found")
-            conn.close()
-            if temp_extract_dir:
-                try:
-                    shutil.rmtree(temp_extract_dir)
-                    _vprint(f"   Cleaned up temporary extraction directory")
-                except:
-                    pass
-            _print_timing()
-            return
-        
-        _vprint(f"   📄 Found {len(dcm_files)} DICOM files")
-        
-        t_extract = time.perf_counter()
-        metadata_entries = extract_metadata_from_paths(
-            dcm_files,
-            max_workers=max_workers,
-        )
-        extract_timings["extract_metadata_s"] = time.perf_counter() - t_extract
-        skipped_invalid = len(dcm_files) - len(metadata_entries)
-        processed = 0
-        skipped_duplicates = skipped_existing
-        from store_metadata import insert_metadata
-        t_insert = time.perf_counter()
-        batch_metadata = []
-        batch_paths = []
-        batch_size = 500
-        for file_path, meta in metadata_entries:
-            batch_metadata.append(meta)
-            batch_paths.append(str(file_path.relative_to(dicom_path)))
-            if len(batch_metadata) >= batch_size:
-                for meta_item, file_path_str in zip(batch_metadata, batch_paths):
-                    inserted, reason = insert_metadata(
-                        conn,
-                        meta_item,
-                        file_path_str,
-                        skip_existing=True,
-                        commit=False,
-                    )
-                    if inserted:
-                        processed += 1
-                        if processed % 10 == 0:
-                            _vprint(f"   ✓ Processed {processed}/{len(dcm_files)} files...")
-                    elif reason in ("series_exists", "already_exists"):
-                        skipped_duplicates += 1
-                    else:
-                        skipped_invalid += 1
-                conn.commit()
-                batch_metadata.clear()
-                batch_paths.clear()
-        if batch_metadata:
-            for meta_item, file_path_str in zip(batch_metadata, batch_paths):
-                inserted, reason = insert_metadata(
-                    conn,
-                    meta_item,
-                    file_path_str,
-                    skip_existing=True,
-                    commit=False,
-                )
-                if inserted:
-                    processed += 1
-                    if processed % 10 == 0:
-                        _vprint(f"   ✓ Processed {processed}/{len(dcm_files)} files...")
-                elif reason in ("series_exists", "already_exists"):
-                    skipped_duplicates += 1
-                else:
-                    skipped_invalid += 1
-            conn.commit()
-        extract_timings["insert_metadata_s"] = time.perf_counter() - t_insert
-        
-        if skipped_duplicates > 0:
-            _vprint(f"   ⚠️  Skipped {skipped_duplicates} duplicate files")
-        if skipped_invalid > 0:
-            _vprint(f"   ⚠️  Skipped {skipped_invalid} invalid files")
-        
-        _vprint(f"   ✅ Added {processed} new files to database")
-    
-    _vprint("\n   🧹 Pruning non-representative series...")
-    try:
-        pruned = prune_non_representative_series(conn)
-        conn.commit()
-        _vprint(f"   ✓ Removed {pruned} non-representative series")
-        _vprint("   🧹 Vacuuming database to reclaim space...")
-        conn.execute("VACUUM")
-        _vprint("   ✓ Vacuum complete")
-    except Exception as e:
-        _vprint(f"   ⚠ Warning: Could not prune non-representative series: {e}")
+            # The interrupted part of a resumed run touched studies this process has not seen
+            prune_and_maintain(conn, _vprint, None if resumed else touched_studies, maintenance, extract_timings)
+
+        finish_run(conn, run_id)
+    except Exception:
+        # A run that stopped with an error is not resumed; a killed or interrupted one is
+        if run_id is not None:
+            try:
+                fail_run(conn, run_id)
+            except sqlite3.Error:
+                pass
+        raise
+    finally:
+        if owned_executor is not None:
+            owned_executor.shutdown(cancel_futures=True)
+        conn.close()
+        # Workers close their ZIP handles when their pool shuts down
+        close_zip_handles(Path(dicom_dir))
+        # Clean up temporary directory if it was created from archive extraction
+        if temp_extract_dir:
+            try:
+                _vprint(f"   Cleaning up temporary extraction directory...")
+                shutil.rmtree(temp_extract_dir)
+                _vprint(f"   ✓ Cleaned up")
+            except Exception as e:
+                _vprint(f"   ⚠ Warning: Could not clean up temp directory: {e}")
 
-    conn.close()
     _vprint(f"\n   💾 Database saved to: {db_path}")
-    
-    # Clean up temporary directory if it was created from archive extraction
-    if temp_extract_dir:
-        try:
-            _vprint(f"   Cleaning up temporary extraction directory...")
-            shutil.rmtree(temp_extract_dir)
-            _vprint(f"   ✓ Cleaned up")
-        except Exception as e:
-            _vprint(f"   ⚠ Warning: Could not clean up temp directory: {e}")
 
+    _write_report()
     print("Processing ended")
     _print_timing(extract_timings)
 
@@ -834,10 +1388,104 @@ if __name__ == "__main__":
         action="store_true",
         help="Skip files whose relative paths already exist in the database.",
     )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Skip files unchanged (size, mtime, inode) since the last --skip-unchanged run "
+             "without opening them; keeps an ingest manifest in the database.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted run over the same input from its last checkpoint.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="I/N",
+        help="Only process the top-level subdirectories hashed to shard I of N (0-based), "
+             "into its own databank; merge the shards with merge_shards.py.",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Parse only one of several identical file copies (grouped by size and a hash of "
+             "their first and last 4 KB, then confirmed by a full-content hash).",
+    )
+    parser.add_argument(
+        "--skip-known-series",
+        action="store_true",
+        help="Probe each file's SeriesInstanceUID and skip files of series already in the "
+             "database before the full parse.",
+    )
+    parser.add_argument(
+        "--no-maintenance",
+        action="store_true",
+        help="Do not run due maintenance (space reclaim, ANALYZE, WAL checkpoint) after "
+             "the run; use maintain_db.py instead.",
+    )
     parser.add_argument(
         "--no-auto-workers",
         action="store_true",
-        help="Disable auto-tuning worker count.",
+        help="Disable adaptive extraction concurrency.",
+    )
+    parser.add_argument(
+        "--series-first",
+        action="store_true",
+        help="Probe UIDs first and fully parse only one file per series.",
+    )
+    parser.add_argument(
+        "--sniff",
+        action="store_true",
+        help="Also detect DICOM files without a .dcm extension by their content.",
+    )
+    parser.add_argument(
+        "--memory-limit-mb",
+        type=float,
+        default=None,
+        help="Approximate memory ceiling for in-flight extraction results (MB).",
+    )
+    add_read_option_arguments(parser)
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and ingest files as they are dropped into dicom_dir.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between scans of the watched folder (default: 1).",
+    )
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=2.0,
+        help="Ingest a watched directory once it saw no new or growing files for this long (default: 2).",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        metavar="PATH",
+        help="Write a JSON metrics report (stage durations, throughput, utilization, "
+             "latency histogram, counts, slowest files) to PATH ('-' for stdout).",
+    )
+    parser.add_argument(
+        "--report-slowest",
+        type=int,
+        default=DEFAULT_SLOWEST_FILES,
+        metavar="N",
+        help=f"Number of slowest files listed in the report (default: {DEFAULT_SLOWEST_FILES}).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_PROFILE_PREFIX,
+        default=None,
+        metavar="PREFIX",
+        help="Profile the run and its worker processes with cProfile; writes the merged "
+             f"PREFIX.pstats and PREFIX.collapsed.txt (default prefix: {DEFAULT_PROFILE_PREFIX}).",
     )
     parser.add_argument(
         "--verbose",
@@ -849,14 +1497,72 @@ if __name__ == "__main__":
 
     if args.max_workers is not None and args.max_workers < 1:
         parser.error("--max-workers must be greater than zero")
+    if args.memory_limit_mb is not None and args.memory_limit_mb <= 0:
+        parser.error("--memory-limit-mb must be greater than zero")
+    if args.defer_size_kb is not None and args.defer_size_kb <= 0:
+        parser.error("--defer-size-kb must be greater than zero")
+    if args.private_budget_kb is not None and args.private_budget_kb < 0:
+        parser.error("--private-budget-kb must not be negative")
+    if args.poll_interval <= 0:
+        parser.error("--poll-interval must be greater than zero")
+    if args.settle_seconds < 0:
+        parser.error("--settle-seconds must not be negative")
+    if args.watch and args.shard is not None:
+        parser.error("--shard cannot be combined with --watch")
+    if args.watch and args.report is not None:
+        parser.error("--report cannot be combined with --watch")
+    if args.report_slowest < 0:
+        parser.error("--report-slowest must not be negative")
+    if args.watch and args.profile:
+        parser.error("--profile cannot be combined with --watch")
 
-    process_directory(
-        args.dicom_dir,
-        db_path=args.db_path,
-        process_subdirs=args.process_subdirs,
-        max_workers=args.max_workers,
-        timing=args.timing,
-        verbose=args.verbose,
-        skip_existing_paths=args.skip_existing_paths,
-        auto_workers=not args.no_auto_workers,
-    )
+    if args.watch:
+        from watch_folder import watch_directory
+        watch_directory(
+            args.dicom_dir,
+            args.db_path,
+            max_workers=args.max_workers,
+            poll_interval=args.poll_interval,
+            settle_seconds=args.settle_seconds,
+            sniff=args.sniff,
+            memory_limit_mb=args.memory_limit_mb,
+            read_options=read_options_from_args(args),
+            verbose=args.verbose,
+        )
+    else:
+        with ProfileSession(args.profile) if args.profile else nullcontext() as session:
+            # One profiled pool for every scan, so each worker's profile covers the whole run
+            executor = (
+                session.pool(extraction_pool_size(args.max_workers, not args.no_auto_workers))
+                if session is not None else None
+            )
+            try:
+                process_directory(
+                    args.dicom_dir,
+                    db_path=args.db_path,
+                    process_subdirs=args.process_subdirs,
+                    max_workers=args.max_workers,
+                    timing=args.timing,
+                    verbose=args.verbose,
+                    skip_existing_paths=args.skip_existing_paths,
+                    skip_unchanged=args.skip_unchanged,
+                    resume=args.resume,
+                    shard=args.shard,
+                    dedupe=args.dedupe,
+                    skip_known_series=args.skip_known_series,
+                    maintenance=not args.no_maintenance,
+                    report_path=args.report,
+                    report_slowest=args.report_slowest,
+                    auto_workers=not args.no_auto_workers,
+                    series_first=args.series_first,
+                    sniff=args.sniff,
+                    memory_limit_mb=args.memory_limit_mb,
+                    read_options=read_options_from_args(args),
+                    executor=executor,
+                )
+            except ArchiveError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+cProfile across the extraction worker processes
+Profiles the parent, its writer thread and every pool worker, then merges them into one pstats file and a collapsed-stack file
+"""
+
+import cProfile
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_PROFILE_PREFIX = "profile"
+
+# Collapsed stacks: call paths contributing less self time are dropped, deeper ones cut off
+COLLAPSED_MIN_SECONDS = 1e-5
+COLLAPSED_MAX_DEPTH = 128
+
+# Functions listed in the summary printed after a profiled run
+SUMMARY_FUNCTIONS = 15
+
+Function = Tuple[str, int, str]
+
+_active_session: Optional["ProfileSession"] = None
+
+
+def _log_stderr(message: str) -> None:
+    # stdout may carry JSON output (extract_metadata.py, --report -)
+    print(message, file=sys.stderr)
+
+
+def _start_worker_profile(dump_dir: str) -> None:
+    """Pool initializer: profile this worker until it exits, then dump its stats to ``dump_dir``."""
+    profiler = cProfile.Profile()
+
+    def _dump() -> None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(dump_dir, f"worker-{os.getpid()}.pstats"))
+
+    # Runs from multiprocessing's exit handler once the pool shuts the worker down
+    Finalize(None, _dump, exitpriority=100)
+    profiler.enable()
+
+
+@contextmanager
+def thread_profile() -> Iterator[None]:
+    """Profile the calling thread while a ``ProfileSession`` is active (no-op otherwise).
+
+    cProfile only sees the thread that enabled it, so helper threads that
+    should show up in the report (e.g. the SQLite writer) opt in with this.
+    """
+    session = _active_session
+    if session is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        session.add_thread_profile(profiler)
+
+
+def _frame_label(func: Function) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name.replace(";", ",")
+    return f"{os.path.basename(filename)}:{name}:{line}".replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> Dict[str, float]:
+    """Approximate ``frame;frame;frame -> self seconds`` from a merged profile.
+
+    cProfile keeps caller/callee pairs rather than full stacks, so every
+    call path from a root function is rebuilt from the call graph and a
+    callee's time is split between its callers by their share of its
+    cumulative time (the approach flameprof and similar tools use).
+    """
+    raw = stats.stats  # type: ignore[attr-defined]
+    children: Dict[Function, Dict[Function, tuple]] = defaultdict(dict)
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            children[caller][func] = edge
+    roots = [func for func, entry in raw.items() if not entry[4]]
+
+    stacks: Dict[str, float] = defaultdict(float)
+
+    def _walk(func: Function, labels: List[str], on_stack: set, share: float) -> None:
+        self_seconds = raw[func][2] * share
+        if self_seconds >= COLLAPSED_MIN_SECONDS:
+            stacks[";".join(labels)] += self_seconds
+        if len(labels) >= COLLAPSED_MAX_DEPTH:
+            return
+        for callee, edge in children.get(func, {}).items():
+            callee_total = raw[callee][3]
+            edge_seconds = edge[3] * share
+            if callee in on_stack or callee_total <= 0 or edge_seconds < COLLAPSED_MIN_SECONDS:
+                continue
+            on_stack.add(callee)
+            labels.append(_frame_label(callee))
+            _walk(callee, labels, on_stack, min(1.0, edge_seconds / callee_total))
+            labels.pop()
+            on_stack.discard(callee)
+
+    for root in roots:
+        _walk(root, [_frame_label(root)], {root}, 1.0)
+    return stacks
+
+
+def write_collapsed(stats: pstats.Stats, path: str) -> int:
+    """Write collapsed stacks (microseconds) for flamegraph.pl, speedscope, etc.; returns the line count."""
+    stacks = collapsed_stacks(stats)
+    lines = [
+        f"{stack} {round(seconds * 1e6)}"
+        for stack, seconds in sorted(stacks.items())
+        if round(seconds * 1e6) > 0
+    ]
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("\n".join(lines) + ("\n" if lines else ""))
+    return len(lines)
+
+
+class ProfileSession:
+    """cProfile for one CLI run, including the workers of ``pool()``
+
+    Use as a context manager around the run. The calling thread is profiled
+    directly, helper threads via ``thread_profile`` and pool workers through
+    a pool initializer that dumps each worker's stats when it exits. On
+    exit everything is merged into ``<prefix>.pstats`` and
+    ``<prefix>.collapsed.txt``. Pools from ``pool()`` must be shut down
+    inside the ``with`` block so the workers have written their stats.
+    """
+
+    def __init__(self, prefix: str = DEFAULT_PROFILE_PREFIX, log: Callable[[str], None] = _log_stderr):
+        self.prefix = prefix
+        self.log = log
+        self.pstats_path = f"{prefix}.pstats"
+        self.collapsed_path = f"{prefix}.collapsed.txt"
+        self._dump_dir = tempfile.mkdtemp(prefix="dicom_profile_")
+        self._profiler = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def pool(self, max_workers: int) -> ProcessPoolExecutor:
+        """A process pool whose workers are profiled."""
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_start_worker_profile,
+            initargs=(self._dump_dir,),
+        )
+
+    def add_thread_profile(self, profiler: cProfile.Profile) -> None:
+        with self._lock:
+            self._thread_profiles.append(profiler)
+
+    def __enter__(self) -> "ProfileSession":
+        global _active_session
+        _active_session = self
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        global _active_session
+        self._profiler.disable()
+        _active_session = None
+        try:
+            self.write()
+        finally:
+            shutil.rmtree(self._dump_dir, ignore_errors=True)
+
+    def write(self) -> pstats.Stats:
+        """Merge the parent, thread and worker profiles and write both output files."""
+        stats = pstats.Stats(self._profiler)
+        for profiler in self._thread_profiles:
+            stats.add(profiler)
+        worker_files = sorted(Path(self._dump_dir).glob("worker-*.pstats"))
+        for worker_file in worker_files:
+            stats.add(str(worker_file))
+
+        directory = os.path.dirname(self.pstats_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stats.dump_stats(self.pstats_path)
+        write_collapsed(stats, self.collapsed_path)
+
+        self.log(f"Profile: parent + {len(self._thread_profiles)} thread(s) + "
+                 f"{len(worker_files)} worker process(es)")
+        self.log(f"   pstats: {self.pstats_path}")
+        self.log(f"   collapsed stacks: {self.collapsed_path}")
+        raw = stats.stats  # type: ignore[attr-defined]
+        top = sorted(raw.items(), key=lambda item: item[1][2], reverse=True)[:SUMMARY_FUNCTIONS]
+        self.log("   Top functions by own time (all processes):")
+        for func, (_, calls, own, cumulative, _) in top:
+            self.log(f"   {own:9.3f}s own {cumulative:9.3f}s cum {calls:9d} calls  {_frame_label(func)}")
+        return stats
@@ -3,9 +3,16 @@
 Simple SQLite storage for DICOM metadata
 """
 
+import hashlib
+import math
+import queue
 import sqlite3
-from typing import List
-from extract_metadata import DICOMMetadata
+import threading
+import time
+from dataclasses import fields
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from extract_metadata import DICOMMetadata, profile_rank
+from profiling import thread_profile
 
 DB_SCHEMA = """
 CREATE TABLE IF NOT EXISTS dicom_metadata (
@@ -104,8 +111,15 @@ CREATE TABLE IF NOT EXISTS dicom_metadata (
     csa_series_header_json TEXT,
     csa_image_header_hash TEXT,
     csa_series_header_hash TEXT,
+    csa_image_header_raw BLOB,  -- zlib-compressed, decoded on demand
+    csa_series_header_raw BLOB,
     private_payload_fingerprint TEXT,
     is_representative INTEGER DEFAULT 0,
+
+    -- Bytes read from the file to extract this row
+    header_bytes_read INTEGER,
+    -- Extraction profile (core, nuclear-medicine, full-private; NULL = full)
+    extraction_profile TEXT,
     
     
     -- Timestamps
@@ -164,17 +178,76 @@ CREATE TABLE IF NOT EXISTS private_tag (
 CREATE INDEX IF NOT EXISTS idx_private_series ON private_tag(series_instance_uid);
 CREATE INDEX IF NOT EXISTS idx_private_creator ON private_tag(creator);
 CREATE INDEX IF NOT EXISTS idx_private_classification ON private_tag(classification);
+
+-- Stat data of every file seen by --skip-unchanged runs, keyed by file_path
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    file_path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    series_instance_uid TEXT,
+    extraction_profile TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_manifest_series ON ingest_manifest(series_instance_uid);
+
+-- Series a prune deleted as non-representative, so --skip-known-series skips
+-- their files too; a series is removed again once it is stored as representative
+CREATE TABLE IF NOT EXISTS pruned_series (
+    series_instance_uid TEXT PRIMARY KEY,
+    study_instance_uid TEXT,
+    extraction_profile TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_pruned_study ON pruned_series(study_instance_uid);
+
+-- Checkpoints of process_directory runs, used by --resume
+CREATE TABLE IF NOT EXISTS ingest_run (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_path TEXT,
+    extraction_profile TEXT,
+    status TEXT,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- One row per scan of a run; last_file is the path up to which (in sorted
+-- order) every file of the scan has been stored
+CREATE TABLE IF NOT EXISTS ingest_run_scan (
+    run_id INTEGER,
+    scan_key TEXT,
+    last_file TEXT,
+    files_done INTEGER DEFAULT 0,
+    completed INTEGER DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, scan_key)
+);
+
+-- Maintenance bookkeeping (see maintain_db.py): when each task last ran and,
+-- for 'analyze', how many rows were changed since
+CREATE TABLE IF NOT EXISTS db_maintenance (
+    task TEXT PRIMARY KEY,
+    pending_changes INTEGER DEFAULT 0,
+    last_run TIMESTAMP
+);
 """
 
+# series_instance_uid recorded in ingest_manifest for files that did not parse as DICOM
+MANIFEST_NON_DICOM = "non-DICOM"
 
-def init_database(db_path: str, optimize: bool = True):
+
+def init_database(db_path: str, optimize: bool = True, check_same_thread: bool = True):
     """Initialize database with schema and performance optimizations
     
     Args:
         db_path: Path to SQLite database file
         optimize: If True, apply performance optimizations for large datasets
+        check_same_thread: Passed to sqlite3.connect; must be False if the
+            connection is handed to a MetadataWriter thread
     """
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    # New databanks free pages incrementally (only takes effect before the first table exists)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
     
     # Performance optimizations for large datasets
     if optimize:
@@ -225,6 +298,10 @@ def init_database(db_path: str, optimize: bool = True):
         ("dlp", "REAL"),
         ("number_of_frames", "INTEGER"),
         ("frame_time", "REAL"),
+        ("header_bytes_read", "INTEGER"),
+        ("extraction_profile", "TEXT"),
+        ("csa_image_header_raw", "BLOB"),
+        ("csa_series_header_raw", "BLOB"),
     ]
     for col_name, col_type in migrations:
         if col_name not in existing_cols:
@@ -233,6 +310,19 @@ def init_database(db_path: str, optimize: bool = True):
     return conn
 
 
+def record_changes(conn: sqlite3.Connection, count: int, commit: bool = True) -> None:
+    """Add ``count`` changed rows to the counter that schedules the next ANALYZE."""
+    if count <= 0:
+        return
+    conn.execute(
+        "INSERT INTO db_maintenance (task, pending_changes) VALUES ('analyze', ?) "
+        "ON CONFLICT(task) DO UPDATE SET pending_changes = pending_changes + excluded.pending_changes",
+        (count,),
+    )
+    if commit:
+        conn.commit()
+
+
 def study_exists(conn: sqlite3.Connection, study_uid: str) -> bool:
     """Check if a study already exists in the database"""
     if not study_uid:
@@ -245,6 +335,343 @@ def study_exists(conn: sqlite3.Connection, study_uid: str) -> bool:
     return count > 0
 
 
+# Column order used by every dicom_metadata insert, computed once
+METADATA_COLUMNS = tuple(
+    f.name for f in fields(DICOMMetadata) if f.name != "private_tags"
+) + ("file_path",)
+_INSERT_METADATA_SQL = f"""
+    INSERT OR IGNORE INTO dicom_metadata ({', '.join(METADATA_COLUMNS)})
+    VALUES ({', '.join('?' for _ in METADATA_COLUMNS)})
+"""
+
+PRIVATE_TAG_COLUMNS = (
+    "sop_instance_uid",
+    "series_instance_uid",
+    "study_instance_uid",
+    "file_path",
+    "manufacturer",
+    "modality",
+    "group_hex",
+    "element_hex",
+    "creator",
+    "vr",
+    "value_text",
+    "value_num",
+    "value_json",
+    "value_hex",
+    "byte_len",
+    "value_hash",
+    "classification",
+)
+_INSERT_PRIVATE_TAG_SQL = f"""
+    INSERT OR IGNORE INTO private_tag ({', '.join(PRIVATE_TAG_COLUMNS)})
+    VALUES ({', '.join('?' for _ in PRIVATE_TAG_COLUMNS)})
+"""
+
+# Stay below SQLite's default limit of 999 bound parameters per statement
+SQL_CHUNK_SIZE = 900
+
+
+def _metadata_row(metadata: DICOMMetadata, file_path: str) -> tuple:
+    return tuple(getattr(metadata, name) for name in METADATA_COLUMNS[:-1]) + (file_path,)
+
+
+def _private_tag_rows(metadata: DICOMMetadata, file_path: str, private_tags: List[dict]) -> List[tuple]:
+    return [
+        (
+            tag.get("sop_instance_uid"),
+            metadata.series_instance_uid,
+            metadata.study_instance_uid,
+            file_path,
+            metadata.manufacturer,
+            metadata.modality,
+            tag.get("group_hex"),
+            tag.get("element_hex"),
+            tag.get("creator"),
+            tag.get("vr"),
+            tag.get("value_text"),
+            tag.get("value_num"),
+            tag.get("value_json"),
+            tag.get("value_hex"),
+            tag.get("byte_len"),
+            tag.get("value_hash"),
+            tag.get("classification"),
+        )
+        for tag in private_tags
+    ]
+
+
+def _select_existing(conn: sqlite3.Connection, column: str, values: Iterable[str]) -> Set[str]:
+    """Return which of ``values`` already exist in an indexed dicom_metadata column."""
+    values = list(values)
+    found: Set[str] = set()
+    for i in range(0, len(values), SQL_CHUNK_SIZE):
+        chunk = values[i:i + SQL_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"SELECT DISTINCT {column} FROM dicom_metadata WHERE {column} IN ({placeholders})",
+            chunk,
+        ).fetchall()
+        found.update(row[0] for row in rows)
+    return found
+
+
+def existing_series_profiles(
+    conn: sqlite3.Connection,
+    series_uids: Iterable[str],
+    table: str = "dicom_metadata",
+) -> Dict[str, Optional[str]]:
+    """Map each of ``series_uids`` already in ``table`` (or ``pruned_series``) to its extraction profile."""
+    series_uids = list(series_uids)
+    found: Dict[str, Optional[str]] = {}
+    for i in range(0, len(series_uids), SQL_CHUNK_SIZE):
+        chunk = series_uids[i:i + SQL_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"SELECT series_instance_uid, extraction_profile FROM {table} "
+            f"WHERE series_instance_uid IN ({placeholders})",
+            chunk,
+        ).fetchall()
+        found.update(rows)
+    return found
+
+
+# False-positive rate of the known-series Bloom filter; positives are re-checked in SQLite
+KNOWN_SERIES_FALSE_POSITIVE_RATE = 0.01
+
+
+class BloomFilter:
+    """Set membership in a bytearray: no false negatives, rare false positives
+
+    Sized for ``capacity`` keys at ``false_positive_rate``; the bit
+    positions come from one blake2b digest by double hashing.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = KNOWN_SERIES_FALSE_POSITIVE_RATE):
+        capacity = max(1, capacity)
+        self.num_bits = max(64, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def load_known_series(conn: sqlite3.Connection, min_profile: Optional[str] = None) -> BloomFilter:
+    """Load stored and pruned series UIDs into a ``BloomFilter`` (streamed, never held as a list).
+
+    Series stored with a cheaper profile than ``min_profile`` are left out
+    so they are still re-read and upgraded.
+    """
+    total = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM dicom_metadata WHERE series_instance_uid IS NOT NULL)"
+        " + (SELECT COUNT(*) FROM pruned_series)"
+    ).fetchone()[0]
+    requested_rank = profile_rank(min_profile)
+    known = BloomFilter(total)
+    for series_uid, profile in conn.execute(
+        "SELECT series_instance_uid, extraction_profile FROM dicom_metadata "
+        "WHERE series_instance_uid IS NOT NULL "
+        "UNION ALL SELECT series_instance_uid, extraction_profile FROM pruned_series"
+    ):
+        if profile_rank(profile) >= requested_rank:
+            known.add(series_uid)
+    return known
+
+
+def confirm_known_series(
+    conn: sqlite3.Connection,
+    known: BloomFilter,
+    series_uids: Iterable[str],
+    min_profile: Optional[str] = None,
+) -> Dict[str, Optional[str]]:
+    """Exact check of the Bloom filter's positives among ``series_uids``.
+
+    Returns:
+        dict: series UID -> stored extraction profile, for series that are
+        stored (or were pruned) with at least ``min_profile``
+    """
+    requested_rank = profile_rank(min_profile)
+    positives = {series_uid for series_uid in series_uids if series_uid in known}
+    found = existing_series_profiles(conn, positives)
+    found.update(existing_series_profiles(conn, positives - set(found), "pruned_series"))
+    return {
+        series_uid: profile
+        for series_uid, profile in found.items()
+        if profile_rank(profile) >= requested_rank
+    }
+
+
+def _delete_series(conn: sqlite3.Connection, series_uids: List[str]) -> None:
+    for i in range(0, len(series_uids), SQL_CHUNK_SIZE):
+        chunk = series_uids[i:i + SQL_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        conn.execute(f"DELETE FROM private_tag WHERE series_instance_uid IN ({placeholders})", chunk)
+        conn.execute(f"DELETE FROM dicom_metadata WHERE series_instance_uid IN ({placeholders})", chunk)
+
+
+class ManifestEntry(NamedTuple):
+    """One ``ingest_manifest`` row: the file's stat data when it was last ingested"""
+    size: int
+    mtime_ns: int
+    inode: int
+    series_instance_uid: Optional[str]
+    extraction_profile: Optional[str]
+
+
+def lookup_manifest(conn: sqlite3.Connection, file_paths: Iterable[str]) -> Dict[str, ManifestEntry]:
+    """Return the manifest entries of ``file_paths``, looked up 900 primary keys at a time."""
+    file_paths = list(file_paths)
+    found: Dict[str, ManifestEntry] = {}
+    for i in range(0, len(file_paths), SQL_CHUNK_SIZE):
+        chunk = file_paths[i:i + SQL_CHUNK_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"SELECT file_path, size, mtime_ns, inode, series_instance_uid, extraction_profile "
+            f"FROM ingest_manifest WHERE file_path IN ({placeholders})",
+            chunk,
+        ).fetchall()
+        for row in rows:
+            found[row[0]] = ManifestEntry(*row[1:])
+    return found
+
+
+def record_manifest(conn: sqlite3.Connection, rows: Iterable[tuple], commit: bool = True) -> None:
+    """Insert or refresh manifest rows of (file_path, size, mtime_ns, inode, series uid, profile)."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO ingest_manifest "
+        "(file_path, size, mtime_ns, inode, series_instance_uid, extraction_profile) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    if commit:
+        conn.commit()
+
+
+def forget_study_manifest(conn: sqlite3.Connection, study_uid: str) -> int:
+    """Drop manifest entries of a study's stored series so re-ingesting brings it back."""
+    has_manifest = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingest_manifest'"
+    ).fetchone()
+    if not has_manifest:
+        return 0
+    cursor = conn.execute(
+        "DELETE FROM ingest_manifest WHERE series_instance_uid IN ("
+        "SELECT series_instance_uid FROM dicom_metadata WHERE study_instance_uid = ?)",
+        (study_uid,),
+    )
+    return cursor.rowcount
+
+
+def forget_pruned_series(conn: sqlite3.Connection, study_uid: str) -> int:
+    """Drop the pruned series of a study so re-ingesting with --skip-known-series reads them again."""
+    has_table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pruned_series'"
+    ).fetchone()
+    if not has_table:
+        return 0
+    return conn.execute("DELETE FROM pruned_series WHERE study_instance_uid = ?", (study_uid,)).rowcount
+
+
+class ScanCheckpoint(NamedTuple):
+    """Where one scan of a run stands: every file up to ``last_file`` is stored"""
+    run_id: int
+    scan_key: str
+    last_file: Optional[str] = None
+    files_done: int = 0
+    completed: bool = False
+
+
+def start_run(conn: sqlite3.Connection, source_path: str, extraction_profile: Optional[str]) -> int:
+    """Record a new ingest run and return its id."""
+    cursor = conn.execute(
+        "INSERT INTO ingest_run (source_path, extraction_profile, status) VALUES (?, ?, 'running')",
+        (source_path, extraction_profile),
+    )
+    conn.commit()
+    return cursor.lastrowid
+
+
+def find_resumable_run(conn: sqlite3.Connection, source_path: str) -> Optional[int]:
+    """Return the latest unfinished run over ``source_path``, if any."""
+    row = conn.execute(
+        "SELECT run_id FROM ingest_run WHERE source_path = ? AND status = 'running' "
+        "ORDER BY run_id DESC LIMIT 1",
+        (source_path,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_run_checkpoints(conn: sqlite3.Connection, run_id: int) -> Dict[str, ScanCheckpoint]:
+    """Map scan keys of a run to their last durable checkpoint."""
+    rows = conn.execute(
+        "SELECT scan_key, last_file, files_done, completed FROM ingest_run_scan WHERE run_id = ?",
+        (run_id,),
+    ).fetchall()
+    return {
+        scan_key: ScanCheckpoint(run_id, scan_key, last_file, files_done or 0, bool(completed))
+        for scan_key, last_file, files_done, completed in rows
+    }
+
+
+def save_checkpoint(conn: sqlite3.Connection, checkpoint: ScanCheckpoint, commit: bool = True) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO ingest_run_scan "
+        "(run_id, scan_key, last_file, files_done, completed, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        (checkpoint.run_id, checkpoint.scan_key, checkpoint.last_file,
+         checkpoint.files_done, int(checkpoint.completed)),
+    )
+    if commit:
+        conn.commit()
+
+
+def _end_run(conn: sqlite3.Connection, run_id: int, status: str) -> None:
+    conn.execute(
+        "UPDATE ingest_run SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE run_id = ?",
+        (status, run_id),
+    )
+    # Scan checkpoints are only read by --resume, which never picks up an ended run
+    conn.execute(
+        "DELETE FROM ingest_run_scan WHERE run_id IN "
+        "(SELECT run_id FROM ingest_run WHERE status != 'running')"
+    )
+    conn.commit()
+
+
+def finish_run(conn: sqlite3.Connection, run_id: int) -> None:
+    """Mark a run as completed so ``--resume`` starts a new one next time."""
+    _end_run(conn, run_id, "completed")
+
+
+def fail_run(conn: sqlite3.Connection, run_id: int) -> None:
+    """Mark a run that stopped with an error as failed; ``--resume`` does not continue it."""
+    _end_run(conn, run_id, "failed")
+
+
+def existing_studies(conn: sqlite3.Connection, study_uids: Iterable[str]) -> Set[str]:
+    """Return the subset of ``study_uids`` already present in the database."""
+    return _select_existing(conn, "study_instance_uid", study_uids)
+
+
 def insert_metadata(conn: sqlite3.Connection, metadata: DICOMMetadata, file_path: str, skip_existing: bool = True, commit: bool = True):
     """Insert metadata into database
     
@@ -257,27 +684,14 @@ def insert_metadata(conn: sqlite3.Connection, metadata: DICOMMetadata, file_path
     Returns:
         tuple: (inserted: bool, reason: str)
     """
-    data = metadata.to_dict()
-    private_tags = data.pop("private_tags", [])
-    data['file_path'] = file_path
-    
-    columns = ', '.join(data.keys())
-    placeholders = ', '.join(['?' for _ in data])
-    values = list(data.values())
-    
-    query = f"""
-    INSERT OR IGNORE INTO dicom_metadata ({columns})
-    VALUES ({placeholders})
-    """
-    
     try:
-        cursor = conn.execute(query, values)
+        cursor = conn.execute(_INSERT_METADATA_SQL, _metadata_row(metadata, file_path))
         if commit:
             conn.commit()
         # Check if row was actually inserted
         if cursor.rowcount > 0:
-            if private_tags:
-                insert_private_tags(conn, metadata, file_path, private_tags, commit=commit)
+            if metadata.private_tags:
+                insert_private_tags(conn, metadata, file_path, metadata.private_tags, commit=commit)
             return True, "inserted"
         if skip_existing and metadata.series_instance_uid:
             return False, "series_exists"
@@ -289,6 +703,66 @@ def insert_metadata(conn: sqlite3.Connection, metadata: DICOMMetadata, file_path
         return False, "integrity_error"
 
 
+def insert_metadata_batch(
+    conn: sqlite3.Connection,
+    entries: List[Tuple[DICOMMetadata, str]],
+    commit: bool = True,
+) -> List[Tuple[bool, str]]:
+    """Insert a batch of metadata rows with one executemany per table
+    
+    Series already in the database, or repeated earlier in the same batch,
+    are skipped up front (one indexed lookup per 900 series), so the result
+    still reports which rows were inserted. A series stored with a cheaper
+    extraction profile than the incoming row is replaced ("upgraded").
+    
+    Args:
+        conn: Database connection
+        entries: (metadata, file_path) pairs
+        commit: Commit after inserting
+    
+    Returns:
+        list: (inserted: bool, reason: str) per entry, in input order
+    """
+    stored_profiles = existing_series_profiles(
+        conn,
+        {meta.series_instance_uid for meta, _ in entries if meta.series_instance_uid},
+    )
+
+    results: List[Tuple[bool, str]] = []
+    metadata_rows: List[tuple] = []
+    private_rows: List[tuple] = []
+    upgraded: List[str] = []
+    batch_series: Set[str] = set()
+    for metadata, file_path in entries:
+        series_uid = metadata.series_instance_uid
+        reason = "inserted"
+        if series_uid:
+            if series_uid in batch_series:
+                results.append((False, "series_exists"))
+                continue
+            if series_uid in stored_profiles:
+                if profile_rank(metadata.extraction_profile) <= profile_rank(stored_profiles[series_uid]):
+                    results.append((False, "series_exists"))
+                    continue
+                upgraded.append(series_uid)
+                reason = "upgraded"
+            batch_series.add(series_uid)
+        metadata_rows.append(_metadata_row(metadata, file_path))
+        if metadata.private_tags:
+            private_rows.extend(_private_tag_rows(metadata, file_path, metadata.private_tags))
+        results.append((True, reason))
+
+    if upgraded:
+        _delete_series(conn, upgraded)
+    if metadata_rows:
+        conn.executemany(_INSERT_METADATA_SQL, metadata_rows)
+    if private_rows:
+        conn.executemany(_INSERT_PRIVATE_TAG_SQL, private_rows)
+    if commit:
+        conn.commit()
+    return results
+
+
 def insert_private_tags(
     conn: sqlite3.Connection,
     metadata: DICOMMetadata,
@@ -298,50 +772,188 @@ def insert_private_tags(
 ):
     if not private_tags:
         return
-    values = []
-    for tag in private_tags:
-        values.append((
-            tag.get("sop_instance_uid"),
-            metadata.series_instance_uid,
-            metadata.study_instance_uid,
-            file_path,
-            metadata.manufacturer,
-            metadata.modality,
-            tag.get("group_hex"),
-            tag.get("element_hex"),
-            tag.get("creator"),
-            tag.get("vr"),
-            tag.get("value_text"),
-            tag.get("value_num"),
-            tag.get("value_json"),
-            tag.get("value_hex"),
-            tag.get("byte_len"),
-            tag.get("value_hash"),
-            tag.get("classification"),
-        ))
-    conn.executemany(
-        """
-        INSERT OR IGNORE INTO private_tag (
-            sop_instance_uid,
-            series_instance_uid,
-            study_instance_uid,
-            file_path,
-            manufacturer,
-            modality,
-            group_hex,
-            element_hex,
-            creator,
-            vr,
-            value_text,
-            value_num,
-            value_json,
-            value_hex,
-            byte_len,
-            value_hash,
-            classification
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        values
-    )
+    conn.executemany(_INSERT_PRIVATE_TAG_SQL, _private_tag_rows(metadata, file_path, private_tags))
     if commit:
         conn.commit()
+
+
+class MetadataWriter:
+    """Dedicated writer thread that inserts metadata while extraction continues
+
+    Producers call ``put`` with extracted metadata; items go through a bounded
+    queue (so a slow database applies backpressure to extraction) and are
+    inserted with ``insert_metadata_batch`` and committed in transactions of
+    ``commit_rows`` rows or every ``commit_seconds``, whichever comes first. The writer owns ``conn`` until
+    ``close`` returns, so the connection must be opened with
+    ``check_same_thread=False``. Rows put with a ``file_stat`` (size,
+    mtime_ns, inode) are also recorded in ``ingest_manifest`` in the same
+    transaction; ``put_non_dicom`` records files that did not parse.
+    ``touched_studies`` collects the studies of inserted or upgraded rows.
+    ``put_checkpoint`` saves a ``ScanCheckpoint`` in the transaction that
+    commits every row queued before it.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        queue_size: int = 2000,
+        commit_rows: int = 500,
+        commit_seconds: float = 2.0,
+        progress_callback: Optional[Callable[[int], None]] = None,
+    ):
+        self.conn = conn
+        self.commit_rows = commit_rows
+        self.commit_seconds = commit_seconds
+        self.progress_callback = progress_callback
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.inserted = 0
+        self.skipped_duplicates = 0
+        self.skipped_invalid = 0
+        self.upgraded = 0
+        self.new_studies: Set[str] = set()
+        self.touched_studies: Set[str] = set()
+        self.busy_seconds = 0.0
+        self.producer_blocked_seconds = 0.0
+        self.error: Optional[BaseException] = None
+        self._seen_studies: Set[str] = set()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name="metadata-writer", daemon=True)
+
+    def start(self) -> "MetadataWriter":
+        self._started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def put(
+        self,
+        metadata: DICOMMetadata,
+        file_path: str,
+        file_stat: Optional[Tuple[int, int, int]] = None,
+    ) -> None:
+        """Queue one row for insertion, blocking while the queue is full."""
+        self._put((metadata, file_path, file_stat))
+
+    def put_non_dicom(self, file_path: str, file_stat: Tuple[int, int, int]) -> None:
+        """Record a file that failed to parse in the manifest only."""
+        self._put((None, file_path, file_stat))
+
+    def put_checkpoint(self, checkpoint: ScanCheckpoint) -> None:
+        """Queue a checkpoint covering every row put so far."""
+        self._put((checkpoint, None, None))
+
+    def _put(self, item: tuple) -> None:
+        t0 = time.perf_counter()
+        while True:
+            if self.error is not None:
+                raise RuntimeError("metadata writer failed") from self.error
+            try:
+                self.queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.producer_blocked_seconds += time.perf_counter() - t0
+
+    def close(self) -> None:
+        """Flush pending rows, stop the thread and re-raise any writer error."""
+        if self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("metadata writer failed") from self.error
+
+    def stats(self) -> Dict[str, float]:
+        """Per-stage timing: writer busy/idle time and how long producers were blocked."""
+        end = self._finished_at or time.perf_counter()
+        elapsed = end - (self._started_at or end)
+        return {
+            "writer_busy_s": self.busy_seconds,
+            "writer_idle_s": max(0.0, elapsed - self.busy_seconds),
+            "writer_utilization_pct": 100.0 * self.busy_seconds / elapsed if elapsed > 0 else 0.0,
+            "extract_blocked_on_writer_s": self.producer_blocked_seconds,
+        }
+
+    def _flush(self, pending: List[tuple]) -> None:
+        checkpoints = [item[0] for item in pending if isinstance(item[0], ScanCheckpoint)]
+        items = [item for item in pending if not isinstance(item[0], ScanCheckpoint)]
+        entries = [(meta, file_path) for meta, file_path, _ in items if meta is not None]
+        new_uids = {
+            meta.study_instance_uid
+            for meta, _ in entries
+            if meta.study_instance_uid and meta.study_instance_uid not in self._seen_studies
+        }
+        if new_uids:
+            self._seen_studies.update(new_uids)
+            self.new_studies.update(new_uids - existing_studies(self.conn, new_uids))
+
+        manifest_rows = [
+            (file_path, *file_stat, meta.series_instance_uid, meta.extraction_profile)
+            if meta is not None else
+            (file_path, *file_stat, MANIFEST_NON_DICOM, None)
+            for meta, file_path, file_stat in items
+            if file_stat is not None
+        ]
+        if manifest_rows:
+            record_manifest(self.conn, manifest_rows, commit=False)
+
+        for (meta, _), (inserted, reason) in zip(entries, insert_metadata_batch(self.conn, entries, commit=False)):
+            if inserted:
+                self.inserted += 1
+                if meta.study_instance_uid:
+                    self.touched_studies.add(meta.study_instance_uid)
+                if reason == "upgraded":
+                    self.upgraded += 1
+                if self.progress_callback and self.inserted % 10 == 0:
+                    self.progress_callback(self.inserted)
+            elif reason in ("series_exists", "already_exists"):
+                self.skipped_duplicates += 1
+            else:
+                self.skipped_invalid += 1
+        if checkpoints:
+            save_checkpoint(self.conn, checkpoints[-1], commit=False)
+        self.conn.commit()
+        pending.clear()
+
+    def _run(self) -> None:
+        # Inserts run on this thread, which a parent-only cProfile would not see
+        with thread_profile():
+            self._write_loop()
+
+    def _write_loop(self) -> None:
+        pending: List[tuple] = []
+        last_commit = time.perf_counter()
+        try:
+            while True:
+                timeout = max(0.01, self.commit_seconds - (time.perf_counter() - last_commit))
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                t0 = time.perf_counter()
+                if item is self._STOP:
+                    if pending:
+                        self._flush(pending)
+                    self.busy_seconds += time.perf_counter() - t0
+                    break
+                if item is not None:
+                    pending.append(item)
+                now = time.perf_counter()
+                if pending and (len(pending) >= self.commit_rows or now - last_commit >= self.commit_seconds):
+                    self._flush(pending)
+                    last_commit = time.perf_counter()
+                elif not pending:
+                    last_commit = now
+                self.busy_seconds += time.perf_counter() - t0
+        except BaseException as exc:
+            self.error = exc
+            # Drain so blocked producers notice the failure
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+        finally:
+            self._finished_at = time.perf_counter()
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset  # type: ignore[import]
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid  # type: ignore[import]
+
+# The modules are top-level scripts in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PET_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.128"
+
+
+@pytest.fixture
+def write_slice():
+    """Write a small PET slice: ``write_slice(path, study_uid, series_uid, **elements)``.
+
+    Extra keyword arguments are set as dataset elements by keyword;
+    ``private_value`` adds a private block (0013,00xx) holding it.
+    """
+    def _write(path: Path, study_uid: str, series_uid: str, private_value: Optional[str] = None, **elements) -> Path:
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = PET_IMAGE_STORAGE
+        meta.MediaStorageSOPInstanceUID = elements.pop("SOPInstanceUID", None) or generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = meta.MediaStorageSOPClassUID
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = "PT"
+        ds.PatientID = "P1"
+        ds.StudyDate = "20240101"
+        ds.SeriesNumber = 1
+        for keyword, value in elements.items():
+            setattr(ds, keyword, value)
+        if private_value is not None:
+            ds.private_block(0x0013, "TEST", create=True).add_new(0x10, "LO", private_value)
+        ds.Rows = 2
+        ds.Columns = 2
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = 8
+        ds.BitsStored = 8
+        ds.HighBit = 7
+        ds.PixelRepresentation = 0
+        ds.PixelData = bytes(4)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        ds.save_as(path, enforce_file_format=True)
+        return path
+
+    return _write
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return str(tmp_path / "test.db")
@@ -0,0 +1,164 @@
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pydicom  # type: ignore[import]
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset  # type: ignore[import]
+from pydicom.sequence import Sequence  # type: ignore[import]
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian, generate_uid  # type: ignore[import]
+
+import archive_members
+from archive_members import PixelDataFinder, iter_tar_members, open_member, read_header_bytes
+
+
+def _image(ds: Dataset, size: int) -> None:
+    ds.Rows = size
+    ds.Columns = size
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.PixelData = bytes(size * size)
+
+
+def _write_with_icon(path: Path, implicit: bool = False, defined_length: bool = False) -> Path:
+    """RT structure set with a Pixel Data inside IconImageSequence and elements after it."""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.481.3"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ImplicitVRLittleEndian if implicit else ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = "RTSTRUCT"
+    icon = Dataset()
+    _image(icon, 64)
+    ds.IconImageSequence = Sequence([icon])
+    if defined_length:
+        ds["IconImageSequence"].is_undefined_length = False
+    # (3006,0002) follows the icon's Pixel Data in file order
+    ds.StructureSetLabel = "PLAN"
+    ds.StructureSetName = "Prostate"
+    _image(ds, 4)
+    ds.save_as(path, enforce_file_format=True, implicit_vr=implicit, little_endian=True)
+    return path
+
+
+def _tags(data: bytes) -> list:
+    return [elem.tag for elem in pydicom.dcmread(io.BytesIO(data), force=True)]
+
+
+def _disk_tags(path: Path) -> list:
+    return [elem.tag for elem in pydicom.dcmread(path, stop_before_pixels=True)]
+
+
+@pytest.mark.parametrize("implicit", [False, True])
+@pytest.mark.parametrize("defined_length", [False, True])
+def test_header_is_cut_at_top_level_pixel_data_only(tmp_path, implicit, defined_length):
+    path = _write_with_icon(tmp_path / "rt.dcm", implicit, defined_length)
+    with open(path, "rb") as fh:
+        data = read_header_bytes(fh)
+
+    ds = pydicom.dcmread(io.BytesIO(data), force=True)
+    assert ds.StructureSetLabel == "PLAN"
+    assert "PixelData" in ds.IconImageSequence[0]
+    assert "PixelData" not in ds
+    assert _tags(data) == _disk_tags(path)
+
+
+def test_header_is_found_across_small_chunks(tmp_path, monkeypatch):
+    path = _write_with_icon(tmp_path / "rt.dcm")
+    monkeypatch.setattr(archive_members, "HEADER_READ_CHUNK", 7)
+    with open(path, "rb") as fh:
+        data = read_header_bytes(fh)
+    assert _tags(data) == _disk_tags(path)
+
+
+def test_tar_member_keeps_elements_after_nested_pixel_data(tmp_path):
+    source = _write_with_icon(tmp_path / "rt.dcm")
+    archive = tmp_path / "scan.tar"
+    with tarfile.open(archive, "w") as tf:
+        tf.add(source, arcname="scan/rt.dcm")
+
+    (member,) = list(iter_tar_members(archive))
+    with open_member(member) as fh:
+        ds = pydicom.dcmread(fh, stop_before_pixels=True, force=True)
+    assert ds.StructureSetLabel == "PLAN"
+    assert _tags(member.data) == _disk_tags(source)
+
+
+def test_7z_writer_keeps_elements_after_nested_pixel_data(tmp_path):
+    py7zr = pytest.importorskip("py7zr")
+    source = _write_with_icon(tmp_path / "rt.dcm")
+    archive = tmp_path / "scan.7z"
+    with py7zr.SevenZipFile(archive, "w") as sz:
+        sz.write(source, arcname="scan/rt.dcm")
+
+    members = archive_members.list_7z_members(archive)
+    (member,) = list(archive_members.iter_7z_members(archive, members))
+    assert pydicom.dcmread(io.BytesIO(member.data), force=True).StructureSetLabel == "PLAN"
+    assert _tags(member.data) == _disk_tags(source)
+
+
+def test_finder_waits_for_more_bytes(tmp_path):
+    data = _write_with_icon(tmp_path / "rt.dcm").read_bytes()
+    finder = PixelDataFinder()
+    buffer = bytearray()
+    index = -1
+    for start in range(0, len(data), 100):
+        buffer += data[start:start + 100]
+        index = finder.find(buffer)
+        if index >= 0:
+            break
+    assert index == len(read_header_bytes(io.BytesIO(data)))
+    assert data[index:index + 4] == b"\xe0\x7f\x10\x00"
+
+
+def _zip_with_member(path: Path, source: Path) -> Path:
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.write(source, arcname="scan/rt.dcm")
+    return path
+
+
+def test_zip_handle_cache_closes_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_members, "ZIP_HANDLE_CACHE_SIZE", 2)
+    source = _write_with_icon(tmp_path / "rt.dcm")
+    members = [
+        archive_members.ArchiveMember(_zip_with_member(tmp_path / f"{index}.zip", source), "scan/rt.dcm", 0)
+        for index in range(3)
+    ]
+    handles = []
+    try:
+        for member in members:
+            with open_member(member) as fh:
+                assert fh.read(4)
+            handles.append(archive_members._ZIP_HANDLES[str(member.archive_path)])
+        assert list(archive_members._ZIP_HANDLES) == [str(m.archive_path) for m in members[1:]]
+        assert handles[0].fp is None
+
+        archive_members.close_zip_handles(members[1].archive_path)
+        assert handles[1].fp is None and handles[2].fp is not None
+    finally:
+        archive_members.close_zip_handles()
+    assert not archive_members._ZIP_HANDLES
+    assert handles[2].fp is None
+
+
+def test_member_stays_readable_after_its_handle_is_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_members, "ZIP_HANDLE_CACHE_SIZE", 1)
+    source = _write_with_icon(tmp_path / "rt.dcm")
+    first = archive_members.ArchiveMember(_zip_with_member(tmp_path / "a.zip", source), "scan/rt.dcm", 0)
+    second = archive_members.ArchiveMember(_zip_with_member(tmp_path / "b.zip", source), "scan/rt.dcm", 0)
+    try:
+        with open_member(first) as fh:
+            open_member(second).close()
+            assert fh.read() == source.read_bytes()
+    finally:
+        archive_members.close_zip_handles()
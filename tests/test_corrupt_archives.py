@@ -0,0 +1,52 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from pydicom.uid import generate_uid  # type: ignore[import]
+
+from archive_members import ArchiveError
+from process_dicom import process_directory
+
+
+def _zip_archive(tmp_path, write_slice) -> bytes:
+    study_uid, series_uid = generate_uid(), generate_uid()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for index in range(20):
+            path = write_slice(tmp_path / "src" / f"IM{index}.dcm", study_uid, series_uid)
+            zf.write(path, arcname=f"scan/IM{index}.dcm")
+    return buffer.getvalue()
+
+
+def test_truncated_zip_raises(tmp_path, write_slice, db_path):
+    archive = tmp_path / "cut.zip"
+    archive.write_bytes(_zip_archive(tmp_path, write_slice)[:1000])
+    with pytest.raises(ArchiveError):
+        process_directory(str(archive), db_path=db_path, max_workers=1)
+
+
+def test_truncated_tar_raises(tmp_path, write_slice, db_path):
+    source = tmp_path / "src"
+    for index in range(20):
+        write_slice(source / f"IM{index}.dcm", "1.2.3", "1.2.3.4")
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        tf.add(source, arcname="scan")
+    archive = tmp_path / "cut.tar.gz"
+    archive.write_bytes(buffer.getvalue()[:1000])
+    with pytest.raises(ArchiveError):
+        process_directory(str(archive), db_path=db_path, max_workers=1)
+
+
+def test_upload_of_truncated_zip_fails(tmp_path, write_slice, monkeypatch):
+    webui = pytest.importorskip("webui")
+    monkeypatch.setattr(webui, "DATABANK_DIR", tmp_path / "Databanks")
+    data = _zip_archive(tmp_path, write_slice)[:1000]
+    response = webui.app.test_client().post(
+        "/upload",
+        data={"db": "upload.db", "file": (io.BytesIO(data), "cut.zip")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
@@ -0,0 +1,54 @@
+import os
+
+from discover_files import PARTIAL_HASH_BYTES, FileRecord, drop_duplicate_files
+
+
+def _record(path):
+    stat = path.stat()
+    return FileRecord(path, stat.st_size, stat.st_mtime, stat.st_mtime_ns, stat.st_ino)
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return _record(path)
+
+
+def test_identical_copies_keep_the_smallest_path(tmp_path):
+    data = os.urandom(3 * PARTIAL_HASH_BYTES)
+    records = [_write(tmp_path / name / "IM0.dcm", data) for name in ("export", "DICOM", "copy")]
+    kept, duplicates = drop_duplicate_files(records)
+    assert duplicates == 2
+    assert [record.path for record in kept] == [tmp_path / "DICOM" / "IM0.dcm"]
+
+
+def test_files_differing_only_past_the_fingerprint_are_kept(tmp_path):
+    head = os.urandom(PARTIAL_HASH_BYTES)
+    tail = os.urandom(PARTIAL_HASH_BYTES)
+    # Same size, head and tail; the middle holds e.g. the SOP Instance UID
+    records = [
+        _write(tmp_path / name, head + middle + tail)
+        for name, middle in (("a.dcm", b"1.2.3.1" + bytes(100)), ("b.dcm", b"1.2.3.2" + bytes(100)))
+    ]
+    kept, duplicates = drop_duplicate_files(records)
+    assert duplicates == 0
+    assert kept == records
+
+
+def test_small_files_are_compared_whole(tmp_path):
+    records = [
+        _write(tmp_path / "a.dcm", b"x" * 100),
+        _write(tmp_path / "b.dcm", b"x" * 100),
+        _write(tmp_path / "c.dcm", b"y" * 100),
+    ]
+    kept, duplicates = drop_duplicate_files(records)
+    assert duplicates == 1
+    assert [record.path.name for record in kept] == ["a.dcm", "c.dcm"]
+
+
+def test_unreadable_files_are_kept(tmp_path):
+    records = [_write(tmp_path / name, b"x" * 100) for name in ("a.dcm", "b.dcm")]
+    records.append(FileRecord(tmp_path / "gone.dcm", 100, 0.0))
+    kept, duplicates = drop_duplicate_files(records)
+    assert duplicates == 1
+    assert [record.path.name for record in kept] == ["a.dcm", "gone.dcm"]
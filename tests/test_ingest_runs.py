@@ -0,0 +1,144 @@
+import io
+import json
+import multiprocessing
+import sqlite3
+import tarfile
+import threading
+
+import pytest
+
+import process_dicom
+from archive_members import ArchiveError
+from process_dicom import process_directory
+
+
+def _runs(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT run_id, status FROM ingest_run ORDER BY run_id").fetchall()
+
+
+def _scan_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM ingest_run_scan").fetchone()[0]
+
+
+def _truncated_tar(tmp_path, write_slice):
+    source = tmp_path / "src"
+    for index in range(20):
+        write_slice(source / f"IM{index}.dcm", "1.2.3", "1.2.3.4")
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        tf.add(source, arcname="scan")
+    archive = tmp_path / "cut.tar.gz"
+    archive.write_bytes(buffer.getvalue()[:1000])
+    return archive
+
+
+def test_failed_scan_cleans_up_and_marks_run_failed(tmp_path, write_slice, db_path, monkeypatch):
+    archive = _truncated_tar(tmp_path, write_slice)
+    connections = []
+    init_database = process_dicom.init_database
+    monkeypatch.setattr(
+        process_dicom, "init_database",
+        lambda *args, **kwargs: connections.append(init_database(*args, **kwargs)) or connections[-1],
+    )
+
+    with pytest.raises(ArchiveError):
+        process_directory(str(archive), db_path=db_path, max_workers=1, series_first=True)
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute("SELECT 1")
+    assert not multiprocessing.active_children()
+    assert not [thread for thread in threading.enumerate() if thread.name == "metadata-writer"]
+    assert [status for _, status in _runs(db_path)] == ["failed"]
+    assert _scan_rows(db_path) == 0
+
+    # A failed run is not resumed
+    with pytest.raises(ArchiveError):
+        process_directory(str(archive), db_path=db_path, max_workers=1, resume=True)
+    assert [status for _, status in _runs(db_path)] == ["failed", "failed"]
+
+
+def test_completed_run_drops_its_scan_checkpoints(tmp_path, write_slice, db_path):
+    for scan in ("scan0", "scan1"):
+        write_slice(tmp_path / "in" / scan / "IM0.dcm", f"1.2.{scan[-1]}", f"1.2.{scan[-1]}.1")
+    process_directory(str(tmp_path / "in"), db_path=db_path, max_workers=1)
+    process_directory(str(tmp_path / "in"), db_path=db_path, max_workers=1)
+    assert [status for _, status in _runs(db_path)] == ["completed", "completed"]
+    assert _scan_rows(db_path) == 0
+
+
+def _two_scans(root, write_slice, files=4):
+    for scan in ("scan0", "scan1"):
+        for index in range(files):
+            write_slice(root / scan / f"IM{index}.dcm", f"1.2.{scan[-1]}", f"1.2.{scan[-1]}.{index}")
+    return root
+
+
+def _counts(report_path):
+    return json.loads(report_path.read_text())["counts"]
+
+
+def test_resume_skips_completed_scans(tmp_path, write_slice, db_path, monkeypatch):
+    root = _two_scans(tmp_path / "in", write_slice)
+    process_single_scan = process_dicom.process_single_scan
+
+    def _killed_in_scan1(scan_dir, *args, **kwargs):
+        if scan_dir.name == "scan1":
+            raise KeyboardInterrupt
+        return process_single_scan(scan_dir, *args, **kwargs)
+
+    monkeypatch.setattr(process_dicom, "process_single_scan", _killed_in_scan1)
+    with pytest.raises(KeyboardInterrupt):
+        process_directory(str(root), db_path=db_path, max_workers=1)
+    # An interrupted run stays resumable
+    assert [status for _, status in _runs(db_path)] == ["running"]
+    monkeypatch.setattr(process_dicom, "process_single_scan", process_single_scan)
+
+    report = tmp_path / "resume.json"
+    process_directory(str(root), db_path=db_path, max_workers=1, resume=True, report_path=str(report))
+    assert _counts(report)["processed"] == 4
+    assert [status for _, status in _runs(db_path)] == ["completed"]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(DISTINCT study_instance_uid) FROM dicom_metadata").fetchone()[0] == 2
+
+
+def test_resume_continues_after_the_last_checkpoint(tmp_path, write_slice, db_path, monkeypatch):
+    root = tmp_path / "in"
+    for index in range(6):
+        write_slice(root / f"IM{index}.dcm", "1.2.5", f"1.2.5.{index}")
+    monkeypatch.setattr(process_dicom, "CHECKPOINT_FILES", 2)
+    iter_metadata_from_paths = process_dicom.iter_metadata_from_paths
+
+    def _killed_after_three_files(*args, **kwargs):
+        for index, item in enumerate(iter_metadata_from_paths(*args, **kwargs)):
+            if index == 3:
+                raise KeyboardInterrupt
+            yield item
+
+    monkeypatch.setattr(process_dicom, "iter_metadata_from_paths", _killed_after_three_files)
+    with pytest.raises(KeyboardInterrupt):
+        process_directory(str(root), db_path=db_path, max_workers=1)
+    with sqlite3.connect(db_path) as conn:
+        last_file, files_done = conn.execute("SELECT last_file, files_done FROM ingest_run_scan").fetchone()
+    assert (last_file, files_done) == ("IM1.dcm", 2)
+    monkeypatch.setattr(process_dicom, "iter_metadata_from_paths", iter_metadata_from_paths)
+
+    report = tmp_path / "resume.json"
+    process_directory(str(root), db_path=db_path, max_workers=1, resume=True, report_path=str(report))
+    counts = _counts(report)
+    # IM0/IM1 are behind the checkpoint; IM2 was stored after it and is found again
+    assert counts["skipped_existing"] == 2
+    assert counts["processed"] == 3
+    assert [status for _, status in _runs(db_path)] == ["completed"]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM dicom_metadata").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM pruned_series").fetchone()[0] == 5
+
+
+def test_empty_input_completes_its_run(tmp_path, db_path):
+    (tmp_path / "empty").mkdir()
+    process_directory(str(tmp_path / "empty"), db_path=db_path)
+    assert [status for _, status in _runs(db_path)] == ["completed"]
+    process_directory(str(tmp_path / "empty"), db_path=db_path, resume=True)
+    assert [status for _, status in _runs(db_path)] == ["completed", "completed"]
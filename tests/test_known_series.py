@@ -0,0 +1,104 @@
+import json
+import sqlite3
+from pathlib import Path
+
+from extract_metadata import ReadOptions
+from process_dicom import drop_known_series, process_directory
+from store_metadata import (
+    KNOWN_SERIES_FALSE_POSITIVE_RATE,
+    BloomFilter,
+    confirm_known_series,
+    init_database,
+    load_known_series,
+)
+
+
+def _write_study(root, write_slice, files_per_series=3):
+    """One study with a scored PET series and an unscored CT series (pruned)."""
+    for index in range(files_per_series):
+        write_slice(
+            root / "scan" / "pet" / f"IM{index}.dcm", "1.2.9", "1.2.9.1",
+            PatientWeight="70", AcquisitionDate="20240101", AcquisitionTime="090000",
+        )
+        write_slice(root / "scan" / "ct" / f"IM{index}.dcm", "1.2.9", "1.2.9.2", Modality="CT")
+
+
+def _ingest(root, db_path, report_path, **options):
+    process_directory(str(root), db_path=db_path, max_workers=1, report_path=str(report_path), **options)
+    return json.loads(report_path.read_text())["counts"]
+
+
+def test_pruned_series_are_skipped_on_reingest(tmp_path, write_slice, db_path):
+    _write_study(tmp_path / "in", write_slice)
+    _ingest(tmp_path / "in", db_path, tmp_path / "first.json")
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT series_instance_uid FROM dicom_metadata").fetchall() == [("1.2.9.1",)]
+        assert conn.execute("SELECT series_instance_uid FROM pruned_series").fetchall() == [("1.2.9.2",)]
+
+    counts = _ingest(tmp_path / "in", db_path, tmp_path / "second.json", skip_known_series=True)
+    assert counts["skipped_known_series"] == 6
+    assert counts["processed"] == 0
+
+
+def test_representative_series_is_forgotten_as_pruned(tmp_path, write_slice, db_path):
+    # The CT series alone is representative of its study
+    write_slice(tmp_path / "in" / "scan" / "ct" / "IM0.dcm", "1.2.9", "1.2.9.2", Modality="CT")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE pruned_series (series_instance_uid TEXT PRIMARY KEY, "
+                     "study_instance_uid TEXT, extraction_profile TEXT)")
+        conn.execute("INSERT INTO pruned_series VALUES ('1.2.9.2', '1.2.9', 'full-private')")
+    process_directory(str(tmp_path / "in"), db_path=db_path, max_workers=1)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM pruned_series").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM dicom_metadata").fetchone()[0] == 1
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    known = BloomFilter(1000)
+    members = [f"1.2.826.{index}" for index in range(1000)]
+    for uid in members:
+        known.add(uid)
+    assert all(uid in known for uid in members)
+    false_positives = sum(f"1.3.999.{index}" in known for index in range(10000))
+    assert false_positives < 10000 * 3 * KNOWN_SERIES_FALSE_POSITIVE_RATE
+    assert 1 not in known
+
+
+def _stored_conn(tmp_path, write_slice, db_path):
+    write_slice(tmp_path / "in" / "a" / "IM0.dcm", "1.1", "1.1.1")
+    write_slice(tmp_path / "in" / "b" / "IM0.dcm", "2.1", "2.1.1")
+    process_directory(str(tmp_path / "in" / "a"), db_path=db_path, max_workers=1)
+    process_directory(str(tmp_path / "in" / "b"), db_path=db_path, max_workers=1,
+                      read_options=ReadOptions(profile="core"))
+    return init_database(db_path)
+
+
+def test_filter_positives_are_confirmed_exactly(tmp_path, write_slice, db_path):
+    conn = _stored_conn(tmp_path, write_slice, db_path)
+    # A filter this small answers yes for everything
+    saturated = BloomFilter(1)
+    saturated.bits[:] = b"\xff" * len(saturated.bits)
+    assert "9.9.9" in saturated
+    assert confirm_known_series(conn, saturated, {"1.1.1", "2.1.1", "9.9.9"}, "core") == {
+        "1.1.1": "full-private",
+        "2.1.1": "core",
+    }
+    # Series stored with a cheaper profile are not confirmed, so they are upgraded
+    assert confirm_known_series(conn, saturated, {"1.1.1", "2.1.1"}) == {"1.1.1": "full-private"}
+
+    known = load_known_series(conn, "full-private")
+    assert "1.1.1" in known and len(known) == 1
+    conn.close()
+
+
+def test_drop_known_series_keeps_new_and_unreadable_files(tmp_path, write_slice, db_path):
+    conn = _stored_conn(tmp_path, write_slice, db_path)
+    probed = [
+        (Path("a.dcm"), ("1.1", "1.1.1", "1")),
+        (Path("new.dcm"), ("3.1", "3.1.1", "2")),
+        (Path("broken.dcm"), None),
+    ]
+    kept, dropped = drop_known_series(conn, probed, load_known_series(conn))
+    assert [path for path, _ in kept] == [Path("new.dcm"), Path("broken.dcm")]
+    assert dropped == {Path("a.dcm"): ("1.1.1", "full-private")}
+    conn.close()
@@ -0,0 +1,81 @@
+import sqlite3
+
+from maintain_db import AUTO_VACUUM_INCREMENTAL, MaintenanceThresholds, database_health, run_maintenance
+from store_metadata import init_database, record_changes
+
+QUIET = {"log": lambda message: None}
+
+
+def _add_rows(conn, count, padding=0):
+    conn.executemany(
+        "INSERT INTO dicom_metadata (series_instance_uid, file_path) VALUES (?, ?)",
+        [(f"1.2.{index}", "x" * padding) for index in range(count)],
+    )
+    conn.commit()
+
+
+def test_nothing_is_due_on_a_fresh_databank(db_path):
+    conn = init_database(db_path)
+    assert run_maintenance(conn, **QUIET) == []
+    assert run_maintenance(conn, force=True, **QUIET) == ["reclaim", "analyze", "checkpoint"]
+    conn.close()
+
+
+def test_analyze_waits_for_enough_changed_rows(db_path):
+    conn = init_database(db_path)
+    record_changes(conn, 999)
+    assert "analyze" not in run_maintenance(conn, **QUIET)
+    record_changes(conn, 1)
+    assert "analyze" in run_maintenance(conn, **QUIET)
+    assert database_health(conn)["pending_changes"] == 0
+    conn.close()
+
+
+def test_analyze_waits_for_a_share_of_the_series_rows(db_path):
+    conn = init_database(db_path)
+    _add_rows(conn, 10)
+    thresholds = MaintenanceThresholds(analyze_changes=1, analyze_ratio=0.5)
+    record_changes(conn, 4)
+    assert "analyze" not in run_maintenance(conn, thresholds, **QUIET)
+    record_changes(conn, 1)
+    assert "analyze" in run_maintenance(conn, thresholds, **QUIET)
+    conn.close()
+
+
+def test_free_pages_are_reclaimed_past_both_thresholds(db_path):
+    conn = init_database(db_path)
+    _add_rows(conn, 200, padding=4000)
+    conn.execute("DELETE FROM dicom_metadata")
+    conn.commit()
+    free_pages = database_health(conn)["freelist_count"]
+    assert free_pages > 100
+
+    assert "reclaim" not in run_maintenance(conn, MaintenanceThresholds(min_free_pages=free_pages + 1), **QUIET)
+    assert "reclaim" not in run_maintenance(conn, MaintenanceThresholds(min_free_pages=1, freelist_ratio=1.0), **QUIET)
+    assert "reclaim" in run_maintenance(conn, MaintenanceThresholds(min_free_pages=1), **QUIET)
+    assert database_health(conn)["freelist_count"] == 0
+    conn.close()
+
+
+def test_reclaim_switches_old_databanks_to_incremental_vacuum(db_path):
+    # Databanks created before incremental auto-vacuum keep auto_vacuum=none
+    with sqlite3.connect(db_path) as old:
+        old.execute("CREATE TABLE legacy (id INTEGER)")
+    conn = init_database(db_path)
+    assert database_health(conn)["auto_vacuum"] == 0
+    assert "reclaim" in run_maintenance(conn, force=True, **QUIET)
+    assert database_health(conn)["auto_vacuum"] == AUTO_VACUUM_INCREMENTAL
+    conn.close()
+
+
+def test_wal_is_truncated_past_its_threshold(db_path):
+    conn = init_database(db_path)
+    _add_rows(conn, 50, padding=4000)
+    wal_mb = database_health(conn)["wal_mb"]
+    assert wal_mb > 0
+
+    assert "checkpoint" not in run_maintenance(conn, MaintenanceThresholds(wal_mb=wal_mb * 2), **QUIET)
+    assert "checkpoint" in run_maintenance(conn, MaintenanceThresholds(wal_mb=wal_mb / 2), **QUIET)
+    # Only the maintenance bookkeeping written after the checkpoint is left
+    assert database_health(conn)["wal_mb"] < wal_mb / 2
+    conn.close()
@@ -0,0 +1,58 @@
+import json
+import os
+import sqlite3
+
+from extract_metadata import ReadOptions
+from process_dicom import process_directory
+from store_metadata import MANIFEST_NON_DICOM
+
+
+def _ingest(root, db_path, report_path, **options):
+    process_directory(
+        str(root), db_path=db_path, max_workers=1, skip_unchanged=True,
+        report_path=str(report_path), **options,
+    )
+    return json.loads(report_path.read_text())["counts"]
+
+
+def _tree(root, write_slice):
+    for index in range(3):
+        write_slice(root / "scan" / f"IM{index}.dcm", "1.2.7", "1.2.7.1")
+    (root / "scan" / "broken.dcm").write_bytes(b"not a dicom file")
+
+
+def test_unchanged_files_are_skipped_without_parsing(tmp_path, write_slice, db_path):
+    _tree(tmp_path / "in", write_slice)
+    first = _ingest(tmp_path / "in", db_path, tmp_path / "r1.json")
+    assert first["processed"] == 1
+    with sqlite3.connect(db_path) as conn:
+        rows = dict(conn.execute("SELECT file_path, series_instance_uid FROM ingest_manifest"))
+    assert len(rows) == 4
+    assert rows["scan/broken.dcm"] == MANIFEST_NON_DICOM
+
+    second = _ingest(tmp_path / "in", db_path, tmp_path / "r2.json")
+    assert second["skipped_existing"] == 4
+    assert second.get("invalid", 0) == 0
+
+
+def test_changed_files_are_read_again(tmp_path, write_slice, db_path):
+    _tree(tmp_path / "in", write_slice)
+    _ingest(tmp_path / "in", db_path, tmp_path / "r1.json")
+    changed = tmp_path / "in" / "scan" / "IM1.dcm"
+    stat = changed.stat()
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    counts = _ingest(tmp_path / "in", db_path, tmp_path / "r2.json")
+    assert counts["skipped_existing"] == 3
+
+
+def test_cheaper_profile_entries_are_read_again(tmp_path, write_slice, db_path):
+    _tree(tmp_path / "in", write_slice)
+    _ingest(tmp_path / "in", db_path, tmp_path / "r1.json", read_options=ReadOptions(profile="core"))
+    counts = _ingest(tmp_path / "in", db_path, tmp_path / "r2.json")
+    # Only the non-DICOM entry stays skipped; the DICOM files are upgraded
+    assert counts["skipped_existing"] == 1
+    assert counts["upgraded"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT DISTINCT extraction_profile FROM ingest_manifest "
+                            "WHERE series_instance_uid != ?", (MANIFEST_NON_DICOM,)).fetchall() == [("full-private",)]
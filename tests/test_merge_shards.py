@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from extract_metadata import ReadOptions
+from merge_shards import merge_shard_databases
+from process_dicom import process_directory, shard_db_path
+
+
+def _shard(tmp_path, name, write_slice, series, profile="full-private"):
+    """Ingest ``series`` [(study, series, private value, elements)] into a shard databank."""
+    source = tmp_path / name
+    for study_uid, series_uid, private_value, elements in series:
+        write_slice(source / f"{series_uid}.dcm", study_uid, series_uid, private_value=private_value, **elements)
+    db_path = str(tmp_path / f"{name}.db")
+    process_directory(str(source), db_path=db_path, max_workers=1, shard=(0, 1),
+                      read_options=ReadOptions(profile=profile))
+    return shard_db_path(db_path, (0, 1))
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {
+            row[0]: row[1:]
+            for row in conn.execute(
+                "SELECT series_instance_uid, extraction_profile, patient_name, "
+                "(SELECT COUNT(*) FROM private_tag p WHERE p.series_instance_uid = m.series_instance_uid) "
+                "FROM dicom_metadata m"
+            )
+        }
+
+
+def test_shards_are_merged_and_pruned_once(tmp_path, write_slice):
+    scored = {"PatientWeight": "70", "Modality": "PT"}
+    first = _shard(tmp_path, "a", write_slice, [("1.1", "1.1.1", "A", {"Modality": "CT"})])
+    # The study's better series is only in the second shard
+    second = _shard(tmp_path, "b", write_slice, [("1.1", "1.1.2", "B", scored), ("2.1", "2.1.1", None, {})])
+    target = str(tmp_path / "merged.db")
+    merge_shard_databases(target, [first, second])
+    rows = _rows(target)
+    assert set(rows) == {"1.1.2", "2.1.1"}
+    assert rows["1.1.2"][2] == 1
+
+
+def test_richer_profile_replaces_the_stored_row(tmp_path, write_slice):
+    core = _shard(tmp_path, "core", write_slice, [("1.1", "1.1.1", "A", {"PatientName": "Core"})], "core")
+    full = _shard(tmp_path, "full", write_slice, [("1.1", "1.1.1", "A", {"PatientName": "Full"})])
+    target = str(tmp_path / "merged.db")
+    merge_shard_databases(target, [core, full])
+    assert _rows(target)["1.1.1"] == ("full-private", "Full", 1)
+
+    # A cheaper shard merged later does not downgrade it
+    merge_shard_databases(target, [_shard(tmp_path, "core2", write_slice,
+                                           [("1.1", "1.1.1", "A", {"PatientName": "Later"})], "core")])
+    assert _rows(target)["1.1.1"] == ("full-private", "Full", 1)
+
+
+def test_tie_keeps_the_target_row(tmp_path, write_slice):
+    first = _shard(tmp_path, "a", write_slice, [("1.1", "1.1.1", "A", {"PatientName": "First"})])
+    second = _shard(tmp_path, "b", write_slice, [("1.1", "1.1.1", "B", {"PatientName": "Second"})])
+    target = str(tmp_path / "merged.db")
+    merge_shard_databases(target, [first, second])
+    # Only the kept row's private tags are copied
+    assert _rows(target)["1.1.1"] == ("full-private", "First", 1)
+
+
+def test_missing_shard_merges_nothing(tmp_path, write_slice):
+    first = _shard(tmp_path, "a", write_slice, [("1.1", "1.1.1", None, {})])
+    target = tmp_path / "merged.db"
+    with pytest.raises(FileNotFoundError):
+        merge_shard_databases(str(target), [first, str(tmp_path / "missing.db")])
+    assert not target.exists()
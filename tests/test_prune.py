@@ -0,0 +1,76 @@
+import sqlite3
+
+import process_dicom
+from process_dicom import prune_non_representative_series
+from store_metadata import init_database
+
+# (study, series, modality, patient weight, acquisition time); UID-less rows are never kept
+ROWS = [
+    ("1.1", "1.1.1", "CT", None, None),
+    ("1.1", "1.1.2", "PT", "70", "090000"),
+    ("1.1", "1.1.3", "PT", None, None),
+    ("2.1", "2.1.1", "MR", None, None),
+    ("3.1", "3.1.1", "PT", None, "100000"),
+    ("3.1", "3.1.2", "NM", None, "100000"),
+    ("4.1", "4.1.1", "CT", None, None),
+    ("4.1", "4.1.2", "CT", None, None),
+    (None, "5.1.1", "PT", None, None),
+    ("", None, "PT", None, None),
+]
+
+
+def _databank(path):
+    conn = init_database(str(path))
+    for study_uid, series_uid, modality, weight, acquisition_time in ROWS:
+        conn.execute(
+            "INSERT INTO dicom_metadata (file_path, study_instance_uid, series_instance_uid, modality, "
+            "patient_weight, acquisition_date, acquisition_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f"{series_uid}.dcm", study_uid, series_uid, modality, weight,
+             "20240101" if acquisition_time else None, acquisition_time),
+        )
+        conn.execute(
+            "INSERT INTO private_tag (series_instance_uid, study_instance_uid, group_hex, element_hex, value_hash) "
+            "VALUES (?, ?, '0013', '0010', 'x')",
+            (series_uid, study_uid),
+        )
+    conn.commit()
+    return conn
+
+
+def _contents(conn):
+    return {
+        table: sorted(conn.execute(query).fetchall(), key=repr)
+        for table, query in (
+            ("dicom_metadata", "SELECT study_instance_uid, series_instance_uid, is_representative FROM dicom_metadata"),
+            ("private_tag", "SELECT series_instance_uid FROM private_tag"),
+            ("pruned_series", "SELECT * FROM pruned_series"),
+        )
+    }
+
+
+def test_incremental_prune_matches_full_prune(tmp_path, monkeypatch):
+    # Small chunks so the studies are pruned across several batches
+    monkeypatch.setattr(process_dicom, "PRUNE_STUDY_CHUNK", 2)
+    full = _databank(tmp_path / "full.db")
+    incremental = _databank(tmp_path / "incremental.db")
+
+    full_removed = prune_non_representative_series(full)
+    study_uids = [row[0] for row in ROWS] + ["9.9"]
+    incremental_removed = prune_non_representative_series(incremental, study_uids)
+
+    assert incremental_removed == full_removed == 6
+    assert _contents(incremental) == _contents(full)
+    kept = [series_uid for _, series_uid, _ in _contents(full)["dicom_metadata"]]
+    assert sorted(kept) == ["1.1.2", "2.1.1", "3.1.1", "4.1.1"]
+    full.close()
+    incremental.close()
+
+
+def test_incremental_prune_leaves_other_studies_alone(tmp_path):
+    conn = _databank(tmp_path / "test.db")
+    prune_non_representative_series(conn, ["1.1"])
+    study_uids = [row[0] for row in conn.execute("SELECT study_instance_uid FROM dicom_metadata")]
+    assert study_uids.count("1.1") == 1
+    assert study_uids.count("4.1") == 2
+    assert [row[0] for row in conn.execute("SELECT series_instance_uid FROM pruned_series")] == ["1.1.1", "1.1.3"]
+    conn.close()
@@ -9,9 +9,9 @@ TRANSLATIONS = {
         'database': 'Database',
         'upload': 'Upload',
         'close_upload': 'Close Upload',
-        'drop_files': 'Drop ZIP or 7Z files here',
+        'drop_files': 'Drop ZIP, 7Z or TAR files here',
         'click_to_browse': 'or click to browse',
-        'supports': 'Supports: .zip, .7z',
+        'supports': 'Supports: .zip, .7z, .tar, .tar.gz',
         'uploading': 'Uploading',
         'processing': 'Processing...',
         'success': 'Success',
@@ -262,9 +262,9 @@ TRANSLATIONS = {
         'database': 'Datenbank',
         'upload': 'Hochladen',
         'close_upload': 'Upload schließen',
-        'drop_files': 'ZIP- oder 7Z-Dateien hier ablegen',
+        'drop_files': 'ZIP-, 7Z- oder TAR-Dateien hier ablegen',
         'click_to_browse': 'oder klicken zum Durchsuchen',
-        'supports': 'Unterstützt: .zip, .7z',
+        'supports': 'Unterstützt: .zip, .7z, .tar, .tar.gz',
         'uploading': 'Wird hochgeladen',
         'processing': 'Wird verarbeitet...',
         'success': 'Erfolg',
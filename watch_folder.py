@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Watch-folder mode for continuous ingestion
+Picks up files as a DICOM router drops them and ingests each directory once it stops changing
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from discover_files import (
+    DICOM_SUFFIXES,
+    FileRecord,
+    discover_files,
+    is_ignored_name,
+    sniff_dicom_files,
+)
+from extract_metadata import ReadOptions
+from process_dicom import process_single_scan, prune_and_maintain, resolve_db_path
+from store_metadata import init_database
+
+try:
+    from inotify_simple import INotify, flags  # type: ignore[import]
+except ImportError:  # pragma: no cover - optional dependency
+    INotify = None
+    flags = None
+
+INOTIFY_AVAILABLE = INotify is not None
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_SETTLE_SECONDS = 2.0
+
+
+def _stat_record(path: Path) -> Optional[FileRecord]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return FileRecord(path, stat.st_size, stat.st_mtime, stat.st_mtime_ns, stat.st_ino)
+
+
+class PollingWatcher:
+    """Finds new or modified files by re-walking the tree every ``interval`` seconds"""
+
+    def __init__(self, root: Path, suffixes: Optional[Tuple[str, ...]], interval: float):
+        self.root = root
+        self.suffixes = suffixes
+        self.interval = interval
+        self._known: Dict[Path, Tuple[int, int]] = {}
+        self._first = True
+
+    def changes(self) -> List[FileRecord]:
+        """Return files that appeared or changed size/mtime since the last call."""
+        if self._first:
+            self._first = False
+        else:
+            time.sleep(self.interval)
+        changed: List[FileRecord] = []
+        seen = set()
+        for record in discover_files(self.root, suffixes=self.suffixes):
+            seen.add(record.path)
+            signature = (record.size, record.mtime_ns)
+            if self._known.get(record.path) != signature:
+                self._known[record.path] = signature
+                changed.append(record)
+        for path in self._known.keys() - seen:
+            del self._known[path]
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Finds new or modified files from inotify events instead of re-walking the tree
+
+    Every directory gets a watch; directories created later are watched and
+    scanned as they appear, since files may land before the watch is added.
+    """
+
+    def __init__(self, root: Path, suffixes: Optional[Tuple[str, ...]], interval: float):
+        self.root = root
+        self.suffixes = suffixes
+        self.interval = interval
+        self._inotify = INotify()
+        self._mask = flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO
+        self._watches: Dict[int, Path] = {}
+        self._first = True
+
+    def _watch_tree(self, directory: Path) -> List[FileRecord]:
+        records: List[FileRecord] = []
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [name for name in dirnames if not is_ignored_name(name)]
+            try:
+                self._watches[self._inotify.add_watch(dirpath, self._mask)] = Path(dirpath)
+            except OSError:
+                continue
+            for name in filenames:
+                if is_ignored_name(name) or (self.suffixes and not name.endswith(self.suffixes)):
+                    continue
+                record = _stat_record(Path(dirpath) / name)
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def changes(self) -> List[FileRecord]:
+        """Return files created, written or moved in since the last call."""
+        if self._first:
+            self._first = False
+            return self._watch_tree(self.root)
+        changed: Dict[Path, FileRecord] = {}
+        for event in self._inotify.read(timeout=int(self.interval * 1000)):
+            parent = self._watches.get(event.wd)
+            if parent is None or not event.name or is_ignored_name(event.name):
+                continue
+            path = parent / event.name
+            if event.mask & flags.ISDIR:
+                for record in self._watch_tree(path):
+                    changed[record.path] = record
+                continue
+            if self.suffixes and not event.name.endswith(self.suffixes):
+                continue
+            record = _stat_record(path)
+            if record is not None:
+                changed[path] = record
+        return list(changed.values())
+
+    def close(self) -> None:
+        self._inotify.close()
+
+
+class SettleTracker:
+    """Holds changed files per directory until the directory stops changing
+
+    A router writes one series per directory, so a directory without new or
+    growing files for ``settle_seconds`` is treated as a complete series.
+    """
+
+    def __init__(self, settle_seconds: float):
+        self.settle_seconds = settle_seconds
+        self._pending: Dict[Path, Dict[Path, FileRecord]] = {}
+        self._last_change: Dict[Path, float] = {}
+
+    def add(self, records: List[FileRecord], now: float) -> None:
+        for record in records:
+            directory = record.path.parent
+            self._pending.setdefault(directory, {})[record.path] = record
+            self._last_change[directory] = now
+
+    def pop_settled(self, now: float) -> List[FileRecord]:
+        """Remove and return the files of every directory that has settled."""
+        settled: List[FileRecord] = []
+        for directory, changed_at in list(self._last_change.items()):
+            if now - changed_at >= self.settle_seconds:
+                settled.extend(self._pending.pop(directory).values())
+                del self._last_change[directory]
+        return settled
+
+    def pending_files(self) -> int:
+        return sum(len(records) for records in self._pending.values())
+
+
+def _keep_dicom(records: List[FileRecord], sniff: bool) -> List[FileRecord]:
+    """Same selection as ``discover_dicom_files``: ``*.dcm`` plus sniffed files with ``sniff``."""
+    if not sniff:
+        return records
+    named = [record for record in records if record.path.name.endswith(DICOM_SUFFIXES)]
+    others = [record for record in records if not record.path.name.endswith(DICOM_SUFFIXES)]
+    return named + sniff_dicom_files(others)
+
+
+def watch_directory(
+    dicom_dir: str,
+    db_path: str,
+    max_workers: Optional[int] = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+    sniff: bool = False,
+    memory_limit_mb: Optional[float] = None,
+    read_options: Optional[ReadOptions] = None,
+    verbose: bool = False,
+    max_cycles: Optional[int] = None,
+) -> None:
+    """Ingest files dropped into ``dicom_dir`` until interrupted.
+
+    The tree is polled every ``poll_interval`` seconds (or watched with
+    inotify when ``inotify_simple`` is installed). Changed files are held
+    per directory until nothing in it changed for ``settle_seconds``, then
+    ingested through a worker pool and database connection that stay open
+    for the whole run. Files already in the ingest manifest with unchanged
+    stat data are skipped, so restarting the watcher does not re-read the
+    existing tree. Non-representative series of the studies each ingest
+    touched are pruned after it, followed by the maintenance tasks that
+    are due (never a full VACUUM once the databank uses incremental
+    auto-vacuum). Maintenance that finds the databank locked (e.g. by the
+    Web UI) is postponed to a later cycle.
+
+    Args:
+        dicom_dir: Drop folder to watch
+        db_path: Path to SQLite database file
+        max_workers: Size of the warm extraction pool (defaults to CPU count)
+        poll_interval: Seconds between polls (or inotify read timeout)
+        settle_seconds: Quiet time after which a directory is ingested
+        sniff: If True, also detect DICOM files without a .dcm extension by their content
+        memory_limit_mb: Approximate ceiling for extraction results held in memory
+        read_options: Deferred-read settings bounding how much of each header is read
+        verbose: Print detailed processing output
+        max_cycles: Stop after this many polls (for scripted runs)
+    """
+    root = Path(dicom_dir)
+
+    def _vprint(message: str = "") -> None:
+        if verbose:
+            print(message)
+
+    if not root.is_dir():
+        print(f"Error: {dicom_dir} is not a directory")
+        return
+
+    db_path = resolve_db_path(db_path)
+    if sniff:
+        read_options = (read_options or ReadOptions())._replace(raw_datasets=True)
+    conn = init_database(db_path, check_same_thread=False)
+    workers = max_workers or os.cpu_count() or 4
+    suffixes = None if sniff else DICOM_SUFFIXES
+    watcher_cls = InotifyWatcher if INOTIFY_AVAILABLE else PollingWatcher
+    watcher = watcher_cls(root, suffixes, poll_interval)
+    tracker = SettleTracker(settle_seconds)
+
+    print(f"Watching: {root}")
+    _vprint(f"   👀 {'inotify' if INOTIFY_AVAILABLE else f'polling every {poll_interval:g}s'}, "
+            f"settle time {settle_seconds:g}s, {workers} warm worker(s)")
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # Start the worker processes now so the first ingest does not pay for it
+    for _ in executor.map(abs, range(workers)):
+        pass
+
+    cycles = 0
+    total_processed = 0
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            cycles += 1
+            changed = watcher.changes()
+            now = time.monotonic()
+            if changed:
+                tracker.add(changed, now)
+            settled = _keep_dicom(tracker.pop_settled(now), sniff)
+            if not settled:
+                continue
+
+            t_ingest = time.perf_counter()
+            changes_before = conn.total_changes
+            touched_studies: Set[str] = set()
+            processed, skipped_dup, skipped_inv, new_studies, _ = process_single_scan(
+                root,
+                conn,
+                root,
+                max_workers=workers,
+                records=settled,
+                memory_limit_mb=memory_limit_mb,
+                read_options=read_options,
+                skip_unchanged=True,
+                executor=executor,
+                touched_studies=touched_studies,
+            )
+            pruned = prune_and_maintain(conn, _vprint, touched_studies, changes_before=changes_before)
+            total_processed += processed
+            elapsed = time.perf_counter() - t_ingest
+
+            status_parts = [f"Added {processed} file(s)"]
+            if new_studies:
+                status_parts.append(f"{len(new_studies)} new study/studies")
+            if skipped_dup:
+                status_parts.append(f"skipped {skipped_dup} duplicate/unchanged")
+            if skipped_inv:
+                status_parts.append(f"skipped {skipped_inv} invalid")
+            if pruned:
+                status_parts.append(f"pruned {pruned} series")
+            _vprint(f"   ✓ {len(settled)} settled file(s) in {elapsed:.2f}s: {' | '.join(status_parts)}"
+                    f" ({tracker.pending_files()} still settling)")
+    except KeyboardInterrupt:
+        _vprint("\n   ⏹️  Stopping watcher")
+    finally:
+        watcher.close()
+        executor.shutdown()
+        conn.close()
+
+    print(f"Watch ended: {total_processed} file(s) added to {db_path}")
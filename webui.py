@@ -9,16 +9,19 @@ import math
 from pathlib import Path
 import os
 import tempfile
-import zipfile
 import shutil
 import csv
 import io
 import re
 import xml.etree.ElementTree as ET
 from difflib import SequenceMatcher
+from functools import lru_cache
 from typing import Optional, List, Tuple, Dict
+from archive_members import ArchiveError, archive_kind
+from extract_metadata import decode_csa_blob
 from process_dicom import process_directory
-from store_metadata import init_database
+from maintain_db import DEFAULT_MAINTENANCE_INTERVAL, MaintenanceScheduler
+from store_metadata import forget_pruned_series, forget_study_manifest, init_database, record_changes
 from translations import get_translation
 
 app = Flask(__name__)
@@ -234,6 +237,29 @@ EXPORT_NUMERIC_FORMATS = {
 }
 
 
+@lru_cache(maxsize=512)
+def _decode_csa_blob_cached(blob: bytes) -> Optional[str]:
+    return decode_csa_blob(blob)
+
+
+def fill_csa_json(row: dict) -> dict:
+    """Decode ``--raw-csa`` blobs into the ``csa_*_header_json`` fields of a row.
+
+    Rows ingested without ``--raw-csa`` already carry the JSON text and are
+    left untouched. The raw columns are always dropped so BLOBs never reach
+    templates or JSON responses.
+    """
+    for kind in ("image", "series"):
+        blob = row.pop(f"csa_{kind}_header_raw", None)
+        json_key = f"csa_{kind}_header_json"
+        if blob and not row.get(json_key):
+            try:
+                row[json_key] = _decode_csa_blob_cached(bytes(blob))
+            except Exception:
+                row[json_key] = None
+    return row
+
+
 def ensure_databank_dir() -> None:
     DATABANK_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -1291,7 +1317,9 @@ def study_detail(study_uid):
                 MAX(csa_image_header_json) as csa_image_header_json,
                 MAX(csa_series_header_json) as csa_series_header_json,
                 MAX(csa_image_header_hash) as csa_image_header_hash,
-                MAX(csa_series_header_hash) as csa_series_header_hash
+                MAX(csa_series_header_hash) as csa_series_header_hash,
+                MAX(csa_image_header_raw) as csa_image_header_raw,
+                MAX(csa_series_header_raw) as csa_series_header_raw
             FROM dicom_metadata
             WHERE study_instance_uid = ?
             GROUP BY study_instance_uid
@@ -1302,7 +1330,7 @@ def study_detail(study_uid):
             conn.close()
             return f"Study not found: {study_uid}", 404
         
-        study_info = dict(study_info)
+        study_info = fill_csa_json(dict(study_info))
         
         # Get representative series for this study (one per modality).
         cursor = conn.execute("""
@@ -1363,6 +1391,8 @@ def study_detail(study_uid):
                 csa_series_header_json,
                 csa_image_header_hash,
                 csa_series_header_hash,
+                csa_image_header_raw,
+                csa_series_header_raw,
                 private_payload_fingerprint,
                 image_orientation_patient,
                 slice_location,
@@ -1374,7 +1404,7 @@ def study_detail(study_uid):
             WHERE rn = 1
             ORDER BY series_number ASC, series_time ASC
         """, (study_uid,))
-        series = [dict(row) for row in cursor.fetchall()]
+        series = [fill_csa_json(dict(row)) for row in cursor.fetchall()]
         export_modalities = sorted({
             s.get('modality') for s in series if s.get('modality')
         })
@@ -1757,12 +1787,16 @@ def delete_study(study_uid):
             conn.close()
             return f"Study not found: {study_uid}", 404
         
-        # Delete all series in this study
+        # Delete all series in this study (and their manifest and pruned-series entries,
+        # so a re-ingest restores them)
+        forget_study_manifest(conn, study_uid)
+        forget_pruned_series(conn, study_uid)
         cursor = conn.execute(
             "DELETE FROM dicom_metadata WHERE study_instance_uid = ?",
             (study_uid,)
         )
         deleted_count = cursor.rowcount
+        record_changes(conn, deleted_count, commit=False)
         conn.commit()
         conn.close()
         
@@ -1776,7 +1810,7 @@ def delete_study(study_uid):
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle ZIP/7Z file upload and process DICOM files"""
+    """Handle ZIP/7Z/TAR file upload and process DICOM files"""
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No file provided'}), 400
@@ -1790,10 +1824,10 @@ def upload_file():
         
         # Check file extension
         filename = file.filename.lower()
-        if not (filename.endswith('.zip') or filename.endswith('.7z')):
-            return jsonify({'success': False, 'message': 'Only ZIP and 7Z files are supported'}), 400
+        if not archive_kind(Path(filename)):
+            return jsonify({'success': False, 'message': 'Only ZIP, 7Z and TAR files are supported'}), 400
         
-        # Create temporary directory for extraction
+        # Create temporary directory for the upload
         temp_dir = tempfile.mkdtemp(prefix='dicom_upload_')
         
         try:
@@ -1801,42 +1835,16 @@ def upload_file():
             uploaded_path = os.path.join(temp_dir, file.filename)
             file.save(uploaded_path)
             
-            # Extract archive
-            extract_dir = os.path.join(temp_dir, 'extracted')
-            os.makedirs(extract_dir, exist_ok=True)
-            
-            if filename.endswith('.zip'):
-                # Extract ZIP file
-                with zipfile.ZipFile(uploaded_path, 'r') as zip_ref:
-                    zip_ref.extractall(extract_dir)
-            elif filename.endswith('.7z'):
-                # Extract 7Z file - try py7zr first, fallback to system 7z command
-                try:
-                    import py7zr
-                    with py7zr.SevenZipFile(uploaded_path, mode='r') as archive:
-                        archive.extractall(extract_dir)
-                except ImportError:
-                    # Fallback to system 7z command if py7zr not available
-                    import subprocess
-                    result = subprocess.run(
-                        ['7z', 'x', uploaded_path, '-o' + extract_dir, '-y'],
-                        capture_output=True,
-                        text=True
-                    )
-                    if result.returncode != 0:
-                        return jsonify({
-                            'success': False, 
-                            'message': f'Failed to extract 7Z file. Install py7zr (pip install py7zr) or system 7z command.'
-                        }), 400
-            
-            # Process extracted DICOM files using existing process_directory function
-            # This will handle all the processing, deduplication, and counting
+            # process_directory reads ZIP/TAR members in place (7Z is extracted there)
+            # and handles all the processing, deduplication, and counting
             try:
                 process_directory(
-                    extract_dir,
+                    uploaded_path,
                     db_path=db_path,
                     process_subdirs=True,
                     auto_workers=True,
+                    # The background maintenance scheduler takes care of it
+                    maintenance=False,
                 )
                 
                 # Get summary from database - count new files added
@@ -1850,6 +1858,11 @@ def upload_file():
                     'message': f'Archive processed successfully. Check the studies list below.'
                 })
                 
+            except ArchiveError as e:
+                return jsonify({
+                    'success': False,
+                    'message': f'Could not read archive: {str(e)}'
+                }), 400
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -2631,7 +2644,7 @@ def series_detail(series_uid):
         if not row:
             return jsonify({"error": "Series not found"}), 404
         
-        return jsonify(dict(row))
+        return jsonify(fill_csa_json(dict(row)))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -2911,4 +2924,8 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     print(f"Starting DICOM Metadata Browser on http://127.0.0.1:{port}")
     print(f"Using database: {DEFAULT_DB}")
+    MaintenanceScheduler(
+        DATABANK_DIR,
+        interval=float(os.environ.get('MAINTENANCE_INTERVAL', DEFAULT_MAINTENANCE_INTERVAL)),
+    ).start()
     app.run(debug=False, host='127.0.0.1', port=port)